@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark for the computations on the cluster state of large Solr clouds.
+
+Generates synthetic CLUSTERSTATUS documents from 10 to 50,000 replicas and measures the throughput in replicas per
+second and the peak memory allocated by parsing the document and by every scan over the cluster state the deployment
+controller performs. Results are compared with a baseline file and the benchmark fails if the throughput of any code
+path dropped by more than the given tolerance.
+
+    $ python3 benchmarks/cluster_state.py
+    $ python3 benchmarks/cluster_state.py --sizes 10 1000 --tolerance 0.3
+    $ python3 benchmarks/cluster_state.py --update-baseline
+"""
+
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+from argparse import ArgumentParser
+from collections import OrderedDict
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from solrcloud_cli.controllers.cluster_deployment_controller import ClusterDeploymentController  # noqa: E402
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 50000]
+DEFAULT_BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cluster_state_baseline.json')
+DEFAULT_TOLERANCE = 0.5
+DEFAULT_MIN_TIME = 0.2
+
+SHARDS_PER_COLLECTION = 8
+REPLICATION_FACTOR = 3
+NUMBER_OF_NODES = SHARDS_PER_COLLECTION * REPLICATION_FACTOR
+
+
+def get_node_ips(prefix: str):
+    return list(map(lambda x: '{}.{}.{}'.format(prefix, x // 256, x % 256), range(NUMBER_OF_NODES)))
+
+
+OLD_NODES = get_node_ips('10.0')
+NEW_NODES = get_node_ips('10.1')
+
+
+def generate_cluster_state(number_of_replicas: int):
+    """
+    Cluster of collections with 8 shards and 3 replicas per shard on the old nodes, every replica but the first of a
+    shard is a follower. The last collection is truncated to get the exact number of replicas.
+    """
+    replicas_per_collection = SHARDS_PER_COLLECTION * REPLICATION_FACTOR
+    collections = OrderedDict()
+    for collection in range(int(math.ceil(number_of_replicas / replicas_per_collection))):
+        shards = OrderedDict()
+        remaining_replicas = number_of_replicas - collection * replicas_per_collection
+        for shard in range(int(math.ceil(min(remaining_replicas, replicas_per_collection) / REPLICATION_FACTOR))):
+            replicas = OrderedDict()
+            for replica in range(min(REPLICATION_FACTOR, remaining_replicas - shard * REPLICATION_FACTOR)):
+                replicas['core_node{}'.format(shard * REPLICATION_FACTOR + replica + 1)] = {
+                    'core': 'collection{}_shard{}_replica{}'.format(collection + 1, shard + 1, replica + 1),
+                    'base_url': 'http://{}:8983/solr'.format(OLD_NODES[shard * REPLICATION_FACTOR + replica]),
+                    'node_name': OLD_NODES[shard * REPLICATION_FACTOR + replica] + ':8983_solr',
+                    'state': 'active',
+                    'leader': 'true' if replica == 0 else 'false'
+                }
+            shards['shard{}'.format(shard + 1)] = {'range': None, 'state': 'active', 'replicas': replicas}
+        collections['collection{}'.format(collection + 1)] = {
+            'replicationFactor': str(REPLICATION_FACTOR),
+            'shards': shards,
+            'router': {'name': 'compositeId'},
+            'maxShardsPerNode': '1',
+            'autoAddReplicas': 'false',
+            'znodeVersion': 1,
+            'configName': 'default'
+        }
+    return {
+        'responseHeader': {'status': 0, 'QTime': 1},
+        'cluster': {'collections': collections, 'live_nodes': list(map(lambda x: x + ':8983_solr', OLD_NODES))}
+    }
+
+
+def check_all_shards(cluster_state: dict, check):
+    for collection_name, collection_values in cluster_state['cluster']['collections'].items():
+        for shard_name in collection_values['shards'].keys():
+            check(cluster_state, collection_name, shard_name)
+
+
+def get_code_paths(document: str, cluster_state: dict):
+    layout = ClusterDeploymentController.get_cluster_layout(cluster_state)
+    return OrderedDict([
+        ('json_parse', lambda: json.loads(document)),
+        ('has_active_leader', lambda: check_all_shards(cluster_state, ClusterDeploymentController.has_active_leader)),
+        ('get_number_of_active_nodes',
+         lambda: check_all_shards(cluster_state, ClusterDeploymentController.get_number_of_active_nodes)),
+        ('get_missing_replicas', lambda: ClusterDeploymentController.get_missing_replicas(cluster_state, layout,
+                                                                                          NEW_NODES)),
+        ('are_all_replicas_active', lambda: ClusterDeploymentController.are_all_replicas_active(cluster_state)),
+        ('get_replicas_on_nodes', lambda: ClusterDeploymentController.get_replicas_on_nodes(cluster_state, OLD_NODES))
+    ])
+
+
+def measure_time(code_path, min_time: float):
+    """
+    Best time of one execution, repeating the code path until it ran for at least the minimum time.
+    """
+    best_time = float('inf')
+    total_time = 0
+    while total_time < min_time:
+        start = time.perf_counter()
+        code_path()
+        duration = time.perf_counter() - start
+        best_time = min(best_time, duration)
+        total_time += duration
+    return best_time
+
+
+def measure_allocations(code_path):
+    tracemalloc.start()
+    try:
+        code_path()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def run(sizes: list, min_time: float):
+    results = OrderedDict()
+    for size in sizes:
+        cluster_state = generate_cluster_state(size)
+        document = json.dumps(cluster_state)
+        for name, code_path in get_code_paths(document, cluster_state).items():
+            duration = measure_time(code_path, min_time)
+            results['{}/{}'.format(name, size)] = {
+                'replicas_per_second': round(size / duration),
+                'allocated_bytes': measure_allocations(code_path)
+            }
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    regressions = list()
+    for key, result in results.items():
+        expected = baseline.get(key, dict()).get('replicas_per_second')
+        if expected and result['replicas_per_second'] < expected * (1 - tolerance):
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description='Cluster state benchmark for SolrCloud CLI')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Numbers of replicas')
+    parser.add_argument('--min-time', type=float, default=DEFAULT_MIN_TIME,
+                        help='Minimum time in seconds every code path is repeated for')
+    parser.add_argument('--baseline-file', default=DEFAULT_BASELINE_FILE, help='Path to the baseline file')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Tolerated relative drop of the throughput compared to the baseline')
+    parser.add_argument('--update-baseline', action='store_true', help='Write the results to the baseline file')
+    args = parser.parse_args()
+
+    baseline = dict()
+    if os.path.exists(args.baseline_file):
+        with open(args.baseline_file, 'r') as fd:
+            baseline = json.load(fd)
+
+    results = run(args.sizes, args.min_time)
+    print('{:<40} {:>16} {:>16} {:>16}'.format('Code path/replicas', 'replicas/s', 'baseline', 'allocated bytes'))
+    for key, result in results.items():
+        print('{:<40} {:>16} {:>16} {:>16}'.format(key, result['replicas_per_second'],
+                                                   baseline.get(key, dict()).get('replicas_per_second', '-'),
+                                                   result['allocated_bytes']))
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline_file, 'w') as fd:
+            json.dump(baseline, fd, indent=2, sort_keys=True)
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print('Throughput dropped by more than {:.0%} for: {}'.format(args.tolerance, ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
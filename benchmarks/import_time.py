@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark for the startup time of the SolrCloud CLI.
+
+Measures how long importing solrcloud_cli.cli takes in a fresh interpreter, after subtracting the startup time of the
+interpreter itself, and fails if the median exceeds the given limit.
+
+    $ python3 benchmarks/import_time.py --repeat 20 --max-ms 100
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from argparse import ArgumentParser
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_REPEAT = 20
+DEFAULT_MAX_MS = 100
+
+
+def measure(statement: str, repeat: int):
+    durations = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.Popen([sys.executable, '-c', statement], cwd=ROOT_DIR).communicate()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+
+def main():
+    parser = ArgumentParser(description='Import time benchmark for SolrCloud CLI')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Number of measurements')
+    parser.add_argument('--max-ms', type=float, default=DEFAULT_MAX_MS,
+                        help='Maximum median import time in milliseconds')
+    args = parser.parse_args()
+
+    interpreter_ms = measure('pass', args.repeat)
+    import_ms = measure('import solrcloud_cli.cli', args.repeat) - interpreter_ms
+    print('Median import time of solrcloud_cli.cli: {:.1f}ms (limit: {:.1f}ms)'.format(import_ms, args.max_ms))
+    if import_ms > args.max_ms:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
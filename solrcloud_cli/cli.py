@@ -1,99 +1,471 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import importlib
+import logging
 import os.path
 import sys
-import yaml
 
-from solrcloud_cli.controllers.cluster_bootstrap_controller import ClusterBootstrapController
-from solrcloud_cli.controllers.cluster_delete_controller import ClusterDeleteController
-from solrcloud_cli.controllers.cluster_deployment_controller import ClusterDeploymentController
-from solrcloud_cli.services.senza_wrapper import SenzaWrapper
+from collections import namedtuple, OrderedDict
 
 from argparse import ArgumentParser
 
 DEFAULT_CONF_FILE = 'example.yaml'
+DEFAULT_JOURNAL_DIR = '~/.solrcloud-cli/journal'
+
+# Controllers are only imported when one of their commands is executed to keep the startup time of the CLI low
+BOOTSTRAP_CONTROLLER = ('solrcloud_cli.controllers.cluster_bootstrap_controller', 'ClusterBootstrapController')
+DEPLOYMENT_CONTROLLER = ('solrcloud_cli.controllers.cluster_deployment_controller', 'ClusterDeploymentController')
+DELETE_CONTROLLER = ('solrcloud_cli.controllers.cluster_delete_controller', 'ClusterDeleteController')
+
+Command = namedtuple('Command', ['controller', 'method', 'options'])
+
+# Optional services shared by the controllers and senza wrappers of all stacks of one run
+Instrumentation = namedtuple('Instrumentation', ['interaction_log', 'metrics', 'progress_reporter', 'tracer'])
+
+# Constructor arguments of the controllers that are taken from the command line in addition to the settings
+BOOTSTRAP_OPTIONS = ['sharding_level', 'replication_factor', 'image_version']
+DEPLOYMENT_OPTIONS = ['image_version']
+DELETE_OPTIONS = []
+
+COMMANDS = OrderedDict([
+    ('bootstrap', Command(BOOTSTRAP_CONTROLLER, 'bootstrap_cluster', BOOTSTRAP_OPTIONS)),
+    ('deploy', Command(DEPLOYMENT_CONTROLLER, 'deploy_new_version', DEPLOYMENT_OPTIONS)),
+    ('delete', Command(DELETE_CONTROLLER, 'delete_cluster', DELETE_OPTIONS)),
+    ('create-new-cluster', Command(DEPLOYMENT_CONTROLLER, 'create_cluster', DEPLOYMENT_OPTIONS)),
+    ('delete-old-cluster', Command(DEPLOYMENT_CONTROLLER, 'delete_cluster', DEPLOYMENT_OPTIONS)),
+    ('add-new-nodes', Command(DEPLOYMENT_CONTROLLER, 'add_new_nodes_to_cluster', DEPLOYMENT_OPTIONS)),
+    ('delete-old-nodes', Command(DEPLOYMENT_CONTROLLER, 'delete_old_nodes_from_cluster', DEPLOYMENT_OPTIONS)),
+    ('warm-up', Command(DEPLOYMENT_CONTROLLER, 'warm_up_new_nodes', DEPLOYMENT_OPTIONS)),
+    ('benchmark', Command(DEPLOYMENT_CONTROLLER, 'benchmark_new_nodes', DEPLOYMENT_OPTIONS)),
+    ('switch', Command(DEPLOYMENT_CONTROLLER, 'switch_traffic', DEPLOYMENT_OPTIONS)),
+    ('reap', Command(DEPLOYMENT_CONTROLLER, 'reap_deleted_clusters', DEPLOYMENT_OPTIONS)),
+    ('plan', Command(DEPLOYMENT_CONTROLLER, 'plan_migration', DEPLOYMENT_OPTIONS)),
+    ('apply', Command(DEPLOYMENT_CONTROLLER, 'apply_migration', DEPLOYMENT_OPTIONS)),
+])
+
+# Settings that are only used by the CLI and are not passed to senza
+ACCOUNT_SETTING = 'Account'
+CLI_SETTINGS = [ACCOUNT_SETTING]
+DEFAULT_ACCOUNT = 'default'
 
 
 def build_args_parser():
     parser = ArgumentParser(description='SolrCloud CLI')
-    parser.add_argument('command', help='Available commands: bootstrap, deploy, delete, create-new-cluster, '
-                                        'delete-old-cluster, add-new-nodes, delete-old-nodes, switch')
+    parser.add_argument('command', help='Available commands: ' + ', '.join(COMMANDS.keys()))
     parser.add_argument('-i', '--image-version', help='Docker image version of Solr cloud instances')
     parser.add_argument('-s', '--sharding-level', default=1, help='Number of shards per collection')
     parser.add_argument('-r', '--replication-level', default=3, help='Number of replications per shard')
     parser.add_argument('-c', '--senza-configuration', default='solrcloud-appliance.yaml',
                         help='Senza configuration file for Solr cluster on AWS with STUPS')
     parser.add_argument('-t', '--token', help='OAuth token for connecting to the Solr cloud API')
-    parser.add_argument('-f', '--config-file', help='Path to config file. (default: %s)' % DEFAULT_CONF_FILE,
-                        dest='config')
-    parser.add_argument('--region', help='AWS region in which SolrCloud should be installed')
+    parser.add_argument('-f', '--config-file', action='append', dest='config',
+                        help='Path to config file, can be given multiple times to run the command for a fleet of '
+                             'stacks concurrently (default: %s)' % DEFAULT_CONF_FILE)
+    parser.add_argument('--region', action='append',
+                        help='AWS region in which SolrCloud should be installed, can be given multiple times to run '
+                             'the command in all regions concurrently')
+    parser.add_argument('--no-wait-for-deletion', action='store_true', dest='no_wait_for_deletion',
+                        help='Do not wait for deleted stack versions to be gone, verify later with reap command')
+    parser.add_argument('--max-concurrency', type=int, dest='max_concurrency',
+                        help='Maximum number of stacks and regions the command runs for concurrently')
+    parser.add_argument('--max-concurrency-per-account', type=int, dest='max_concurrency_per_account',
+                        help='Maximum number of stacks the command runs for concurrently in the same account')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume a failed deployment, skipping all phases and replicas that have been completed')
+    parser.add_argument('--journal-file', dest='journal_file',
+                        help='Path to the deployment journal, only for a single stack and region '
+                             '(default: %s/<ApplicationId>[-<region>].json)' % DEFAULT_JOURNAL_DIR)
+    parser.add_argument('--plan-file', dest='plan_file',
+                        help='Path to the migration plan written by the plan and executed by the apply command')
+    parser.add_argument('--migration-concurrency', type=int, dest='migration_concurrency',
+                        help='Maximum number of migration plan operations executed in parallel')
+    parser.add_argument('--migration-strategy', choices=['replica', 'node'], dest='migration_strategy',
+                        help='Move replicas to new nodes one by one with ADDREPLICA and DELETEREPLICA (replica, '
+                             'default) or all replicas of a node at once with REPLACENODE (node, Solr 7 and later)')
+    parser.add_argument('--delete-nodes-in-bulk', action='store_true', dest='delete_nodes_in_bulk',
+                        help='Delete all replicas of an old node with one DELETENODE request if every shard has enough '
+                             'active replicas on the new nodes')
+    parser.add_argument('--wait-for-final-state', action='store_true', dest='wait_for_final_state',
+                        help='Create collections and add replicas asynchronously and let Solr report when they are '
+                             'active instead of polling the cluster state')
+    parser.add_argument('--overseer-queue-target', type=int, dest='overseer_queue_target',
+                        help='Delay Collections API operations while the overseer queues hold more than this number '
+                             'of tasks')
+    parser.add_argument('--adaptive-concurrency', action='store_true', dest='adaptive_concurrency',
+                        help='Adapt the number of Collections API operations in flight between one and the migration '
+                             'concurrency to errors and latency of Solr')
+    parser.add_argument('--concurrency-latency-threshold', type=float, dest='concurrency_latency_threshold',
+                        help='Seconds from submission to completion after which a Collections API operation lowers the '
+                             'adaptive concurrency')
+    parser.add_argument('--circuit-breaker', action='store_true', dest='circuit_breaker',
+                        help='Stop sending requests to a Solr endpoint that keeps failing and share one retry budget '
+                             'among all stacks and regions using the endpoint')
+    parser.add_argument('--circuit-breaker-threshold', type=int, dest='circuit_breaker_threshold',
+                        help='Number of consecutive failed requests after which the circuit breaker opens')
+    parser.add_argument('--circuit-breaker-reset-timeout', type=int, dest='circuit_breaker_reset_timeout',
+                        help='Seconds after which an open circuit breaker lets a probe request through')
+    parser.add_argument('--circuit-breaker-wait', action='store_true', dest='circuit_breaker_wait',
+                        help='Wait for the probe request of an open circuit breaker instead of failing fast')
+    parser.add_argument('--retry-budget', type=int, dest='retry_budget',
+                        help='Number of retries of failed operations shared by all stacks and regions using a Solr '
+                             'endpoint')
+    parser.add_argument('--traffic-ramp', type=get_traffic_weights, dest='traffic_ramp',
+                        help='Comma separated traffic weights to switch traffic in steps, e.g. 10,25,50,100')
+    parser.add_argument('--ramp-step-wait', type=int, dest='ramp_step_wait',
+                        help='Seconds to wait after each traffic step before sampling query metrics of the new nodes')
+    parser.add_argument('--ramp-max-p99-latency', type=float, dest='ramp_max_p99_latency',
+                        help='Maximum p99 query latency in milliseconds of the new nodes during the traffic ramp')
+    parser.add_argument('--ramp-max-error-rate', type=float, dest='ramp_max_error_rate',
+                        help='Maximum share of failed queries of the new nodes during the traffic ramp')
+    parser.add_argument('--monitor-recovery', action='store_true', dest='monitor_recovery',
+                        help='Report index replication progress of recovering replicas while adding new nodes')
+    parser.add_argument('--recovery-stall-timeout', type=int, dest='recovery_stall_timeout',
+                        help='Seconds after which a recovering replica without replication progress fails the '
+                             'deployment, requires --monitor-recovery')
+    parser.add_argument('--replication-max-rate', type=float, dest='replication_max_rate',
+                        help='Maximum replication rate in MB/s of each core while new replicas are recovering')
+    parser.add_argument('--warm-up-queries', dest='warm_up_query_file',
+                        help='File with queries sent to the replicas on the new nodes before traffic is switched')
+    parser.add_argument('--warm-up-concurrency', type=int, dest='warm_up_concurrency',
+                        help='Number of warm-up queries sent in parallel')
+    parser.add_argument('--warm-up-time', type=int, dest='warm_up_time',
+                        help='Seconds to repeat the warm-up queries, by default every query is sent once')
+    parser.add_argument('--benchmark-queries', dest='benchmark_query_file',
+                        help='File with queries to compare the latency of old and new nodes before traffic is switched')
+    parser.add_argument('--benchmark-concurrency', type=int, dest='benchmark_concurrency',
+                        help='Number of benchmark queries sent in parallel')
+    parser.add_argument('--benchmark-time', type=int, dest='benchmark_time',
+                        help='Seconds to send benchmark queries to the old and to the new nodes each')
+    parser.add_argument('--benchmark-tolerance', type=float, dest='benchmark_tolerance',
+                        help='Share by which the new nodes may be slower than the old nodes, e.g. 0.2 for 20%%')
+    parser.add_argument('--record', dest='record_file',
+                        help='Record all requests to Solr and senza commands with their latencies to a log file')
+    parser.add_argument('--replay', dest='replay_file',
+                        help='Answer all requests to Solr and senza commands from a log written with --record')
+    parser.add_argument('--replay-speed', type=float, default=0, dest='replay_speed',
+                        help='Replay recorded latencies and waits between polls in real time (1), compressed (>1) or '
+                             'not at all (0, default)')
+    parser.add_argument('--metrics-file', dest='metrics_file',
+                        help='Write durations of phases, requests and senza commands as JSON at the end of the run')
+    parser.add_argument('--metrics-textfile', dest='metrics_textfile',
+                        help='Write the metrics in Prometheus text format for the textfile collector of node_exporter')
+    parser.add_argument('--progress-file', dest='progress_file',
+                        help='Append progress events of long running phases as JSON lines to a file')
+    parser.add_argument('--progress-fd', type=int, dest='progress_fd',
+                        help='Write progress events of long running phases as JSON lines to an open file descriptor')
+    parser.add_argument('--trace-file', dest='trace_file',
+                        help='Write spans of all phases, Solr requests and senza commands in the Trace Event Format')
     return parser
 
 
+def get_traffic_weights(value: str):
+    return list(map(int, filter(None, value.split(','))))
+
+
 def solrcloud_cli(cli_args):
     parser = build_args_parser()
     args = parser.parse_args(cli_args)
 
     if not args.config:
-        args.config = os.path.expanduser(DEFAULT_CONF_FILE)
+        args.config = [os.path.expanduser(DEFAULT_CONF_FILE)]
+
+    for config in args.config:
+        if not os.path.exists(config):
+            print('Configuration file does not exist:', config)
+            parser.print_usage()
+            return
 
-    if not os.path.exists(args.config):
-        print('Configuration file does not exist:', args.config)
+    if args.command not in COMMANDS:
+        print('Unknown command:', args.command)
         parser.print_usage()
         return
 
-    with open(args.config, 'rb') as fd:
-        settings = yaml.load(fd)
+    if args.benchmark_query_file and args.migration_strategy == 'node':
+        print('Benchmark queries can not be combined with node migration, which removes all replicas from the old '
+              'nodes before the benchmark')
+        parser.print_usage()
+        return
 
-    senza_wrapper = SenzaWrapper(args.senza_configuration)
-    if args.region:
-        senza_wrapper.set_region(args.region)
-
-    for key, value in settings.items():
-        senza_wrapper.add_parameter(key, value)
-
-    if args.command in ['bootstrap']:
-        controller = ClusterBootstrapController(base_url=settings['SolrBaseUrl'],
-                                                stack_name=settings['ApplicationId'],
-                                                sharding_level=args.sharding_level,
-                                                replication_factor=args.replication_level,
-                                                image_version=args.image_version,
-                                                oauth_token=args.token,
-                                                senza_wrapper=senza_wrapper)
-    elif args.command in ['deploy', 'create-new-cluster', 'delete-old-cluster', 'add-new-nodes', 'delete-old-nodes',
-                          'switch']:
-        controller = ClusterDeploymentController(base_url=settings['SolrBaseUrl'],
-                                                 stack_name=settings['ApplicationId'],
-                                                 image_version=args.image_version,
-                                                 oauth_token=args.token,
-                                                 senza_wrapper=senza_wrapper)
-    elif args.command in ['delete']:
-        controller = ClusterDeleteController(base_url=settings['SolrBaseUrl'],
-                                             stack_name=settings['ApplicationId'],
-                                             oauth_token=args.token,
-                                             senza_wrapper=senza_wrapper)
-    else:
-        print('Unknown command:', args.command)
+    import yaml
+    fleet = list()
+    for config in OrderedDict.fromkeys(args.config):
+        with open(config, 'rb') as fd:
+            fleet.append(yaml.safe_load(fd))
+
+    regions = list(OrderedDict.fromkeys(args.region or [None]))
+    if args.journal_file and len(fleet) * len(regions) > 1:
+        print('Journal file can only be given for a single stack and region:', args.journal_file)
         parser.print_usage()
         return
 
-    if args.command == 'bootstrap':
-        controller.bootstrap_cluster()
-    elif args.command == 'deploy':
-        controller.deploy_new_version()
-    elif args.command == 'delete':
-        controller.delete_cluster()
-    elif args.command == 'create-new-cluster':
-        controller.create_cluster()
-    elif args.command == 'delete-old-cluster':
-        controller.delete_cluster()
-    elif args.command == 'add-new-nodes':
-        controller.add_new_nodes_to_cluster()
-    elif args.command == 'delete-old-nodes':
-        controller.delete_old_nodes_from_cluster()
-    elif args.command == 'switch':
-        controller.switch_traffic()
+    instrumentation = Instrumentation(interaction_log=get_interaction_log(args), metrics=get_metrics(args),
+                                      progress_reporter=get_progress_reporter(args), tracer=get_tracer(args))
+    from solrcloud_cli.services.connection_pool import ConnectionPool
+    connection_pool = ConnectionPool()
+    try:
+        circuit_breakers = get_circuit_breakers(args, fleet, regions)
+        if len(fleet) == 1 and len(regions) == 1:
+            run_command(args, fleet[0], regions[0], instrumentation, circuit_breakers, connection_pool)
+        elif len(fleet) == 1:
+            jobs = list(map(lambda region: ('Region', region, fleet[0], region), regions))
+            run_commands_concurrently(args, jobs, 'regions', instrumentation, circuit_breakers, connection_pool)
+        else:
+            jobs = list()
+            for settings in fleet:
+                for region in regions:
+                    name = settings['ApplicationId'] + ('@' + region if region else '')
+                    jobs.append(('Stack', name, settings, region))
+            run_commands_concurrently(args, jobs, 'stacks', instrumentation, circuit_breakers, connection_pool)
+    finally:
+        connection_pool.close()
+        close_instrumentation(args, instrumentation)
+
+
+def get_interaction_log(args):
+    if args.replay_file:
+        from solrcloud_cli.services.interaction_log import InteractionReplayer
+        return InteractionReplayer(args.replay_file, args.replay_speed)
+    elif args.record_file:
+        from solrcloud_cli.services.interaction_log import InteractionRecorder
+        return InteractionRecorder(args.record_file)
+    return None
+
+
+def get_metrics(args):
+    if args.metrics_file or args.metrics_textfile:
+        from solrcloud_cli.services.metrics import Metrics
+        return Metrics()
+    return None
+
+
+def get_progress_reporter(args):
+    if args.progress_file:
+        from solrcloud_cli.services.progress_reporter import ProgressReporter
+        return ProgressReporter.open_file(args.progress_file)
+    elif args.progress_fd is not None:
+        from solrcloud_cli.services.progress_reporter import ProgressReporter
+        return ProgressReporter.open_fd(args.progress_fd)
+    return None
+
+
+def get_tracer(args):
+    if args.trace_file:
+        from solrcloud_cli.services.tracer import Tracer
+        return Tracer()
+    return None
+
+
+def close_instrumentation(args, instrumentation: Instrumentation):
+    if instrumentation.interaction_log:
+        instrumentation.interaction_log.close()
+    if args.metrics_file:
+        instrumentation.metrics.save_json(args.metrics_file)
+    if args.metrics_textfile:
+        instrumentation.metrics.save_textfile(args.metrics_textfile)
+    if instrumentation.progress_reporter:
+        instrumentation.progress_reporter.close()
+    if instrumentation.tracer:
+        instrumentation.tracer.save(args.trace_file)
+
+
+def run_commands_concurrently(args, jobs: list, jobs_description: str, instrumentation: Instrumentation = None,
+                              circuit_breakers: dict = None, connection_pool=None):
+    """
+    Run the command concurrently for all jobs, each given as tuple of kind, name, settings and region. At most
+    --max-concurrency jobs and --max-concurrency-per-account jobs of the same account run at the same time. A failure
+    in one job does not stop the other jobs, but the combined result fails if the command failed in any job.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    global_limit = threading.BoundedSemaphore(args.max_concurrency or len(jobs))
+    account_limits = dict()
+    for kind, name, settings, region in jobs:
+        account = settings.get(ACCOUNT_SETTING, DEFAULT_ACCOUNT)
+        if account not in account_limits:
+            account_limits[account] = threading.BoundedSemaphore(args.max_concurrency_per_account or len(jobs))
+
+    def run_job(kind: str, name: str, settings: dict, region: str):
+        with account_limits[settings.get(ACCOUNT_SETTING, DEFAULT_ACCOUNT)], global_limit:
+            print('{} [{}]: starting [{}]'.format(kind, name, args.command))
+            run_command(args, settings, region, instrumentation, circuit_breakers, connection_pool)
+
+    failed_jobs = list()
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        futures = OrderedDict()
+        for kind, name, settings, region in jobs:
+            futures[(kind, name)] = executor.submit(run_job, kind, name, settings, region)
+        for (kind, name), future in futures.items():
+            try:
+                future.result()
+                print('{} [{}]: [{}] succeeded'.format(kind, name, args.command))
+            except Exception as e:
+                logging.error('Command [{}] failed for {} [{}]: {}'.format(args.command, kind.lower(), name, e))
+                print('{} [{}]: [{}] failed: {}'.format(kind, name, args.command, e))
+                failed_jobs.append(name)
+
+    if failed_jobs:
+        raise Exception('Command [{}] failed in {}: [{}]'.format(
+            args.command, jobs_description, ', '.join(failed_jobs)))
+
+
+def get_region_setting(settings: dict, key: str, region: str):
+    """
+    Settings can either have one value for all regions or a mapping from region to value.
+    """
+    value = settings.get(key)
+    if isinstance(value, dict):
+        if region not in value:
+            raise Exception('Setting [{}] has no value for region [{}]'.format(key, region))
+        return value[region]
+    return value
+
+
+def get_journal_file(args, settings: dict, region: str):
+    if args.journal_file:
+        return args.journal_file
+    file_name = settings['ApplicationId'] + ('-' + region if region else '') + '.json'
+    return os.path.join(os.path.expanduser(DEFAULT_JOURNAL_DIR), file_name)
+
+
+def get_controller_class(command: Command):
+    module_name, class_name = command.controller
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def run_command(args, settings: dict, region: str = None, instrumentation: Instrumentation = None,
+                circuit_breakers: dict = None, connection_pool=None):
+    from solrcloud_cli.services.senza_wrapper import SenzaWrapper
+
+    senza_wrapper = SenzaWrapper(args.senza_configuration)
+    if region:
+        senza_wrapper.set_region(region)
+    instrumentation = instrumentation or Instrumentation(None, None, None, None)
+    set_instrumentation(senza_wrapper, instrumentation)
+
+    for key in filter(lambda x: x not in CLI_SETTINGS, settings.keys()):
+        senza_wrapper.add_parameter(key, get_region_setting(settings, key, region))
+
+    command = COMMANDS[args.command]
+    options = {
+        'sharding_level': args.sharding_level,
+        'replication_factor': args.replication_level,
+        'image_version': args.image_version
+    }
+    controller_arguments = dict(map(lambda x: (x, options[x]), command.options))
+    base_url = get_region_setting(settings, 'SolrBaseUrl', region)
+    controller = get_controller_class(command)(base_url=base_url,
+                                               stack_name=settings['ApplicationId'],
+                                               oauth_token=args.token,
+                                               senza_wrapper=senza_wrapper,
+                                               **controller_arguments)
+    set_instrumentation(controller, instrumentation)
+    if region:
+        controller.set_region(region)
+    if args.adaptive_concurrency:
+        controller.set_concurrency_limiter(get_concurrency_limiter(args))
+    if circuit_breakers:
+        controller.set_circuit_breaker(circuit_breakers[base_url])
+    if connection_pool:
+        controller.set_connection_pool(connection_pool)
+    if args.overseer_queue_target:
+        from solrcloud_cli.services.submission_throttle import SubmissionThrottle
+        controller.set_submission_throttle(SubmissionThrottle(args.overseer_queue_target))
+    if command.controller != BOOTSTRAP_CONTROLLER:
+        controller.set_wait_for_cluster_deletion(not args.no_wait_for_deletion)
+    if command.controller in [BOOTSTRAP_CONTROLLER, DEPLOYMENT_CONTROLLER] and args.wait_for_final_state:
+        controller.set_wait_for_final_state(True)
+    if command.controller == DEPLOYMENT_CONTROLLER:
+        if args.plan_file:
+            controller.set_migration_plan_file(args.plan_file)
+        if args.migration_concurrency:
+            controller.set_migration_concurrency(args.migration_concurrency)
+        if args.delete_nodes_in_bulk:
+            controller.set_delete_nodes_in_bulk(True)
+        if args.migration_strategy:
+            controller.set_migration_strategy(args.migration_strategy)
+        if args.traffic_ramp:
+            controller.set_traffic_ramp(args.traffic_ramp)
+        if args.ramp_step_wait is not None:
+            controller.set_ramp_step_wait(args.ramp_step_wait)
+        if args.ramp_max_p99_latency is not None:
+            controller.set_ramp_max_p99_latency(args.ramp_max_p99_latency)
+        if args.ramp_max_error_rate is not None:
+            controller.set_ramp_max_error_rate(args.ramp_max_error_rate)
+        if args.monitor_recovery:
+            controller.set_monitor_recovery(True)
+        if args.recovery_stall_timeout is not None:
+            controller.set_recovery_stall_timeout(args.recovery_stall_timeout)
+        if args.replication_max_rate is not None:
+            controller.set_replication_max_rate(args.replication_max_rate)
+        if args.warm_up_query_file:
+            controller.set_warm_up_query_file(args.warm_up_query_file)
+        if args.warm_up_concurrency is not None:
+            controller.set_warm_up_concurrency(args.warm_up_concurrency)
+        if args.warm_up_time is not None:
+            controller.set_warm_up_time(args.warm_up_time)
+        if args.benchmark_query_file:
+            controller.set_benchmark_query_file(args.benchmark_query_file)
+        if args.benchmark_concurrency is not None:
+            controller.set_benchmark_concurrency(args.benchmark_concurrency)
+        if args.benchmark_time is not None:
+            controller.set_benchmark_time(args.benchmark_time)
+        if args.benchmark_tolerance is not None:
+            controller.set_benchmark_tolerance(args.benchmark_tolerance)
+    if args.command == 'deploy':
+        from solrcloud_cli.services.deployment_journal import DeploymentJournal
+        controller.set_journal(DeploymentJournal(get_journal_file(args, settings, region)))
+        controller.set_resume_deployment(args.resume)
+
+    from contextlib import ExitStack
+    with ExitStack() as context:
+        labels = {'command': args.command, 'stack': settings['ApplicationId'], 'region': region or ''}
+        if instrumentation.metrics:
+            from solrcloud_cli.services.metrics import COMMAND_DURATION
+            context.enter_context(instrumentation.metrics.timer(COMMAND_DURATION, labels))
+        if instrumentation.tracer:
+            context.enter_context(instrumentation.tracer.span(args.command, 'command', labels))
+        getattr(controller, command.method)()
+
+
+def get_concurrency_limiter(args):
+    from solrcloud_cli.controllers.cluster_deployment_controller import DEFAULT_MIGRATION_CONCURRENCY
+    from solrcloud_cli.services.concurrency_limiter import ConcurrencyLimiter, DEFAULT_LATENCY_THRESHOLD
+
+    return ConcurrencyLimiter(args.migration_concurrency or DEFAULT_MIGRATION_CONCURRENCY,
+                              latency_threshold=args.concurrency_latency_threshold or DEFAULT_LATENCY_THRESHOLD)
+
+
+def get_circuit_breakers(args, fleet: list, regions: list):
+    """
+    Create one circuit breaker per Solr endpoint, shared by all stacks and regions of the run that use the endpoint.
+    """
+    if not args.circuit_breaker:
+        return None
+    from solrcloud_cli.services.circuit_breaker import CircuitBreaker, DEFAULT_FAILURE_THRESHOLD, \
+        DEFAULT_RESET_TIMEOUT, DEFAULT_RETRY_BUDGET
+
+    circuit_breakers = dict()
+    for settings in fleet:
+        for region in regions:
+            base_url = get_region_setting(settings, 'SolrBaseUrl', region)
+            if base_url not in circuit_breakers:
+                circuit_breakers[base_url] = CircuitBreaker(
+                    base_url, failure_threshold=args.circuit_breaker_threshold or DEFAULT_FAILURE_THRESHOLD,
+                    reset_timeout=args.circuit_breaker_reset_timeout or DEFAULT_RESET_TIMEOUT,
+                    retry_budget=args.retry_budget if args.retry_budget is not None else DEFAULT_RETRY_BUDGET,
+                    wait=args.circuit_breaker_wait)
+    return circuit_breakers
+
+
+def set_instrumentation(service, instrumentation: Instrumentation):
+    """
+    Pass the instrumentation of the run to a controller or senza wrapper, which both have a setter for every service.
+    """
+    for name, value in instrumentation._asdict().items():
+        if value:
+            getattr(service, 'set_' + name)(value)
 
 
 def main():
@@ -3,11 +3,10 @@
 
 import logging
 import os
-import time
 import urllib.error
-import urllib.request
 
-from solrcloud_cli.controllers.cluster_controller import ClusterController
+from solrcloud_cli.controllers.cluster_controller import AsyncRequestError, ClusterController
+from solrcloud_cli.services.metrics import POLL_ITERATIONS
 from solrcloud_cli.services.senza_wrapper import SenzaWrapper
 
 CONFIG_DIR = os.path.join(os.getcwd(), 'configs')
@@ -23,6 +22,7 @@ class ClusterBootstrapController(ClusterController):
     __image_version = ''
     __retry_count = DEFAULT_RETRY_COUNT
     __retry_wait = DEFAULT_RETRY_WAIT
+    __wait_for_final_state = False
 
     def __init__(self, base_url: str, stack_name: str, sharding_level: int, replication_factor: int, image_version: str,
                  oauth_token: str, senza_wrapper: SenzaWrapper):
@@ -35,10 +35,14 @@ class ClusterBootstrapController(ClusterController):
         self._senza = senza_wrapper
 
     def bootstrap_cluster(self):
-        self.create_cluster()
-        self.switch_on_traffic()
-        self.wait_for_cluster_to_be_ready()
-        self.add_all_collections_to_cluster()
+        with self._phase('create-cluster'):
+            self.create_cluster()
+        with self._phase('switch-on-traffic'):
+            self.switch_on_traffic()
+        with self._phase('wait-for-cluster'):
+            self.wait_for_cluster_to_be_ready()
+        with self._phase('add-collections'):
+            self.add_all_collections_to_cluster()
 
     def set_retry_count(self, retry_count: int):
         self.__retry_count = retry_count
@@ -46,6 +50,12 @@ class ClusterBootstrapController(ClusterController):
     def set_retry_wait(self, retry_wait: int):
         self.__retry_wait = retry_wait
 
+    def set_wait_for_final_state(self, wait_for_final_state: bool):
+        """
+        Create collections asynchronously and wait until Solr reports all their replicas as active.
+        """
+        self.__wait_for_final_state = wait_for_final_state
+
     def create_cluster(self):
         self._senza.create_stack(self._stack_name, INITIAL_STACK_VERSION, self.__image_version)
 
@@ -60,6 +70,7 @@ class ClusterBootstrapController(ClusterController):
             try:
                 cluster_state = self.get_cluster_state()
                 nodes_count = len(cluster_state['cluster']['live_nodes'])
+                self._report_progress('wait-for-cluster', 'nodes-joined', nodes_count, expected_number_of_nodes)
                 if nodes_count >= expected_number_of_nodes:
                     retry = False
             except Exception as e:
@@ -67,15 +78,18 @@ class ClusterBootstrapController(ClusterController):
             finally:
                 if retry:
                     logging.warning('Cluster is not ready, yet, retrying ...')
-                    time.sleep(self.__retry_wait)
+                    self._count(POLL_ITERATIONS, loop='cluster-ready')
+                    self._sleep(self.__retry_wait)
                     retry_count += 1
         if retry:
             logging.warning('Cluster did not become ready in time.')
 
     def add_all_collections_to_cluster(self):
         result = 0
-        for config in os.listdir(CONFIG_DIR):
+        configs = os.listdir(CONFIG_DIR)
+        for index, config in enumerate(configs):
             result += self.add_collection_to_cluster(config)
+            self._report_progress('add-collections', 'collections-created', index + 1, len(configs))
         return result
 
     def add_collection_to_cluster(self, collection_name):
@@ -85,18 +99,43 @@ class ClusterBootstrapController(ClusterController):
         url += '&replicationFactor=' + str(self.__replication_factor)
         url += '&maxShardsPerNode=1'
         url += '&collection.configName=' + collection_name.replace('_', '')
+        if not self.__wait_for_final_state:
+            self.__send_create_request(url, collection_name)
+            return 0
+        url += '&waitForFinalState=true'
+        retry_count = 0
+        while True:
+            request_id = self.__send_create_request(url, collection_name)
+            if not request_id:
+                return 0
+            try:
+                self._wait_for_async_request(request_id, self.__retry_count * self.__retry_wait, self.__retry_wait)
+                logging.info('All replicas of collection [{}] are active'.format(collection_name))
+                return 0
+            except AsyncRequestError as e:
+                if retry_count >= self.__retry_count:
+                    raise
+                logging.warning('Creating collection [{}] failed, deleting it and retrying ...: {}'.format(
+                    collection_name, e))
+                self.__delete_collection(collection_name)
+                self._retry('CREATE')
+                self._sleep(self.__retry_wait)
+                retry_count += 1
+
+    def __send_create_request(self, url: str, collection_name: str):
+        """
+        Send the CREATE request, asynchronously if the final state is awaited. Returns the id of the asynchronous
+        request or None if it has not been accepted by Solr.
+        """
+        request_id = None
         retry = True
         retry_count = 0
         while retry and retry_count <= self.__retry_count:
             try:
-                headers = dict()
-                headers['Authorization'] = 'Bearer ' + self._oauth_token
-                request = urllib.request.Request(url, headers=headers)
-                response = urllib.request.urlopen(request)
-                code = response.getcode()
-                response.close()
-                if code != 200:
-                    raise Exception('Received unexpected status code from Solr: [{}]'.format(code))
+                if self.__wait_for_final_state:
+                    request_id = self._submit_async_request(url)
+                else:
+                    self._send_request(url)
                 retry = False
             except urllib.error.HTTPError as e:
                 if e.code == 500:
@@ -115,8 +154,17 @@ class ClusterBootstrapController(ClusterController):
                     raise Exception('Failed sending request to Solr [{}]: {}'.format(url, e))
             except Exception as e:
                 raise Exception('Failed sending request to Solr [{}]: {}'.format(url, e))
-            finally:
-                if retry:
-                    time.sleep(self.__retry_wait)
-                    retry_count += 1
-        return 0
+            if retry:
+                self._retry('CREATE')
+                self._sleep(self.__retry_wait)
+                retry_count += 1
+        return request_id
+
+    def __delete_collection(self, collection_name: str):
+        """
+        Delete what has been created of a collection whose asynchronous CREATE request failed.
+        """
+        try:
+            self._send_request(self._api_url + '?action=DELETE&name=' + collection_name)
+        except urllib.error.HTTPError as e:
+            logging.warning('Could not delete collection [{}]: {}'.format(collection_name, e))
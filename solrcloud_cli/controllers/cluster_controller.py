@@ -1,7 +1,36 @@
+import hashlib
 import json
+import time
+import urllib.error
+import urllib.parse
 import urllib.request
 
 from abc import ABCMeta
+from contextlib import contextmanager
+
+from solrcloud_cli.services.interaction_log import SOLR_INTERACTION
+from solrcloud_cli.services.circuit_breaker import CircuitBreaker
+from solrcloud_cli.services.concurrency_limiter import ConcurrencyLimiter
+from solrcloud_cli.services.connection_pool import ConnectionPool
+from solrcloud_cli.services.metrics import CONCURRENCY_LIMIT, PHASE_DURATION, POLL_ITERATIONS, REQUEST_DURATION, \
+    REQUESTS, GATEWAY_TIMEOUTS, RETRIES, SUBMISSION_DELAY
+from solrcloud_cli.services.submission_throttle import SubmissionThrottle
+from solrcloud_cli.services.tracer import Span
+
+# Parameters of Collections API requests that are recorded as attributes of traced requests
+TRACED_PARAMETERS = ['collection', 'shard', 'node', 'replica', 'name', 'sourceNode', 'targetNode', 'requestid']
+
+# Collections API actions that are queued for the overseer, delayed by the submission throttle and limited by the
+# concurrency limiter until they have completed
+THROTTLED_ACTIONS = ['CREATE', 'DELETE', 'ADDREPLICA', 'DELETEREPLICA', 'REPLACENODE', 'DELETENODE']
+
+ASYNC_REQUEST_COMPLETED = 'completed'
+ASYNC_REQUEST_FAILED = 'failed'
+ASYNC_REQUEST_NOT_FOUND = 'notfound'
+
+
+class AsyncRequestError(Exception):
+    pass
 
 
 class ClusterController(metaclass=ABCMeta):
@@ -9,23 +38,263 @@ class ClusterController(metaclass=ABCMeta):
     _api_url = ''
     _senza = None
     _stack_name = ''
+    _region = None
     _oauth_token = ''
+    _interaction_log = None
+    _metrics = None
+    _progress_reporter = None
+    _tracer = None
+    _submission_throttle = None
+    _concurrency_limiter = None
+    _circuit_breaker = None
+    _connection_pool = None
+    __async_request_starts = None
 
     def set_senza_wrapper(self, senza_wrapper):
         self._senza = senza_wrapper
 
+    def set_region(self, region: str):
+        """
+        AWS region the command runs in, used to tell apart the progress and phase metrics of the regions of a stack.
+        """
+        self._region = region
+
+    def set_interaction_log(self, interaction_log):
+        """
+        Record all requests to Solr with an InteractionRecorder or answer them with an InteractionReplayer.
+        """
+        self._interaction_log = interaction_log
+
+    def set_metrics(self, metrics):
+        self._metrics = metrics
+
+    def set_progress_reporter(self, progress_reporter):
+        self._progress_reporter = progress_reporter
+
+    def set_tracer(self, tracer):
+        self._tracer = tracer
+
+    def set_submission_throttle(self, submission_throttle: SubmissionThrottle):
+        """
+        Delay Collections API operations that are queued for the overseer while its queues are above their target size.
+        """
+        self._submission_throttle = submission_throttle
+
+    def set_concurrency_limiter(self, concurrency_limiter: ConcurrencyLimiter):
+        """
+        Limit the number of Collections API operations in flight adaptively, e.g. while a migration plan is applied.
+        Asynchronous operations count as in flight from their submission until Solr reports them as completed.
+        """
+        self._concurrency_limiter = concurrency_limiter
+        self.__async_request_starts = dict()
+
+    def set_circuit_breaker(self, circuit_breaker: CircuitBreaker):
+        """
+        Guard all requests to the Solr endpoint with a circuit breaker and take retries from its retry budget. The
+        circuit breaker may be shared by the controllers of all stacks using the same endpoint.
+        """
+        self._circuit_breaker = circuit_breaker
+
+    def set_connection_pool(self, connection_pool: ConnectionPool):
+        """
+        Send all requests over keep-alive connections of a pool, which may be shared by the controllers of all stacks.
+        """
+        self._connection_pool = connection_pool
+
     def get_cluster_state(self):
         url = self._api_url + '?action=CLUSTERSTATUS&wt=json'
+        with self._trace('get_cluster_state', 'cluster-state'):
+            try:
+                return json.loads(self._send_request(url))
+            except Exception as e:
+                raise Exception('Failed sending request to Solr [{}]: {}'.format(url, e))
+
+    def _send_request(self, url: str, data: dict = None):
+        """
+        Send request to Solr and return the response body. Requests with data are sent as POST requests with a JSON
+        body. HTTP errors are raised as urllib.error.HTTPError.
+        """
+        attributes = self.__get_request_attributes(url)
+        throttled = attributes['action'] in THROTTLED_ACTIONS
+        if self._submission_throttle and throttled:
+            self.__throttle_submission(attributes['action'])
+        # Asynchronous operations are limited from their submission until their completion instead
+        limited = self._concurrency_limiter is not None and throttled and '&async=' not in url
+        guarded = self._circuit_breaker is not None and url.startswith(self._api_url.rsplit('/admin/', 1)[0])
+        if guarded:
+            self._circuit_breaker.before_request()
+        with self._trace(attributes['action'], 'solr', attributes) as span:
+            if limited:
+                self._concurrency_limiter.acquire()
+            start = time.time()
+            status = 'error'
+            try:
+                if self._interaction_log:
+                    request = url if data is None else {'url': url, 'data': data}
+                    content = self._interaction_log.execute(SOLR_INTERACTION, request,
+                                                            lambda: self.__send_request(url, data))
+                else:
+                    content = self.__send_request(url, data)
+                status = '200'
+                return content
+            except urllib.error.HTTPError as e:
+                status = str(e.code)
+                raise
+            finally:
+                span.set_attribute('status', status)
+                if self._metrics:
+                    self.__record_request(attributes['action'], status, time.time() - start)
+                if limited:
+                    self.__release_concurrency(start, congested=status == 'error' or status.startswith('5'))
+                if guarded:
+                    # Solr answers CREATE and ADDREPLICA with a gateway timeout while it keeps working on them
+                    self._circuit_breaker.after_request(
+                        failed=status == 'error' or (status.startswith('5') and status != '504'))
+
+    def _submit_async_request(self, url: str):
+        """
+        Submit a Collections API request to be executed asynchronously by the overseer and return its request id. The
+        id is derived from the stack name and the request, so that recorded deployments can be replayed. A status left
+        over from an earlier attempt of the same request is deleted before it is submitted again.
+        """
+        request_id = '{}-{}'.format(self._stack_name, hashlib.sha1(url.encode('utf-8')).hexdigest()[:16])
+        if self._concurrency_limiter:
+            self.__async_request_starts[request_id] = self._concurrency_limiter.acquire()
+        try:
+            self.__delete_async_request_status(request_id)
+            self._send_request(url + '&async=' + request_id)
+        except Exception:
+            if self._concurrency_limiter:
+                self.__release_concurrency(self.__async_request_starts.pop(request_id), congested=True)
+            raise
+        return request_id
+
+    def _wait_for_async_request(self, request_id: str, timeout: int, retry_wait: int):
+        """
+        Poll the status of an asynchronous request until it has completed. Raises an AsyncRequestError if the request
+        failed or is unknown to Solr and an exception if it has not completed within the timeout.
+        """
+        url = self._api_url + '?action=REQUESTSTATUS&requestid=' + request_id + '&wt=json'
+        timer = 0
+        completed = False
         try:
-            headers = dict()
-            headers['Authorization'] = 'Bearer ' + self._oauth_token
-            request = urllib.request.Request(url, headers=headers)
-            response = urllib.request.urlopen(request)
+            while True:
+                status = json.loads(self._send_request(url)).get('status', dict())
+                state = status.get('state')
+                if state == ASYNC_REQUEST_COMPLETED:
+                    completed = True
+                    self.__delete_async_request_status(request_id)
+                    return
+                if state in [ASYNC_REQUEST_FAILED, ASYNC_REQUEST_NOT_FOUND]:
+                    if state == ASYNC_REQUEST_FAILED:
+                        self.__delete_async_request_status(request_id)
+                    raise AsyncRequestError('Async request [{}] {}: {}'.format(
+                        request_id, state, status.get('msg', '')))
+                if timer >= timeout:
+                    raise Exception('Timeout while waiting for async request [{}] in state [{}]'.format(
+                        request_id, state))
+                self._count(POLL_ITERATIONS, loop='request-status')
+                self._sleep(retry_wait)
+                timer += retry_wait
+        finally:
+            if self._concurrency_limiter and request_id in self.__async_request_starts:
+                self.__release_concurrency(self.__async_request_starts.pop(request_id), congested=not completed)
+
+    def __throttle_submission(self, action: str):
+        delay = self._submission_throttle.wait(self.__get_overseer_queue_size, self._sleep)
+        if self._metrics:
+            self._metrics.observe(SUBMISSION_DELAY, delay, {'action': action})
+
+    def __release_concurrency(self, start: float, congested: bool):
+        limit = self._concurrency_limiter.release(start, congested)
+        if self._metrics:
+            self._metrics.set_gauge(CONCURRENCY_LIMIT, limit)
+        if self._tracer:
+            self._tracer.counter(CONCURRENCY_LIMIT, {'limit': limit,
+                                                     'in_flight': self._concurrency_limiter.get_in_flight()})
+
+    def __get_overseer_queue_size(self):
+        overseer_status = json.loads(self._send_request(self._api_url + '?action=OVERSEERSTATUS&wt=json'))
+        return SubmissionThrottle.get_queue_size(overseer_status)
+
+    def __delete_async_request_status(self, request_id: str):
+        self._send_request(self._api_url + '?action=DELETESTATUS&requestid=' + request_id + '&wt=json')
+
+    @contextmanager
+    def _phase(self, phase: str):
+        """
+        Record the duration of a phase of a command in the metrics and trace all requests of the phase in its span.
+        """
+        labels = {'phase': phase, 'stack': self._stack_name, 'region': self._region or ''}
+        with self._trace(phase, 'phase', {'stack': self._stack_name, 'region': self._region or ''}):
+            if self._metrics:
+                with self._metrics.timer(PHASE_DURATION, labels):
+                    yield
+            else:
+                yield
+
+    @contextmanager
+    def _trace(self, name: str, category: str, attributes: dict = None):
+        if self._tracer:
+            with self._tracer.span(name, category, attributes) as span:
+                yield span
+        else:
+            yield Span(attributes)
+
+    def _count(self, name: str, **labels):
+        if self._metrics:
+            self._metrics.increment(name, labels)
+
+    def _retry(self, operation: str):
+        """
+        Account for the retry of an operation. Raises an exception if the retry budget of the endpoint is exhausted.
+        """
+        self._count(RETRIES, operation=operation)
+        if self._circuit_breaker:
+            self._circuit_breaker.spend_retry(operation)
+
+    def _sleep(self, seconds: float):
+        """
+        Wait between polls of Solr. While a recorded deployment is replayed the wait is compressed or skipped.
+        """
+        if self._interaction_log:
+            self._interaction_log.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def _report_progress(self, phase: str, unit: str, done: int, total: int = None):
+        if self._progress_reporter:
+            self._progress_reporter.report(self._stack_name, phase, unit, done, total, region=self._region)
+
+    def __send_request(self, url: str, data: dict = None):
+        headers = dict()
+        headers['Authorization'] = 'Bearer ' + self._oauth_token
+        body = None
+        if data is not None:
+            headers['Content-Type'] = 'application/json'
+            body = json.dumps(data).encode('utf-8')
+        if self._connection_pool:
+            code, content = self._connection_pool.request(url, headers, body)
+        else:
+            response = urllib.request.urlopen(urllib.request.Request(url, data=body, headers=headers))
             code = response.getcode()
-            content = response.read().decode('utf-8')
+            content = response.read()
             response.close()
-            if code != 200:
-                raise Exception('Received unexpected status code from Solr: [{}]'.format(code))
-            return json.loads(content)
-        except Exception as e:
-            raise Exception('Failed sending request to Solr [{}]: {}'.format(url, e))
+        if code != 200:
+            raise Exception('Received unexpected status code from Solr: [{}]'.format(code))
+        return content.decode('utf-8') if isinstance(content, bytes) else content
+
+    def __record_request(self, action: str, status: str, seconds: float):
+        self._metrics.observe(REQUEST_DURATION, seconds, {'kind': 'solr', 'action': action})
+        self._metrics.increment(REQUESTS, {'kind': 'solr', 'action': action, 'status': status})
+        if status == '504':
+            self._metrics.increment(GATEWAY_TIMEOUTS, {'action': action})
+
+    @staticmethod
+    def __get_request_attributes(url: str):
+        parsed_url = urllib.parse.urlparse(url)
+        parameters = urllib.parse.parse_qs(parsed_url.query)
+        attributes = {'action': parameters.get('action', [parsed_url.path.rsplit('/', 1)[-1]])[0]}
+        for parameter in filter(lambda x: x in parameters, TRACED_PARAMETERS):
+            attributes[parameter] = parameters[parameter][0]
+        return attributes
@@ -3,7 +3,6 @@
 
 import logging
 import urllib.error
-import urllib.request
 
 from solrcloud_cli.controllers.cluster_controller import ClusterController
 from solrcloud_cli.services.senza_wrapper import SenzaWrapper
@@ -13,23 +12,33 @@ COLLECTIONS_API_PATH = '/admin/collections'
 
 class ClusterDeleteController(ClusterController):
 
+    __wait_for_cluster_deletion = True
+
     def __init__(self, base_url: str, stack_name: str, oauth_token: str, senza_wrapper: SenzaWrapper):
         self._api_url = base_url.strip('/') + COLLECTIONS_API_PATH
         self._oauth_token = oauth_token
         self._stack_name = stack_name
         self._senza = senza_wrapper
 
+    def set_wait_for_cluster_deletion(self, wait: bool):
+        self.__wait_for_cluster_deletion = wait
+
     def delete_cluster(self):
         stack_versions = self._senza.get_all_stack_versions(self._stack_name)
         if not stack_versions:
             raise Exception('No active stack version found')
-        self.delete_all_collections_in_cluster()
+        with self._phase('delete-collections'):
+            self.delete_all_collections_in_cluster()
         for version in stack_versions:
-            self.switch_off_traffic(version['version'])
-            self.delete_cluster_version(version['version'])
+            with self._phase('delete-stack-version'):
+                self.switch_off_traffic(version['version'])
+                self.delete_cluster_version(version['version'])
 
     def delete_cluster_version(self, stack_version: str):
-        self._senza.delete_stack_version(self._stack_name, stack_version)
+        if self.__wait_for_cluster_deletion:
+            self._senza.delete_stack_version(self._stack_name, stack_version)
+        else:
+            self._senza.delete_stack_version(self._stack_name, stack_version, wait=False)
 
     def switch_off_traffic(self, stack_version: str):
         try:
@@ -43,24 +52,19 @@ class ClusterDeleteController(ClusterController):
 
     def delete_all_collections_in_cluster(self):
         cluster_state = self.get_cluster_state()
-        for collection in cluster_state['cluster']['collections'].keys():
+        collections = list(cluster_state['cluster']['collections'].keys())
+        for index, collection in enumerate(collections):
             try:
                 self.delete_collection_in_cluster(collection)
             except Exception as e:
                 logging.warning('Could not delete collection [{}] in cluster: [{}]'.format(collection, e))
+            self._report_progress('delete-collections', 'collections-deleted', index + 1, len(collections))
         return 0
 
     def delete_collection_in_cluster(self, collection_name: str):
         url = self._api_url + '?action=DELETE&name=' + collection_name
         try:
-            headers = dict()
-            headers['Authorization'] = 'Bearer ' + self._oauth_token
-            request = urllib.request.Request(url, headers=headers)
-            response = urllib.request.urlopen(request)
-            code = response.getcode()
-            response.close()
-            if code != 200:
-                raise Exception('Received unexpected status code from Solr: [{}]'.format(code))
+            self._send_request(url)
         except urllib.error.HTTPError as e:
             if e.code == 504:
                 logging.warning('HTTP Timeout while deleting collection [{}], but it should have been deleted anyways.'
@@ -1,14 +1,22 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import json
 import logging
 import sys
 import time
 import urllib.error
-import urllib.request
 
+from collections import deque, namedtuple, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from solrcloud_cli.controllers.cluster_controller import ClusterController
-from solrcloud_cli.services.senza_wrapper import SenzaWrapper
+from solrcloud_cli.services.deployment_journal import DeploymentJournal
+from solrcloud_cli.services.metrics import POLL_ITERATIONS
+from solrcloud_cli.services.migration_plan import MigrationPlan, ADD_REPLICA, DELETE_REPLICA, SWITCH_TRAFFIC
+from solrcloud_cli.services.query_runner import QueryResults, QueryRunner
+from solrcloud_cli.services.recovery_monitor import RecoveryMonitor
+from solrcloud_cli.services.senza_wrapper import SenzaWrapper, DELETE_IN_PROGRESS
 
 DEFAULT_LEADER_CHECK_RETRY_COUNT = 30
 DEFAULT_LEADER_CHECK_RETRY_WAIT = 1
@@ -17,16 +25,50 @@ DEFAULT_ADD_NODE_RETRY_WAIT = 10
 DEFAULT_ADD_NODE_TIMEOUT = 900
 DEFAULT_CREATE_CLUSTER_RETRY_WAIT = 10
 DEFAULT_CREATE_CLUSTER_TIMEOUT = 120
+DEFAULT_REAPER_RETRY_WAIT = 10
+DEFAULT_REAPER_TIMEOUT = 900
+DEFAULT_MIGRATION_PLAN_FILE = 'migration-plan.json'
+DEFAULT_MIGRATION_CONCURRENCY = 10
+REPLICA_MIGRATION_STRATEGY = 'replica'
+NODE_MIGRATION_STRATEGY = 'node'
+MIGRATION_STRATEGIES = [REPLICA_MIGRATION_STRATEGY, NODE_MIGRATION_STRATEGY]
+DEFAULT_RAMP_STEP_WAIT = 60
+DEFAULT_RAMP_MAX_PAUSES = 3
+DEFAULT_RAMP_MAX_P99_LATENCY = 1000
+DEFAULT_RAMP_MAX_ERROR_RATE = 0.01
+DEFAULT_WARM_UP_CONCURRENCY = 4
+DEFAULT_WARM_UP_TIME = 0
+DEFAULT_RECOVERY_STALL_TIMEOUT = 300
+DEFAULT_BENCHMARK_CONCURRENCY = 4
+DEFAULT_BENCHMARK_TIME = 30
+DEFAULT_BENCHMARK_TOLERANCE = 0.2
+BENCHMARK_PERCENTILES = [50, 95, 99]
 COLLECTIONS_API_PATH = '/admin/collections'
+NODE_QUERY_METRICS_URL = 'http://{}:8983/solr/admin/metrics?group=core&prefix=QUERY./select&wt=json'
+CORE_QUERY_URL = 'http://{}:8983/solr/{}/select?{}&distrib=false'
+CORE_REPLICATION_DETAILS_URL = 'http://{}:8983/solr/{}/replication?command=details&wt=json'
+COLLECTION_CONFIG_PATH = '/{}/config'
+# User property referenced as maxWriteMBPerSec by the replication handler in solrconfig.xml
+REPLICATION_RATE_PROPERTY = 'solr.replication.maxWriteMBPerSec'
 
 BLUE_GREEN_DEPLOYMENT_VERSIONS = ['blue', 'green']
 
+CREATE_CLUSTER_PHASE = 'create-new-cluster'
+ADD_NEW_NODES_PHASE = 'add-new-nodes'
+WARM_UP_PHASE = 'warm-up'
+BENCHMARK_PHASE = 'benchmark'
+SWITCH_TRAFFIC_PHASE = 'switch'
+DELETE_OLD_NODES_PHASE = 'delete-old-nodes'
+DELETE_CLUSTER_PHASE = 'delete-old-cluster'
+
+CollectionLayout = namedtuple('CollectionLayout', ['shards', 'replication_factor'])
+QueryMetrics = namedtuple('QueryMetrics', ['requests', 'errors', 'p99_latency'])
+
 
 class ClusterDeploymentController(ClusterController):
 
     __image_version = None
-    __sharding_level = 0
-    __replication_factor = 0
+    __cluster_layout = None
     __stack_version = ''
 
     __leader_check_retry_count = DEFAULT_LEADER_CHECK_RETRY_COUNT
@@ -36,6 +78,31 @@ class ClusterDeploymentController(ClusterController):
     __add_node_timeout = DEFAULT_ADD_NODE_TIMEOUT
     __create_cluster_retry_wait = DEFAULT_CREATE_CLUSTER_RETRY_WAIT
     __create_cluster_timeout = DEFAULT_CREATE_CLUSTER_TIMEOUT
+    __reaper_retry_wait = DEFAULT_REAPER_RETRY_WAIT
+    __reaper_timeout = DEFAULT_REAPER_TIMEOUT
+    __wait_for_cluster_deletion = True
+    __journal = None
+    __resume_deployment = False
+    __migration_plan_file = DEFAULT_MIGRATION_PLAN_FILE
+    __migration_concurrency = DEFAULT_MIGRATION_CONCURRENCY
+    __migration_strategy = REPLICA_MIGRATION_STRATEGY
+    __delete_nodes_in_bulk = False
+    __wait_for_final_state = False
+    __traffic_ramp = None
+    __ramp_step_wait = DEFAULT_RAMP_STEP_WAIT
+    __ramp_max_pauses = DEFAULT_RAMP_MAX_PAUSES
+    __ramp_max_p99_latency = DEFAULT_RAMP_MAX_P99_LATENCY
+    __ramp_max_error_rate = DEFAULT_RAMP_MAX_ERROR_RATE
+    __warm_up_query_file = None
+    __warm_up_concurrency = DEFAULT_WARM_UP_CONCURRENCY
+    __warm_up_time = DEFAULT_WARM_UP_TIME
+    __monitor_recovery = False
+    __recovery_stall_timeout = DEFAULT_RECOVERY_STALL_TIMEOUT
+    __replication_max_rate = None
+    __benchmark_query_file = None
+    __benchmark_concurrency = DEFAULT_BENCHMARK_CONCURRENCY
+    __benchmark_time = DEFAULT_BENCHMARK_TIME
+    __benchmark_tolerance = DEFAULT_BENCHMARK_TOLERANCE
 
     def __init__(self, base_url: str, stack_name: str, image_version: str, oauth_token: str,
                  senza_wrapper: SenzaWrapper):
@@ -45,23 +112,49 @@ class ClusterDeploymentController(ClusterController):
         self._stack_name = stack_name
         self.__image_version = image_version
         self._senza = senza_wrapper
-        cluster_state = self.get_cluster_state()
-        if cluster_state and cluster_state['cluster']['collections'].keys():
-            first_collection = list(cluster_state['cluster']['collections'].keys())[0]
-            self.__replication_factor = \
-                int(cluster_state['cluster']['collections'][first_collection]['replicationFactor'])
-            self.__sharding_level = \
-                len(list(cluster_state['cluster']['collections'][first_collection]['shards'].keys()))
 
     def deploy_new_version(self):
         """
-        Deploy a new version of the Solr cloud cluster using blue/green deployment strategy.
+        Deploy a new version of the Solr cloud cluster using blue/green deployment strategy. If a journal is set, the
+        completion of every phase is recorded and a resumed deployment skips all phases that have been completed.
         """
-        self.create_cluster()
-        self.add_new_nodes_to_cluster()
-        self.switch_traffic()
-        self.delete_old_nodes_from_cluster()
-        self.delete_cluster()
+        phases = [
+            (CREATE_CLUSTER_PHASE, self.create_cluster),
+            (ADD_NEW_NODES_PHASE, self.add_new_nodes_to_cluster),
+            (WARM_UP_PHASE, self.warm_up_new_nodes),
+            (BENCHMARK_PHASE, self.benchmark_new_nodes),
+            (SWITCH_TRAFFIC_PHASE, self.switch_traffic),
+            (DELETE_OLD_NODES_PHASE, self.delete_old_nodes_from_cluster),
+            (DELETE_CLUSTER_PHASE, self.delete_cluster)
+        ]
+        if not self.__journal:
+            for phase, execute_phase in phases:
+                with self._phase(phase):
+                    execute_phase()
+            return
+
+        self.__prepare_journal()
+        for phase, execute_phase in phases:
+            if self.__journal.is_phase_complete(phase):
+                logging.info('Skipping phase [{}], it has already been completed'.format(phase))
+                continue
+            with self._phase(phase):
+                execute_phase()
+            self.__journal.complete_phase(phase)
+        self.__journal.clear()
+
+    def __prepare_journal(self):
+        if self.__resume_deployment and self.__journal.matches(self._stack_name, self.__image_version):
+            if self.__journal.is_phase_complete(SWITCH_TRAFFIC_PHASE):
+                stack_version = self._senza.get_active_stack_version(self._stack_name)
+            else:
+                stack_version = self.get_passive_stack_version()
+            if stack_version != self.__journal.get_stack_version():
+                raise Exception('Journal [{}] does not match current deployment: stack version [{}] != [{}]'.format(
+                    self.__journal.get_file_name(), self.__journal.get_stack_version(), stack_version))
+            logging.info('Resuming deployment of stack [{}] version [{}]'.format(self._stack_name, stack_version))
+        else:
+            self.__journal.start(self._stack_name, self.__image_version, self.get_passive_stack_version())
 
     def set_leader_check_retry_count(self, retry_count: int):
         self.__leader_check_retry_count = retry_count
@@ -84,6 +177,94 @@ class ClusterDeploymentController(ClusterController):
     def set_create_cluster_timeout(self, timeout: int):
         self.__create_cluster_timeout = timeout
 
+    def set_reaper_retry_wait(self, retry_wait: int):
+        self.__reaper_retry_wait = retry_wait
+
+    def set_reaper_timeout(self, timeout: int):
+        self.__reaper_timeout = timeout
+
+    def set_wait_for_cluster_deletion(self, wait: bool):
+        self.__wait_for_cluster_deletion = wait
+
+    def set_journal(self, journal: DeploymentJournal):
+        self.__journal = journal
+
+    def set_resume_deployment(self, resume: bool):
+        self.__resume_deployment = resume
+
+    def set_migration_plan_file(self, file_name: str):
+        self.__migration_plan_file = file_name
+
+    def set_migration_concurrency(self, concurrency: int):
+        self.__migration_concurrency = concurrency
+
+    def set_wait_for_final_state(self, wait_for_final_state: bool):
+        """
+        Add replicas asynchronously and let Solr report their completion once they are active, instead of polling the
+        cluster state until all replicas are active.
+        """
+        self.__wait_for_final_state = wait_for_final_state
+
+    def set_delete_nodes_in_bulk(self, delete_in_bulk: bool):
+        self.__delete_nodes_in_bulk = delete_in_bulk
+
+    def set_migration_strategy(self, strategy: str):
+        if strategy not in MIGRATION_STRATEGIES:
+            raise Exception('Unknown migration strategy: [{}]'.format(strategy))
+        self.__migration_strategy = strategy
+
+    def set_traffic_ramp(self, weights: list):
+        """
+        Switch traffic in steps of increasing weights instead of at once, the last step always switches all traffic.
+        """
+        if list(filter(lambda x: not 0 < x <= 100, weights)):
+            raise Exception('Traffic weights must be between 1 and 100: [{}]'.format(weights))
+        self.__traffic_ramp = sorted(set(weights) | {100})
+
+    def set_ramp_step_wait(self, step_wait: int):
+        self.__ramp_step_wait = step_wait
+
+    def set_ramp_max_pauses(self, max_pauses: int):
+        self.__ramp_max_pauses = max_pauses
+
+    def set_ramp_max_p99_latency(self, max_p99_latency: float):
+        self.__ramp_max_p99_latency = max_p99_latency
+
+    def set_ramp_max_error_rate(self, max_error_rate: float):
+        self.__ramp_max_error_rate = max_error_rate
+
+    def set_warm_up_query_file(self, file_name: str):
+        self.__warm_up_query_file = file_name
+
+    def set_warm_up_concurrency(self, concurrency: int):
+        self.__warm_up_concurrency = concurrency
+
+    def set_warm_up_time(self, warm_up_time: int):
+        self.__warm_up_time = warm_up_time
+
+    def set_monitor_recovery(self, monitor_recovery: bool):
+        self.__monitor_recovery = monitor_recovery
+
+    def set_recovery_stall_timeout(self, stall_timeout: int):
+        self.__recovery_stall_timeout = stall_timeout
+
+    def set_replication_max_rate(self, max_rate: float):
+        self.__replication_max_rate = max_rate
+
+    def set_benchmark_query_file(self, file_name: str):
+        self.__benchmark_query_file = file_name
+
+    def set_benchmark_concurrency(self, concurrency: int):
+        self.__benchmark_concurrency = concurrency
+
+    def set_benchmark_time(self, benchmark_time: int):
+        self.__benchmark_time = benchmark_time
+
+    def set_benchmark_tolerance(self, tolerance: float):
+        if tolerance < 0:
+            raise Exception('Invalid benchmark tolerance: [{}]'.format(tolerance))
+        self.__benchmark_tolerance = tolerance
+
     def get_passive_stack_version(self):
         passive_stack_version = self._senza.get_passive_stack_version(self._stack_name)
         if not passive_stack_version:
@@ -99,107 +280,703 @@ class ClusterDeploymentController(ClusterController):
         timer = 0
         all_nodes_added = False
         while not all_nodes_added and timer < self.__create_cluster_timeout:
-            cluster_state = self.get_cluster_state()
-            all_nodes_added = True
-            for node in nodes:
-                node_name = node + ':8983_solr'
-                if node_name not in cluster_state['cluster']['live_nodes']:
-                    all_nodes_added = False
-                    break
+            live_nodes = set(self.get_cluster_state()['cluster']['live_nodes'])
+            joined_nodes = len(list(filter(lambda x: x + ':8983_solr' in live_nodes, nodes)))
+            self._report_progress(CREATE_CLUSTER_PHASE, 'nodes-joined', joined_nodes, len(nodes))
+            all_nodes_added = joined_nodes == len(nodes)
             if not all_nodes_added:
-                time.sleep(self.__create_cluster_retry_wait)
+                self._count(POLL_ITERATIONS, loop='nodes-registered')
+                self._sleep(self.__create_cluster_retry_wait)
                 timer += self.__create_cluster_retry_wait
                 sys.stdout.write('.')
                 sys.stdout.flush()
         if timer >= self.__create_cluster_timeout:
             raise Exception('Timeout while creating new cluster, not all new nodes have been registered in time')
 
+    def discover_cluster_layout(self, cluster_state: dict = None):
+        """
+        Derive the layout of every collection from the cluster state. The layout is only discovered on first use and
+        cached afterwards, an already fetched cluster state can be passed to avoid another request.
+        """
+        if self.__cluster_layout is None:
+            if cluster_state is None:
+                cluster_state = self.get_cluster_state()
+            self.__cluster_layout = self.get_cluster_layout(cluster_state)
+        return self.__cluster_layout
+
+    @staticmethod
+    def get_cluster_layout(cluster_state: dict):
+        cluster_layout = OrderedDict()
+        if cluster_state:
+            for collection_name, collection_values in cluster_state['cluster']['collections'].items():
+                cluster_layout[collection_name] = CollectionLayout(
+                    shards=list(collection_values['shards'].keys()),
+                    replication_factor=int(collection_values['replicationFactor']))
+        return cluster_layout
+
+    @staticmethod
+    def get_required_number_of_nodes(cluster_layout: dict):
+        # Every node holds at most one replica of each collection
+        return max(map(lambda x: len(x.shards) * x.replication_factor, cluster_layout.values()), default=0)
+
+    @staticmethod
+    def get_missing_replicas(cluster_state: dict, cluster_layout: dict, nodes: list):
+        """
+        Place all replicas that are required by the cluster layout and do not exist on the given nodes, yet. Each node
+        holds at most one replica of a collection and replicas are put on the nodes holding the fewest replicas, so
+        that collections of different size are spread evenly. Returns a list of (collection, shard, node name) tuples.
+        """
+        node_names = list(map(lambda x: x + ':8983_solr', nodes))
+        replicas_per_node = OrderedDict(map(lambda x: (x, 0), node_names))
+        existing_replicas = dict()
+        for collection_name, collection_values in cluster_state['cluster']['collections'].items():
+            for shard_name, shard_values in collection_values['shards'].items():
+                for replica_values in shard_values['replicas'].values():
+                    node_name = replica_values['node_name']
+                    if node_name in replicas_per_node:
+                        replicas_per_node[node_name] += 1
+                        existing_replicas.setdefault(collection_name, dict()).setdefault(shard_name, set()) \
+                            .add(node_name)
+
+        missing_replicas = list()
+        for collection_name, collection_layout in cluster_layout.items():
+            shard_nodes = existing_replicas.get(collection_name, dict())
+            used_nodes = set().union(*shard_nodes.values())
+            for shard_name in collection_layout.shards:
+                number_of_missing_replicas = collection_layout.replication_factor - len(shard_nodes.get(shard_name, []))
+                free_nodes = sorted(filter(lambda x: x not in used_nodes, node_names),
+                                    key=lambda x: replicas_per_node[x])
+                for node_name in free_nodes[:max(number_of_missing_replicas, 0)]:
+                    missing_replicas.append((collection_name, shard_name, node_name))
+                    replicas_per_node[node_name] += 1
+                    used_nodes.add(node_name)
+        return missing_replicas
+
     def delete_cluster(self):
         old_stack_version = self.get_passive_stack_version()
-        self._senza.delete_stack_version(self._stack_name, old_stack_version)
+        if self.__wait_for_cluster_deletion:
+            self._senza.delete_stack_version(self._stack_name, old_stack_version)
+        else:
+            self._senza.delete_stack_version(self._stack_name, old_stack_version, wait=False)
+
+    def reap_deleted_clusters(self):
+        """
+        Verify that all stack versions whose deletion has been issued are gone. Waits for deletions that are still in
+        progress and raises an exception listing every stack version that has not been deleted in time.
+        """
+        timer = 0
+        stragglers = self._senza.get_stack_versions_in_deletion(self._stack_name)
+        number_of_deletions = len(stragglers)
+        while (list(filter(lambda x: x['status'] == DELETE_IN_PROGRESS, stragglers)) and
+                timer < self.__reaper_timeout):
+            self._count(POLL_ITERATIONS, loop='stack-deletion')
+            self._sleep(self.__reaper_retry_wait)
+            timer += self.__reaper_retry_wait
+            sys.stdout.write('.')
+            sys.stdout.flush()
+            stragglers = self._senza.get_stack_versions_in_deletion(self._stack_name)
+            self._report_progress('reap', 'stack-versions-deleted', max(number_of_deletions - len(stragglers), 0),
+                                  number_of_deletions)
+
+        if stragglers:
+            for straggler in stragglers:
+                logging.warning('Stack [{}] version [{}] has not been deleted: [{}]'.format(
+                    self._stack_name, straggler['version'], straggler['status']))
+            raise Exception('Deletion of stack [{}] is not complete for versions: [{}]'.format(
+                self._stack_name, ', '.join(map(lambda x: x['version'], stragglers))))
+        logging.info('All deleted versions of stack [{}] are gone'.format(self._stack_name))
 
     def add_new_nodes_to_cluster(self):
         nodes = self.get_cluster_nodes(self._stack_name, self.get_passive_stack_version())
         cluster_state = self.get_cluster_state()
+        cluster_layout = self.discover_cluster_layout(cluster_state)
+        self.__verify_number_of_nodes(cluster_layout, nodes)
 
-        if len(nodes) < self.__sharding_level * self.__replication_factor:
-            raise Exception('Not enough instances for current cluster layout: [{}]<[{}]'.format(
-                len(nodes), self.__sharding_level * self.__replication_factor))
+        with self.limit_replication_rate(cluster_state):
+            if self.__migration_strategy == NODE_MIGRATION_STRATEGY:
+                self.replace_old_nodes(cluster_state, nodes)
+            else:
+                self.__add_missing_replicas(cluster_state, cluster_layout, nodes)
 
-        # Add nodes to cluster
-        for collection_name, collection_values in cluster_state['cluster']['collections'].items():
-            shard_counter = 0
-            for shard_name, shard_values in collection_values['shards'].items():
-                for replica_counter in range(self.__replication_factor):
-                    node_index = shard_counter + replica_counter * self.__sharding_level
-                    node_name = nodes[node_index] + ':8983_solr'
-                    if len(list(filter(lambda replica: replica[1]['node_name'] == node_name,
-                                shard_values['replicas'].items()))) == 0:
+    def replace_old_nodes(self, cluster_state: dict, nodes: list):
+        """
+        Move all replicas of every old node to a new node with one REPLACENODE request per pair of nodes. Solr adds the
+        replicas to the new node, waits for them to become active and deletes them from the old node. Up to the
+        configured migration concurrency of nodes are replaced in parallel.
+        """
+        node_pairs = self.get_node_pairs(cluster_state, nodes)
+        replaced_nodes = 0
+        with ThreadPoolExecutor(max_workers=self.__migration_concurrency) as executor:
+            futures = list(map(lambda x: executor.submit(self.replace_node, *x), node_pairs))
+            for future in futures:
+                future.result()
+                replaced_nodes += 1
+                self._report_progress(ADD_NEW_NODES_PHASE, 'nodes-replaced', replaced_nodes, len(node_pairs))
 
-                        logging.info('Adding replica for collection [{}], shard [{}] on node [{}]'.format(
-                            collection_name, shard_name, node_name))
-                        self.add_replica_to_cluster(collection_name, shard_name, node_name)
+    def replace_node(self, source_node: str, target_node: str):
+        logging.info('Replacing node [{}] with node [{}]'.format(source_node, target_node))
+        url = self._api_url + '?action=REPLACENODE'
+        url += '&sourceNode=' + source_node
+        url += '&targetNode=' + target_node
+        request_id = self._submit_async_request(url)
+        self._wait_for_async_request(request_id, self.__add_node_timeout, self.__add_node_retry_wait)
+        logging.info('Replaced node [{}] with node [{}]'.format(source_node, target_node))
 
-                shard_counter += 1
+    @staticmethod
+    def get_node_pairs(cluster_state: dict, nodes: list):
+        """
+        Pair every node hosting replicas that is not one of the given new nodes with a new node. Returns a list of
+        (old node name, new node name) tuples.
+        """
+        new_node_names = list(map(lambda x: x + ':8983_solr', sorted(nodes)))
+        old_node_names = set()
+        for collection_values in cluster_state['cluster']['collections'].values():
+            for shard_values in collection_values['shards'].values():
+                for replica_values in shard_values['replicas'].values():
+                    if replica_values['node_name'] not in new_node_names:
+                        old_node_names.add(replica_values['node_name'])
+        if len(old_node_names) > len(new_node_names):
+            raise Exception('Not enough new nodes to replace old nodes: [{}]<[{}]'.format(
+                len(new_node_names), len(old_node_names)))
+        return list(zip(sorted(old_node_names), new_node_names))
+
+    def __add_missing_replicas(self, cluster_state: dict, cluster_layout: dict, nodes: list):
+        # Add nodes to cluster
+        missing_replicas = self.get_missing_replicas(cluster_state, cluster_layout, nodes)
+        pending_replicas = deque()
+        active_replicas = 0
+        deadline = time.time() + self.__add_node_timeout
+        for index, (collection_name, shard_name, node_name) in enumerate(missing_replicas):
+            logging.info('Adding replica for collection [{}], shard [{}] on node [{}]'.format(
+                collection_name, shard_name, node_name))
+            if self.__wait_for_final_state:
+                # The concurrency limiter bounds the number of replicas recovering at the same time
+                while pending_replicas and self._concurrency_limiter and not self._concurrency_limiter.has_capacity():
+                    self.__wait_for_replica_to_be_added(pending_replicas.popleft(), deadline)
+                    active_replicas += 1
+                    self._report_progress(ADD_NEW_NODES_PHASE, 'replicas-active', active_replicas,
+                                          len(missing_replicas))
+                request_id = self.submit_replica_to_cluster(collection_name, shard_name, node_name)
+                pending_replicas.append((request_id, (collection_name, shard_name, node_name)))
+            else:
+                self.add_replica_to_cluster(collection_name, shard_name, node_name)
+                self.__journal_replica(collection_name, shard_name, node_name)
+            self._report_progress(ADD_NEW_NODES_PHASE, 'replicas-added', index + 1, len(missing_replicas))
+
+        # Replicas added by an earlier attempt of a resumed deployment have no request to wait for
+        if pending_replicas and self.are_all_replicas_active(cluster_state):
+            while pending_replicas:
+                self.__wait_for_replica_to_be_added(pending_replicas.popleft(), deadline)
+                active_replicas += 1
+                self._report_progress(ADD_NEW_NODES_PHASE, 'replicas-active', active_replicas, len(missing_replicas))
+            return
 
         # Wait for all replicas being active in cluster
         timer = 0
         all_replicas_active = False
+        recovery_monitor = RecoveryMonitor(self.__recovery_stall_timeout) if self.__monitor_recovery else None
         while not all_replicas_active and timer < self.__add_node_timeout:
             cluster_state = self.get_cluster_state()
-            all_replicas_active = True
-            for collection_name, collection_values in cluster_state['cluster']['collections'].items():
-                for shard_name, shard_values in collection_values['shards'].items():
-                    for replica_name, replica_values in shard_values['replicas'].items():
-                        if replica_values['state'] != 'active':
-                            all_replicas_active = False
-                            break
+            all_replicas_active = self.are_all_replicas_active(cluster_state)
+            if not all_replicas_active and recovery_monitor:
+                self.monitor_recoveries(recovery_monitor, cluster_state, missing_replicas)
+            if self._progress_reporter:
+                active_replicas = len(list(filter(lambda x: self.is_replica_active(cluster_state, *x),
+                                                  missing_replicas)))
+                self._report_progress(ADD_NEW_NODES_PHASE, 'replicas-active', active_replicas, len(missing_replicas))
             if not all_replicas_active:
-                time.sleep(self.__add_node_retry_wait)
+                self._count(POLL_ITERATIONS, loop='replicas-active')
+                self._sleep(self.__add_node_retry_wait)
                 timer += self.__add_node_retry_wait
                 sys.stdout.write('.')
                 sys.stdout.flush()
         if timer >= self.__add_node_timeout:
             raise Exception('Timeout while adding new nodes to cluster')
+        while pending_replicas:
+            self.__wait_for_replica_to_be_added(pending_replicas.popleft(), deadline)
 
-    def delete_old_nodes_from_cluster(self):
+    def __wait_for_replica_to_be_added(self, submitted_replica: tuple, deadline: float):
+        """
+        Wait for the asynchronous ADDREPLICA request of a (request id, replica) tuple. A replica is only recorded in the
+        journal once Solr reports it as active.
+        """
+        request_id, replica = submitted_replica
+        self._wait_for_async_request(request_id, max(deadline - time.time(), 0), self.__add_node_retry_wait)
+        self.__journal_replica(*replica)
+
+    def __journal_replica(self, collection_name: str, shard_name: str, node_name: str):
+        if self.__journal:
+            self.__journal.add_replica(collection_name, shard_name, node_name)
+
+    @contextmanager
+    def limit_replication_rate(self, cluster_state: dict):
+        """
+        Cap the replication rate of all collections while new replicas are recovering, so that the old nodes serving
+        traffic keep enough network and disk bandwidth. The previous values are restored when the context is left.
+        The cap is set only once, because every change of a user property reloads all cores of the collection.
+        """
+        if not self.__replication_max_rate:
+            yield
+            return
+        collection_names = list(cluster_state['cluster']['collections'].keys())
+        previous_rates = OrderedDict()
+        for collection_name in collection_names:
+            previous_rates[collection_name] = self.get_user_property(collection_name, REPLICATION_RATE_PROPERTY)
+        try:
+            self.set_replication_rate(collection_names, self.__replication_max_rate)
+            yield
+        finally:
+            for collection_name, previous_rate in previous_rates.items():
+                logging.info('Restoring replication rate of collection [{}]'.format(collection_name))
+                self.set_user_property(collection_name, REPLICATION_RATE_PROPERTY, previous_rate)
+
+    def set_replication_rate(self, collection_names: list, rate: float):
+        for collection_name in collection_names:
+            self.set_user_property(collection_name, REPLICATION_RATE_PROPERTY, str(round(rate, 1)))
+
+    def get_user_property(self, collection_name: str, name: str):
+        url = self.__get_collection_config_url(collection_name) + '/overlay?wt=json'
+        overlay = json.loads(self._send_request(url))
+        return overlay.get('overlay', dict()).get('userProps', dict()).get(name)
+
+    def set_user_property(self, collection_name: str, name: str, value: str = None):
+        """
+        Set a user property of a collection with the Config API or remove it if the value is None.
+        """
+        if value is None:
+            data = {'unset-user-property': name}
+        else:
+            data = {'set-user-property': {name: value}}
+        self._send_request(self.__get_collection_config_url(collection_name), data)
+
+    def __get_collection_config_url(self, collection_name: str):
+        return self._api_url[:-len(COLLECTIONS_API_PATH)] + COLLECTION_CONFIG_PATH.format(collection_name)
+
+    def monitor_recoveries(self, recovery_monitor: RecoveryMonitor, cluster_state: dict, replicas: list):
+        """
+        Sample the index replication of all given replicas that are recovering and log the transfer rates per replica,
+        node and collection. Fails if the replication of a replica has not progressed within the stall timeout.
+        """
+        recovering_cores = self.get_recovering_cores(cluster_state, replicas)
+        recovery_monitor.retain(list(map(lambda x: (x[1], x[2]), recovering_cores)))
+        for collection_name, node, core in recovering_cores:
+            try:
+                details = json.loads(self._send_request(CORE_REPLICATION_DETAILS_URL.format(node, core)))
+            except Exception as e:
+                logging.warning('Could not get replication details of core [{}] on node [{}]: {}'.format(
+                    core, node, e))
+                continue
+            status = recovery_monitor.update(collection_name, node, core,
+                                             RecoveryMonitor.parse_replication_details(details))
+            if status.bytes_downloaded is not None:
+                logging.info('Recovering core [{}] on node [{}]: [{}] of [{}] bytes, [{}] bytes/s, ETA [{}]s'.format(
+                    core, node, status.bytes_downloaded, status.bytes_to_download,
+                    int(status.rate) if status.rate is not None else '-',
+                    status.eta_seconds if status.eta_seconds is not None else '-'))
+        for node, rate in recovery_monitor.get_rates_by_node().items():
+            logging.info('Recovery rate of node [{}]: [{}] bytes/s'.format(node, int(rate)))
+        for collection_name, rate in recovery_monitor.get_rates_by_collection().items():
+            logging.info('Recovery rate of collection [{}]: [{}] bytes/s'.format(collection_name, int(rate)))
+
+        downloads = list(filter(lambda x: x.bytes_to_download, recovery_monitor.get_status()))
+        if downloads:
+            self._report_progress(ADD_NEW_NODES_PHASE, 'bytes-recovered', sum(map(lambda x: x.bytes_downloaded,
+                                                                                  downloads)),
+                                  sum(map(lambda x: x.bytes_to_download, downloads)))
+
+        stalled_replicas = recovery_monitor.get_stalled_replicas()
+        if stalled_replicas:
+            raise Exception('Recovery of replicas has not progressed for more than [{}]s: [{}]'.format(
+                self.__recovery_stall_timeout, ', '.join(map(lambda x: '{} on {}'.format(x.core, x.node),
+                                                             stalled_replicas))))
+
+    @staticmethod
+    def get_recovering_cores(cluster_state: dict, replicas: list):
+        """
+        Find the cores of the given (collection, shard, node name) replicas that are not active yet. Returns a list of
+        (collection, node, core) tuples.
+        """
+        recovering_cores = list()
+        for collection_name, shard_name, node_name in replicas:
+            collection = cluster_state['cluster']['collections'].get(collection_name, dict())
+            shard_replicas = collection.get('shards', dict()).get(shard_name, dict()).get('replicas', dict())
+            for replica_values in shard_replicas.values():
+                if replica_values['node_name'] == node_name and replica_values['state'] != 'active':
+                    recovering_cores.append((collection_name, node_name.replace(':8983_solr', ''),
+                                             replica_values['core']))
+        return recovering_cores
+
+    def warm_up_new_nodes(self):
+        """
+        Fill the caches of all replicas on the new nodes by sending the queries of the warm-up query file to each
+        replica directly. Without a target warm-up time every query is sent once to every replica, otherwise the
+        queries are repeated until the time is over.
+        """
+        if not self.__warm_up_query_file:
+            logging.info('No warm-up queries given, skipping warm-up of new nodes')
+            return
+        queries = QueryRunner.load_queries(self.__warm_up_query_file)
         nodes = self.get_cluster_nodes(self._stack_name, self.get_passive_stack_version())
+        cores = self.get_cores_on_nodes(self.get_cluster_state(), nodes)
+
+        results = QueryRunner(self._send_request, self.__warm_up_concurrency).run(
+            self.get_core_query_urls(cores, queries), self.__warm_up_time)
+        logging.info('Sent [{}] warm-up queries to [{}] replicas in [{:.1f}]s, [{}] queries failed'.format(
+            results.get_number_of_queries(), len(cores), results.get_duration(), results.get_number_of_errors()))
+
+    @staticmethod
+    def get_cores_on_nodes(cluster_state: dict, nodes: list):
+        """
+        Find the cores of all replicas on the given nodes. Returns a list of (collection, node, core) tuples.
+        """
+        node_ips = set(nodes)
+        cores = list()
+        for collection_name, collection_values in cluster_state['cluster']['collections'].items():
+            for shard_values in collection_values['shards'].values():
+                for replica_values in shard_values['replicas'].values():
+                    node_ip = replica_values['node_name'].replace(':8983_solr', '')
+                    if node_ip in node_ips:
+                        cores.append((collection_name, node_ip, replica_values['core']))
+        return cores
+
+    @staticmethod
+    def get_core_query_urls(cores: list, queries: dict):
+        """
+        URLs sending every query of a collection to every core of the collection without distributing it to other
+        replicas. Each query is sent to all cores before the next query, so that the cores are warmed up evenly.
+        """
+        urls = list()
+        for collection_name, collection_queries in queries.items():
+            collection_cores = list(filter(lambda x: x[0] == collection_name, cores))
+            for parameters in collection_queries:
+                for _, node, core in collection_cores:
+                    urls.append(CORE_QUERY_URL.format(node, core, parameters))
+        return urls
+
+    def benchmark_new_nodes(self):
+        """
+        Send the queries of the benchmark query file to the replicas on the old nodes and then to the replicas on the
+        new nodes for the same time and with the same concurrency. Traffic must not be switched if the new nodes are
+        slower than the old nodes by more than the benchmark tolerance.
+        """
+        if not self.__benchmark_query_file:
+            logging.info('No benchmark queries given, skipping benchmark of new nodes')
+            return
+        queries = QueryRunner.load_queries(self.__benchmark_query_file)
+        new_stack_version = self.get_passive_stack_version()
+        old_stack_version = self._senza.get_active_stack_version(self._stack_name)
+        cluster_state = self.get_cluster_state()
+
+        results = dict()
+        for stack_version in [old_stack_version, new_stack_version]:
+            cores = self.get_cores_on_nodes(cluster_state, self.get_cluster_nodes(self._stack_name, stack_version))
+            results[stack_version] = QueryRunner(self._send_request, self.__benchmark_concurrency).run(
+                self.get_core_query_urls(cores, queries), self.__benchmark_time)
+            logging.info('Benchmark of stack [{}] version [{}]: {}'.format(
+                self._stack_name, stack_version, self.get_benchmark_summary(results[stack_version])))
+
+        regressions = self.get_benchmark_regressions(results[old_stack_version], results[new_stack_version],
+                                                     self.__benchmark_tolerance)
+        if regressions:
+            raise Exception('Stack [{}] version [{}] is slower than version [{}]: {}'.format(
+                self._stack_name, new_stack_version, old_stack_version, ', '.join(regressions)))
+
+    @staticmethod
+    def get_benchmark_summary(results: QueryResults):
+        return ', '.join(['p{} [{:.1f}]ms'.format(x, results.get_percentile(x)) for x in BENCHMARK_PERCENTILES] + [
+            'throughput [{:.1f}]/s'.format(results.get_throughput()),
+            'errors [{}]'.format(results.get_number_of_errors())])
+
+    @staticmethod
+    def get_benchmark_regressions(old_results: QueryResults, new_results: QueryResults, tolerance: float):
+        """
+        Latency percentiles of the new nodes above and throughput below the ones of the old nodes by more than the
+        tolerance. Failed queries on the new nodes are a regression if the old nodes answered all queries. Without a
+        baseline, i.e. if the old nodes answered no queries, the new nodes can not be compared and fail the benchmark.
+        """
+        if old_results.get_number_of_queries() == 0:
+            return ['no baseline, old nodes answered no queries']
+        if new_results.get_number_of_queries() == 0:
+            return ['no successful queries']
+        regressions = list()
+        for percentile in BENCHMARK_PERCENTILES:
+            old_latency = old_results.get_percentile(percentile)
+            new_latency = new_results.get_percentile(percentile)
+            if new_latency > old_latency * (1 + tolerance):
+                regressions.append('p{} latency [{:.1f}]ms > [{:.1f}]ms'.format(percentile, new_latency, old_latency))
+        old_throughput = old_results.get_throughput()
+        new_throughput = new_results.get_throughput()
+        if new_throughput < old_throughput * (1 - tolerance):
+            regressions.append('throughput [{:.1f}]/s < [{:.1f}]/s'.format(new_throughput, old_throughput))
+        if new_results.get_number_of_errors() and not old_results.get_number_of_errors():
+            regressions.append('[{}] failed queries'.format(new_results.get_number_of_errors()))
+        return regressions
+
+    def __verify_number_of_nodes(self, cluster_layout: dict, nodes: list):
+        required_nodes = self.get_required_number_of_nodes(cluster_layout)
+        if len(nodes) < required_nodes:
+            raise Exception('Not enough instances for current cluster layout: [{}]<[{}]'.format(
+                len(nodes), required_nodes))
+        logging.info('Cluster layout requires [{}] replicas on [{}] nodes'.format(
+            sum(map(lambda x: len(x.shards) * x.replication_factor, cluster_layout.values())), len(nodes)))
+
+    def plan_migration(self):
+        plan = self.create_migration_plan()
+        plan.save(self.__migration_plan_file)
+        print(plan.get_summary())
+
+    def apply_migration(self):
+        self.apply_migration_plan(MigrationPlan.load(self.__migration_plan_file))
+
+    def create_migration_plan(self):
+        """
+        Compute all operations for migrating the cluster to the new stack version from one snapshot of the cluster
+        state: adding the missing replicas on the new nodes, switching traffic once all of them are active and deleting
+        every replica on other nodes once its shard has all new replicas and traffic has been switched.
+        """
+        stack_version = self.get_passive_stack_version()
+        nodes = self.get_cluster_nodes(self._stack_name, stack_version)
         cluster_state = self.get_cluster_state()
+        cluster_layout = self.discover_cluster_layout(cluster_state)
+        self.__verify_number_of_nodes(cluster_layout, nodes)
 
+        plan = MigrationPlan(self._stack_name, stack_version)
+        shard_additions = dict()
+        for collection_name, shard_name, node_name in self.get_missing_replicas(cluster_state, cluster_layout, nodes):
+            shard_additions.setdefault((collection_name, shard_name), list()).append(
+                plan.add_replica(collection_name, shard_name, node_name))
+        switch_traffic = plan.switch_traffic(sum(shard_additions.values(), list()))
+
+        new_node_names = list(map(lambda x: x + ':8983_solr', nodes))
         for collection_name, collection_values in cluster_state['cluster']['collections'].items():
             for shard_name, shard_values in collection_values['shards'].items():
                 for replica_name, replica_values in shard_values['replicas'].items():
-                    node_ip = replica_values['node_name'].replace(':8983_solr', '')
-                    if node_ip in nodes:
-                        # Check whether shard has an active leader and at least two active nodes before going on
-                        logging.info('Checking for active nodes and leader in shard [{}] of collection [{}]'.format(
-                            shard_name, collection_name))
+                    if replica_values['node_name'] not in new_node_names:
+                        plan.delete_replica(collection_name, shard_name, replica_name, replica_values['node_name'],
+                                            shard_additions.get((collection_name, shard_name), []) + [switch_traffic])
+        return plan
+
+    def apply_migration_plan(self, plan: MigrationPlan):
+        """
+        Execute all operations of the plan as soon as the operations they depend on are complete, running up to the
+        configured number of operations in parallel. An added replica is complete when it is active.
+        """
+        if plan.get_stack_name() != self._stack_name:
+            raise Exception('Migration plan is for stack [{}], not for [{}]'.format(
+                plan.get_stack_name(), self._stack_name))
+        # A plan created before another deployment or switch of traffic would route traffic to the wrong stack version
+        passive_stack_version = self.get_passive_stack_version()
+        if plan.get_stack_version() != passive_stack_version:
+            raise Exception('Migration plan is for stack version [{}], but the passive stack version is [{}], create a '
+                            'new plan'.format(plan.get_stack_version(), passive_stack_version))
+        pending = OrderedDict(map(lambda x: (x['id'], x), plan.get_operations()))
+        running = dict()
+        activating = OrderedDict()
+        completed = set()
+        timer = 0
+        with ThreadPoolExecutor(max_workers=self.__migration_concurrency) as executor:
+            while pending or running or activating:
+                self._report_progress('apply', 'operations-completed', len(completed), len(plan.get_operations()))
+                for operation_id, operation in list(pending.items()):
+                    if all(map(lambda x: x in completed, operation['depends_on'])):
+                        logging.info('Executing operation [{}]'.format(operation_id))
+                        running[executor.submit(self.__execute_operation, plan, operation)] = operation
+                        del pending[operation_id]
+                if pending and not running and not activating:
+                    raise Exception('Migration plan has unresolvable dependencies: [{}]'.format(
+                        ', '.join(pending.keys())))
+
+                if running:
+                    finished, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED,
+                                       timeout=self.__add_node_retry_wait if activating else None)
+                    for future in finished:
+                        operation = running.pop(future)
+                        future.result()
+                        if operation['action'] == ADD_REPLICA:
+                            activating[operation['id']] = operation
+                        else:
+                            completed.add(operation['id'])
+
+                if activating:
+                    cluster_state = self.get_cluster_state()
+                    for operation_id, operation in list(activating.items()):
+                        if self.is_replica_active(cluster_state, operation['collection'], operation['shard'],
+                                                  operation['node']):
+                            completed.add(operation_id)
+                            del activating[operation_id]
+                    if activating and not running:
+                        if timer >= self.__add_node_timeout:
+                            raise Exception('Timeout while waiting for replicas to become active: [{}]'.format(
+                                ', '.join(activating.keys())))
+                        self._count(POLL_ITERATIONS, loop='replicas-active')
+                        self._sleep(self.__add_node_retry_wait)
+                        timer += self.__add_node_retry_wait
+                        sys.stdout.write('.')
+                        sys.stdout.flush()
+        self._report_progress('apply', 'operations-completed', len(completed), len(plan.get_operations()))
+
+    def __execute_operation(self, plan: MigrationPlan, operation: dict):
+        if operation['action'] == ADD_REPLICA:
+            self.add_replica_to_cluster(operation['collection'], operation['shard'], operation['node'])
+        elif operation['action'] == DELETE_REPLICA:
+            self.delete_replica_from_cluster(operation['collection'], operation['shard'], operation['replica'])
+        elif operation['action'] == SWITCH_TRAFFIC:
+            self._senza.switch_traffic(self._stack_name, plan.get_stack_version(), 100)
+        else:
+            raise Exception('Unknown operation in migration plan: [{}]'.format(operation['action']))
 
-                        self.verify_shard_health(collection_name, shard_name)
+    @staticmethod
+    def are_all_replicas_active(cluster_state: dict):
+        for collection_values in cluster_state['cluster']['collections'].values():
+            for shard_values in collection_values['shards'].values():
+                for replica_values in shard_values['replicas'].values():
+                    if replica_values['state'] != 'active':
+                        return False
+        return True
 
-                        logging.info('INFO Deleting replica [{}] for collection [{}] and shard [{}]'.format(
-                            replica_name, collection_name, shard_name))
-                        self.delete_replica_from_cluster(collection_name, shard_name, replica_name)
+    @staticmethod
+    def is_replica_active(cluster_state: dict, collection_name: str, shard_name: str, node_name: str):
+        collection = cluster_state['cluster']['collections'].get(collection_name, dict())
+        replicas = collection.get('shards', dict()).get(shard_name, dict()).get('replicas', dict())
+        return len(list(filter(lambda x: x['node_name'] == node_name and x['state'] == 'active',
+                               replicas.values()))) > 0
+
+    def delete_old_nodes_from_cluster(self):
+        nodes = self.get_cluster_nodes(self._stack_name, self.get_passive_stack_version())
+        cluster_state = self.get_cluster_state()
+        if self.__delete_nodes_in_bulk:
+            if self.delete_nodes_in_bulk(cluster_state, nodes):
+                return
+            cluster_state = self.get_cluster_state()
+
+        replicas_on_nodes = self.get_replicas_on_nodes(cluster_state, nodes)
+        number_of_replicas = sum(map(len, replicas_on_nodes.values()))
+        deleted_replicas = 0
+        for (collection_name, shard_name), replica_names in replicas_on_nodes.items():
+            for replica_name in replica_names:
+                # Check whether shard has an active leader and at least two active nodes before going on
+                logging.info('Checking for active nodes and leader in shard [{}] of collection [{}]'.format(
+                    shard_name, collection_name))
 
                 self.verify_shard_health(collection_name, shard_name)
 
+                logging.info('INFO Deleting replica [{}] for collection [{}] and shard [{}]'.format(
+                    replica_name, collection_name, shard_name))
+                self.delete_replica_from_cluster(collection_name, shard_name, replica_name)
+                deleted_replicas += 1
+                self._report_progress(DELETE_OLD_NODES_PHASE, 'replicas-deleted', deleted_replicas,
+                                      number_of_replicas)
+
+            self.verify_shard_health(collection_name, shard_name)
+
+    def delete_nodes_in_bulk(self, cluster_state: dict, nodes: list):
+        """
+        Delete all replicas of the given nodes with one DELETENODE request per node, sent in parallel, if every shard
+        keeps at least two active replicas on other nodes. Returns False without deleting anything if a shard would
+        not keep enough replicas or if deleting a node failed, so that the remaining replicas are deleted one by one.
+        """
+        shards_at_risk = self.get_unhealthy_shards(cluster_state, nodes)
+        if shards_at_risk:
+            logging.info('Deleting replicas one by one, shards without enough active replicas on other nodes: '
+                         '[{}]'.format(', '.join(map(lambda x: '{}/{}'.format(*x), shards_at_risk))))
+            return False
+
+        node_ips = set(nodes)
+        node_names = sorted(set(filter(lambda x: x.replace(':8983_solr', '') in node_ips, map(
+            lambda x: x['node_name'], self.__get_replicas(cluster_state)))))
+        failed_nodes = list()
+        with ThreadPoolExecutor(max_workers=self.__migration_concurrency) as executor:
+            futures = list(map(lambda x: (x, executor.submit(self.delete_node, x)), node_names))
+            for index, (node_name, future) in enumerate(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.warning('Failed deleting node [{}]: {}'.format(node_name, e))
+                    failed_nodes.append(node_name)
+                self._report_progress(DELETE_OLD_NODES_PHASE, 'nodes-deleted', index + 1, len(node_names))
+        if failed_nodes:
+            logging.warning('Deleting remaining replicas of nodes [{}] one by one'.format(', '.join(failed_nodes)))
+            return False
+
+        self.wait_for_healthy_shards()
+        return True
+
+    def delete_node(self, node_name: str):
+        logging.info('Deleting all replicas of node [{}]'.format(node_name))
+        request_id = self._submit_async_request(self._api_url + '?action=DELETENODE&node=' + node_name)
+        self._wait_for_async_request(request_id, self.__add_node_timeout, self.__add_node_retry_wait)
+
+    def wait_for_healthy_shards(self):
+        unhealthy_shards = list()
+        for _ in range(self.__leader_check_retry_count + 1):
+            unhealthy_shards = self.get_unhealthy_shards(self.get_cluster_state())
+            if not unhealthy_shards:
+                return
+            self._count(POLL_ITERATIONS, loop='shard-health')
+            self._sleep(self.__leader_check_retry_wait)
+        raise Exception('Shards without active leader or enough active nodes: [{}]'.format(
+            ', '.join(map(lambda x: '{}/{}'.format(*x), unhealthy_shards))))
+
+    @staticmethod
+    def get_unhealthy_shards(cluster_state: dict, nodes: list = None):
+        """
+        Find the shards with less than two active replicas outside the given nodes. Without nodes, shards without an
+        active leader are unhealthy as well; Solr elects a new leader when the replicas on the given nodes are deleted.
+        Returns a list of (collection, shard) tuples.
+        """
+        node_ips = set(nodes or list())
+        unhealthy_shards = list()
+        for collection_name, collection_values in cluster_state['cluster']['collections'].items():
+            for shard_name, shard_values in collection_values['shards'].items():
+                active_replicas = list(filter(
+                    lambda x: x['state'] == 'active' and x['node_name'].replace(':8983_solr', '') not in node_ips,
+                    shard_values['replicas'].values()))
+                has_active_leader = shard_values.get('state') == 'active' and any(
+                    map(lambda x: x.get('leader') in [True, 'true'], active_replicas))
+                if len(active_replicas) < 2 or (not nodes and not has_active_leader):
+                    unhealthy_shards.append((collection_name, shard_name))
+        return unhealthy_shards
+
+    @staticmethod
+    def __get_replicas(cluster_state: dict):
+        for collection_values in cluster_state['cluster']['collections'].values():
+            for shard_values in collection_values['shards'].values():
+                for replica_values in shard_values['replicas'].values():
+                    yield replica_values
+
+    @staticmethod
+    def get_replicas_on_nodes(cluster_state: dict, nodes: list):
+        """
+        Find the replicas located on the given nodes. Returns an ordered mapping from (collection, shard) to the names
+        of the matching replicas, containing every shard of the cluster.
+        """
+        node_ips = set(nodes)
+        replicas_on_nodes = OrderedDict()
+        for collection_name, collection_values in cluster_state['cluster']['collections'].items():
+            for shard_name, shard_values in collection_values['shards'].items():
+                replicas_on_nodes[(collection_name, shard_name)] = list(map(
+                    lambda x: x[0], filter(lambda x: x[1]['node_name'].replace(':8983_solr', '') in node_ips,
+                                           shard_values['replicas'].items())))
+        return replicas_on_nodes
+
+    def submit_replica_to_cluster(self, collection_name: str, shard_name: str, node_name: str):
+        """
+        Submit an asynchronous ADDREPLICA request, which Solr completes once the new replica is active. Returns the id
+        of the request.
+        """
+        url = self.__get_add_replica_url(collection_name, shard_name, node_name) + '&waitForFinalState=true'
+        try:
+            return self._submit_async_request(url)
+        except Exception as e:
+            raise Exception('Failed sending request to Solr [{}]: {}'.format(url, e))
+
     def add_replica_to_cluster(self, collection_name: str, shard_name: str, node_name: str):
-        url = self._api_url + '?action=ADDREPLICA'
-        url += '&collection=' + collection_name
-        url += '&shard=' + shard_name
-        url += '&node=' + node_name
+        url = self.__get_add_replica_url(collection_name, shard_name, node_name)
         retry = True
         retry_count = 0
         while retry and retry_count <= self.__add_node_retry_count:
             try:
-                headers = dict()
-                headers['Authorization'] = 'Bearer ' + self._oauth_token
-                request = urllib.request.Request(url, headers=headers)
-                response = urllib.request.urlopen(request)
-                code = response.getcode()
-                response.close()
-                if code != 200:
-                    raise Exception('Received unexpected status code from Solr: [{}]'.format(code))
+                self._send_request(url)
                 retry = False
             except urllib.error.HTTPError as e:
                 if e.code == 504:
@@ -213,26 +990,26 @@ class ClusterDeploymentController(ClusterController):
                     raise Exception('Failed sending request to Solr [{}]: {}'.format(url, e))
             except Exception as e:
                 raise Exception('Failed sending request to Solr [{}]: {}'.format(url, e))
-            finally:
-                if retry:
-                    time.sleep(self.__add_node_retry_wait)
-                    retry_count += 1
+            if retry:
+                self._retry('ADDREPLICA')
+                self._sleep(self.__add_node_retry_wait)
+                retry_count += 1
         return 0
 
+    def __get_add_replica_url(self, collection_name: str, shard_name: str, node_name: str):
+        url = self._api_url + '?action=ADDREPLICA'
+        url += '&collection=' + collection_name
+        url += '&shard=' + shard_name
+        url += '&node=' + node_name
+        return url
+
     def delete_replica_from_cluster(self, collection: str, shard: str, replica: str):
         url = self._api_url + '?action=DELETEREPLICA'
         url += '&collection=' + collection
         url += '&shard=' + shard
         url += '&replica=' + replica
         try:
-            headers = dict()
-            headers['Authorization'] = 'Bearer ' + self._oauth_token
-            request = urllib.request.Request(url, headers=headers)
-            response = urllib.request.urlopen(request)
-            code = response.getcode()
-            response.close()
-            if code != 200:
-                raise Exception('Received unexpected status code from Solr: [{}]'.format(code))
+            self._send_request(url)
         except urllib.error.HTTPError as e:
             if e.code == 504:
                 logging.warning('HTTP Timeout while deleting replica [{}], but replica should have been deleted '
@@ -248,7 +1025,91 @@ class ClusterDeploymentController(ClusterController):
         return sorted(self._senza.get_stack_instances(stack_name, stack_version))
 
     def switch_traffic(self):
-        self._senza.switch_traffic(self._stack_name, self.get_passive_stack_version(), 100)
+        if self.__traffic_ramp:
+            self.ramp_traffic(self.get_passive_stack_version())
+        else:
+            self._senza.switch_traffic(self._stack_name, self.get_passive_stack_version(), 100)
+
+    def ramp_traffic(self, stack_version: str):
+        """
+        Shift traffic to the new stack version step by step. After each step the query latency and error rate of the
+        new nodes are sampled. The ramp pauses while they exceed their thresholds and traffic is switched back to the
+        old stack version if they still exceed them after the maximum number of pauses.
+        """
+        nodes = self.get_cluster_nodes(self._stack_name, stack_version)
+        previous_metrics = self.get_query_metrics(nodes)
+        for weight in self.__traffic_ramp:
+            logging.info('Switching [{}]% of traffic to stack [{}] version [{}]'.format(
+                weight, self._stack_name, stack_version))
+            self._senza.switch_traffic(self._stack_name, stack_version, weight)
+            self._report_progress(SWITCH_TRAFFIC_PHASE, 'traffic-percent', weight, 100)
+            if weight == 100:
+                break
+
+            pauses = 0
+            while True:
+                self._sleep(self.__ramp_step_wait)
+                current_metrics = self.get_query_metrics(nodes)
+                p99_latency, error_rate = self.get_query_health(previous_metrics, current_metrics)
+                # Nodes that could not be sampled keep their previous sample for the next step
+                previous_metrics = dict(previous_metrics)
+                previous_metrics.update(current_metrics)
+                # Without metrics of every new node their health is unknown, which fails the step
+                if (len(current_metrics) == len(nodes) and p99_latency <= self.__ramp_max_p99_latency and
+                        error_rate <= self.__ramp_max_error_rate):
+                    break
+                if pauses >= self.__ramp_max_pauses:
+                    logging.error('Rolling back traffic of stack [{}] version [{}] at [{}]%'.format(
+                        self._stack_name, stack_version, weight))
+                    self._senza.switch_traffic(self._stack_name, stack_version, 0)
+                    raise Exception('Traffic ramp to stack [{}] version [{}] rolled back at [{}]%: p99 latency '
+                                    '[{}]ms, error rate [{}], sampled nodes [{}/{}]'.format(
+                                        self._stack_name, stack_version, weight, p99_latency, error_rate,
+                                        len(current_metrics), len(nodes)))
+                pauses += 1
+                logging.warning('Pausing traffic ramp at [{}]%: p99 latency [{}]ms, error rate [{}], sampled nodes '
+                                '[{}/{}]'.format(weight, p99_latency, error_rate, len(current_metrics), len(nodes)))
+
+    def get_query_metrics(self, nodes: list):
+        """
+        Sample the number of queries, errors and the p99 query latency of all cores of the given nodes.
+        """
+        query_metrics = dict()
+        for node in nodes:
+            try:
+                query_metrics[node] = self.parse_query_metrics(
+                    json.loads(self._send_request(NODE_QUERY_METRICS_URL.format(node))))
+            except Exception as e:
+                logging.warning('Could not sample query metrics of node [{}]: {}'.format(node, e))
+        return query_metrics
+
+    @staticmethod
+    def parse_query_metrics(metrics: dict):
+        requests = 0
+        errors = 0
+        p99_latency = 0
+        for registry_name, registry in metrics.get('metrics', dict()).items():
+            if not registry_name.startswith('solr.core.'):
+                continue
+            request_times = registry.get('QUERY./select.requestTimes', dict())
+            requests += request_times.get('count', 0)
+            p99_latency = max(p99_latency, request_times.get('p99_ms', 0))
+            errors += registry.get('QUERY./select.errors', dict()).get('count', 0)
+        return QueryMetrics(requests=requests, errors=errors, p99_latency=p99_latency)
+
+    @staticmethod
+    def get_query_health(previous_metrics: dict, current_metrics: dict):
+        """
+        Highest p99 latency of all nodes and error rate of the queries between two samples.
+        """
+        requests = 0
+        errors = 0
+        for node, metrics in current_metrics.items():
+            previous = previous_metrics.get(node, QueryMetrics(requests=0, errors=0, p99_latency=0))
+            requests += max(metrics.requests - previous.requests, 0)
+            errors += max(metrics.errors - previous.errors, 0)
+        p99_latency = max(map(lambda x: x.p99_latency, current_metrics.values()), default=0)
+        return p99_latency, errors / requests if requests else 0
 
     def verify_shard_health(self, collection_name: str, shard_name: str):
         # Verify that shard has an active leader and at least two active nodes
@@ -262,7 +1123,8 @@ class ClusterDeploymentController(ClusterController):
                                                              shard_name)
             active_nodes_in_shard = self.get_number_of_active_nodes(current_cluster_state,
                                                                     collection_name, shard_name)
-            time.sleep(self.__leader_check_retry_wait)
+            self._count(POLL_ITERATIONS, loop='shard-health')
+            self._sleep(self.__leader_check_retry_wait)
             retries += 1
 
         if not shard_has_active_leader:
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 60
+DEFAULT_RETRY_BUDGET = 50
+# Retries earned back by every successful request, up to the initial retry budget
+RETRY_BUDGET_DEPOSIT = 0.1
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Guards a Solr endpoint shared by all controllers of a run. After the failure threshold of consecutive failed
+    requests the circuit opens and requests fail fast or, if waiting is enabled, wait together until the reset timeout
+    is over. Then a single probe request is let through (half-open): if it succeeds the circuit closes, otherwise it
+    opens again and all waiting requests fail. Retries of all operations are taken from one retry budget, which
+    successful requests slowly refill.
+    """
+
+    __name = ''
+    __failure_threshold = DEFAULT_FAILURE_THRESHOLD
+    __reset_timeout = DEFAULT_RESET_TIMEOUT
+    __retry_budget = DEFAULT_RETRY_BUDGET
+    __wait = False
+    __state = CLOSED
+    __failures = 0
+    __opened_at = 0
+    __retries = 0
+    __condition = None
+
+    def __init__(self, name: str, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT, retry_budget: int = DEFAULT_RETRY_BUDGET,
+                 wait: bool = False):
+        self.__name = name
+        self.__failure_threshold = failure_threshold
+        self.__reset_timeout = reset_timeout
+        self.__retry_budget = retry_budget
+        self.__retries = retry_budget
+        self.__wait = wait
+        self.__condition = threading.Condition()
+
+    def get_state(self):
+        return self.__state
+
+    def get_remaining_retries(self):
+        return int(self.__retries)
+
+    def before_request(self):
+        """
+        Raise a CircuitOpenError if the circuit is open, unless this request is the probe of a half-open circuit.
+        Returns True if the request is the probe.
+        """
+        with self.__condition:
+            if self.__state == OPEN and self.__wait:
+                self.__condition.wait_for(lambda: self.__state != OPEN or self.__is_reset_timeout_over(),
+                                          max(self.__opened_at + self.__reset_timeout - time.time(), 0))
+            if self.__state == OPEN and self.__is_reset_timeout_over():
+                logging.info('Probing Solr endpoint [{}]'.format(self.__name))
+                self.__state = HALF_OPEN
+                return True
+            if self.__state == HALF_OPEN and self.__wait:
+                if not self.__condition.wait_for(lambda: self.__state != HALF_OPEN, self.__reset_timeout):
+                    raise CircuitOpenError('Probe of Solr endpoint [{}] did not complete within [{}]s'.format(
+                        self.__name, self.__reset_timeout))
+            if self.__state != CLOSED:
+                raise CircuitOpenError('Circuit breaker of Solr endpoint [{}] is {}'.format(self.__name, self.__state))
+            return False
+
+    def after_request(self, failed: bool):
+        with self.__condition:
+            if not failed:
+                if self.__state != CLOSED:
+                    logging.info('Closing circuit breaker of Solr endpoint [{}]'.format(self.__name))
+                self.__state = CLOSED
+                self.__failures = 0
+                self.__retries = min(round(self.__retries + RETRY_BUDGET_DEPOSIT, 6), self.__retry_budget)
+            else:
+                self.__failures += 1
+                if self.__state == HALF_OPEN or self.__failures >= self.__failure_threshold:
+                    if self.__state != OPEN:
+                        logging.warning('Opening circuit breaker of Solr endpoint [{}] after [{}] failures'.format(
+                            self.__name, self.__failures))
+                    self.__state = OPEN
+                    self.__opened_at = time.time()
+            self.__condition.notify_all()
+
+    def spend_retry(self, operation: str):
+        """
+        Take one retry from the shared retry budget. Raises an exception if the budget is exhausted.
+        """
+        with self.__condition:
+            if self.__retries < 1:
+                raise CircuitOpenError('Retry budget of Solr endpoint [{}] is exhausted, not retrying [{}]'.format(
+                    self.__name, operation))
+            self.__retries -= 1
+
+    def __is_reset_timeout_over(self):
+        return time.time() - self.__opened_at >= self.__reset_timeout
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+DEFAULT_MIN_LIMIT = 1
+DEFAULT_LATENCY_THRESHOLD = 600
+BACKOFF = 0.5
+
+
+class ConcurrencyLimiter:
+    """
+    Limits the number of Collections API operations in flight with additive increase and multiplicative decrease. Each
+    operation that completes in time raises the limit by 1/limit, so the limit grows by one per window of operations,
+    while a congested operation (failure or time to completion above the threshold) halves it. Only operations started
+    after the last decrease can decrease the limit again, so one burst of failures cuts it once.
+    """
+
+    __limit = DEFAULT_MIN_LIMIT
+    __min_limit = DEFAULT_MIN_LIMIT
+    __max_limit = DEFAULT_MIN_LIMIT
+    __latency_threshold = DEFAULT_LATENCY_THRESHOLD
+    __in_flight = 0
+    __last_decrease = 0
+    __condition = None
+
+    def __init__(self, max_limit: int, min_limit: int = DEFAULT_MIN_LIMIT, initial_limit: int = None,
+                 latency_threshold: float = DEFAULT_LATENCY_THRESHOLD):
+        if min_limit < 1 or max_limit < min_limit:
+            raise Exception('Invalid concurrency limits: [{}] to [{}]'.format(min_limit, max_limit))
+        self.__max_limit = max_limit
+        self.__min_limit = min_limit
+        self.__limit = min(max(initial_limit or min_limit, min_limit), max_limit)
+        self.__latency_threshold = latency_threshold
+        self.__condition = threading.Condition()
+
+    def get_limit(self):
+        return int(self.__limit)
+
+    def get_in_flight(self):
+        return self.__in_flight
+
+    def has_capacity(self):
+        """
+        Whether another operation can be started without waiting, for callers that complete operations themselves.
+        """
+        with self.__condition:
+            return self.__in_flight < int(self.__limit)
+
+    def acquire(self):
+        """
+        Wait until another operation may be started. Returns the start time to be passed to release.
+        """
+        with self.__condition:
+            while self.__in_flight >= int(self.__limit):
+                self.__condition.wait()
+            self.__in_flight += 1
+            return time.time()
+
+    def release(self, start: float, congested: bool = False):
+        """
+        Mark an operation started at the given time as complete and adapt the limit to its outcome. Returns the new
+        limit.
+        """
+        now = time.time()
+        with self.__condition:
+            self.__in_flight -= 1
+            if congested or now - start > self.__latency_threshold:
+                if start >= self.__last_decrease:
+                    self.__limit = max(self.__limit * BACKOFF, self.__min_limit)
+                    self.__last_decrease = now
+            else:
+                self.__limit = min(self.__limit + 1 / self.__limit, self.__max_limit)
+            self.__condition.notify_all()
+            return int(self.__limit)
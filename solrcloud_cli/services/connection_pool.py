@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import http.client
+import io
+import threading
+import urllib.error
+import urllib.parse
+
+DEFAULT_MAX_IDLE_CONNECTIONS = 20
+
+
+class ConnectionPool:
+    """
+    Keeps HTTP connections to Solr alive between requests, so that the controllers of all stacks and regions of a run
+    reuse them instead of opening a connection per request. Idle connections are kept per scheme, host and port and
+    every connection is used by one request at a time. Responses other than 2xx are raised as urllib.error.HTTPError,
+    like urllib does.
+    """
+
+    __max_idle_connections = DEFAULT_MAX_IDLE_CONNECTIONS
+    __idle_connections = None
+    __opened_connections = 0
+    __lock = None
+
+    def __init__(self, max_idle_connections: int = DEFAULT_MAX_IDLE_CONNECTIONS):
+        self.__max_idle_connections = max_idle_connections
+        self.__idle_connections = dict()
+        self.__lock = threading.Lock()
+
+    def get_opened_connections(self):
+        return self.__opened_connections
+
+    def request(self, url: str, headers: dict, data: bytes = None):
+        """
+        Send a GET request, or a POST request if data is given, and return the status code and body of the response.
+        """
+        parsed_url = urllib.parse.urlsplit(url)
+        endpoint = (parsed_url.scheme, parsed_url.netloc)
+        path = parsed_url.path + ('?' + parsed_url.query if parsed_url.query else '')
+        connection, reused = self.__get_connection(endpoint)
+        try:
+            response = self.__send(connection, path, headers, data)
+        except (http.client.HTTPException, OSError) as e:
+            connection.close()
+            if not reused:
+                raise urllib.error.URLError(e)
+            # Solr may have closed the idle connection in the meantime
+            connection = self.__open_connection(endpoint)
+            try:
+                response = self.__send(connection, path, headers, data)
+            except (http.client.HTTPException, OSError) as e:
+                connection.close()
+                raise urllib.error.URLError(e)
+        content = response.read()
+        if response.will_close:
+            connection.close()
+        else:
+            self.__release_connection(endpoint, connection)
+        if not 200 <= response.status < 300:
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(content))
+        return response.status, content
+
+    def close(self):
+        with self.__lock:
+            for connections in self.__idle_connections.values():
+                for connection in connections:
+                    connection.close()
+            self.__idle_connections = dict()
+
+    @staticmethod
+    def __send(connection: http.client.HTTPConnection, path: str, headers: dict, data: bytes):
+        connection.request('GET' if data is None else 'POST', path, body=data, headers=headers)
+        return connection.getresponse()
+
+    def __get_connection(self, endpoint: tuple):
+        with self.__lock:
+            connections = self.__idle_connections.get(endpoint)
+            if connections:
+                return connections.pop(), True
+        return self.__open_connection(endpoint), False
+
+    def __open_connection(self, endpoint: tuple):
+        scheme, netloc = endpoint
+        with self.__lock:
+            self.__opened_connections += 1
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc)
+        return http.client.HTTPConnection(netloc)
+
+    def __release_connection(self, endpoint: tuple, connection: http.client.HTTPConnection):
+        with self.__lock:
+            connections = self.__idle_connections.setdefault(endpoint, list())
+            if len(connections) < self.__max_idle_connections:
+                connections.append(connection)
+                return
+        connection.close()
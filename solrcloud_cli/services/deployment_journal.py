@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+
+
+class DeploymentJournal:
+    """
+    Local journal of a blue/green deployment recording completed phases, the deployed stack version and all replicas
+    added to the cluster, so that a failed deployment can be resumed where it stopped.
+    """
+
+    __file_name = ''
+    __entries = None
+
+    def __init__(self, file_name: str):
+        self.__file_name = file_name
+        self.__entries = dict()
+        if os.path.exists(file_name):
+            with open(file_name, 'r') as fd:
+                self.__entries = json.load(fd)
+
+    def get_file_name(self):
+        return self.__file_name
+
+    def start(self, stack_name: str, image_version: str, stack_version: str):
+        if self.__entries.get('phases'):
+            logging.warning('Discarding journal of unfinished deployment of stack [{}] version [{}]'.format(
+                self.__entries.get('stack_name'), self.__entries.get('stack_version')))
+        self.__entries = {
+            'stack_name': stack_name,
+            'image_version': image_version,
+            'stack_version': stack_version,
+            'phases': [],
+            'replicas': []
+        }
+        self.__save()
+
+    def matches(self, stack_name: str, image_version: str):
+        return (self.__entries.get('stack_name') == stack_name and
+                self.__entries.get('image_version') == image_version)
+
+    def get_stack_version(self):
+        return self.__entries.get('stack_version')
+
+    def is_phase_complete(self, phase: str):
+        return phase in self.__entries.get('phases', [])
+
+    def complete_phase(self, phase: str):
+        self.__entries.setdefault('phases', []).append(phase)
+        self.__save()
+
+    def has_replica(self, collection_name: str, shard_name: str, node_name: str):
+        return [collection_name, shard_name, node_name] in self.__entries.get('replicas', [])
+
+    def add_replica(self, collection_name: str, shard_name: str, node_name: str):
+        self.__entries.setdefault('replicas', []).append([collection_name, shard_name, node_name])
+        self.__save()
+
+    def clear(self):
+        self.__entries = dict()
+        if os.path.exists(self.__file_name):
+            os.remove(self.__file_name)
+
+    def __save(self):
+        directory = os.path.dirname(self.__file_name)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temporary_file_name = self.__file_name + '.tmp'
+        with open(temporary_file_name, 'w') as fd:
+            json.dump(self.__entries, fd, indent=2, sort_keys=True)
+        os.replace(temporary_file_name, self.__file_name)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import logging
+import subprocess
+import threading
+import time
+import urllib.error
+
+from collections import deque
+
+SOLR_INTERACTION = 'solr'
+SENZA_INTERACTION = 'senza'
+
+HTTP_ERROR = 'http'
+PROCESS_ERROR = 'process'
+GENERIC_ERROR = 'error'
+
+
+class InteractionRecorder:
+    """
+    Records every request sent to Solr and every senza command with its response or error, the time it was sent and
+    its latency. Interactions are written as one JSON object per line so that logs of long deployments stay compact
+    and can be processed while they are written.
+    """
+
+    __file_name = ''
+    __fd = None
+    __lock = None
+
+    def __init__(self, file_name: str):
+        self.__file_name = file_name
+        self.__fd = open(file_name, 'w')
+        self.__lock = threading.Lock()
+
+    def get_file_name(self):
+        return self.__file_name
+
+    def execute(self, kind: str, request, send):
+        start = time.time()
+        try:
+            response = send()
+        except Exception as e:
+            self.__write(kind, request, start, error=self.__get_error(e))
+            raise
+        self.__write(kind, request, start, response=response)
+        return response
+
+    async def execute_async(self, kind: str, request, send):
+        start = time.time()
+        try:
+            response = await send()
+        except Exception as e:
+            self.__write(kind, request, start, error=self.__get_error(e))
+            raise
+        self.__write(kind, request, start, response=response)
+        return response
+
+    @staticmethod
+    def sleep(seconds: float):
+        time.sleep(seconds)
+
+    @staticmethod
+    async def sleep_async(seconds: float):
+        await asyncio.sleep(seconds)
+
+    def close(self):
+        with self.__lock:
+            self.__fd.close()
+
+    def __write(self, kind: str, request, start: float, response=None, error: dict = None):
+        interaction = {
+            'kind': kind,
+            'request': request,
+            'time': round(start, 3),
+            'latency': round(time.time() - start, 3)
+        }
+        if error:
+            interaction['error'] = error
+        else:
+            interaction['response'] = response
+        line = json.dumps(interaction, sort_keys=True, separators=(',', ':'))
+        with self.__lock:
+            self.__fd.write(line + '\n')
+            self.__fd.flush()
+
+    @staticmethod
+    def __get_error(error: Exception):
+        if isinstance(error, urllib.error.HTTPError):
+            return {'type': HTTP_ERROR, 'code': error.code, 'message': str(error.reason)}
+        elif isinstance(error, subprocess.CalledProcessError):
+            return {'type': PROCESS_ERROR, 'code': error.returncode, 'message': str(error)}
+        else:
+            return {'type': GENERIC_ERROR, 'message': str(error)}
+
+
+class InteractionReplayer:
+    """
+    Answers requests to Solr and senza commands from a log written by the InteractionRecorder instead of sending them.
+    Identical requests are answered in the order they have been recorded. Recorded latencies and waits between polls
+    are replayed divided by the speed, i.e. a speed of 1 replays in real time, higher speeds compress time and a speed
+    of 0 does not wait.
+    """
+
+    __file_name = ''
+    __speed = 0
+    __interactions = None
+    __lock = None
+
+    def __init__(self, file_name: str, speed: float = 0):
+        self.__file_name = file_name
+        self.__speed = speed
+        self.__interactions = dict()
+        self.__lock = threading.Lock()
+        with open(file_name, 'r') as fd:
+            for line in filter(lambda x: x.strip(), fd):
+                interaction = json.loads(line)
+                key = self.__get_key(interaction['kind'], interaction['request'])
+                self.__interactions.setdefault(key, deque()).append(interaction)
+
+    def get_file_name(self):
+        return self.__file_name
+
+    def get_number_of_remaining_interactions(self):
+        with self.__lock:
+            return sum(map(len, self.__interactions.values()))
+
+    def execute(self, kind: str, request, send):
+        interaction = self.__next_interaction(kind, request)
+        if self.__speed:
+            time.sleep(interaction['latency'] / self.__speed)
+        return self.__get_response(interaction)
+
+    async def execute_async(self, kind: str, request, send):
+        interaction = self.__next_interaction(kind, request)
+        if self.__speed:
+            await asyncio.sleep(interaction['latency'] / self.__speed)
+        return self.__get_response(interaction)
+
+    def sleep(self, seconds: float):
+        if self.__speed:
+            time.sleep(seconds / self.__speed)
+
+    async def sleep_async(self, seconds: float):
+        if self.__speed:
+            await asyncio.sleep(seconds / self.__speed)
+
+    def close(self):
+        remaining = self.get_number_of_remaining_interactions()
+        if remaining:
+            logging.warning('[{}] recorded interactions have not been replayed from [{}]'.format(
+                remaining, self.__file_name))
+
+    def __next_interaction(self, kind: str, request):
+        with self.__lock:
+            interactions = self.__interactions.get(self.__get_key(kind, request))
+            if not interactions:
+                raise Exception('No recorded interaction left for {} request [{}]'.format(kind, request))
+            return interactions.popleft()
+
+    @staticmethod
+    def __get_key(kind: str, request):
+        return kind, json.dumps(request)
+
+    @staticmethod
+    def __get_response(interaction: dict):
+        error = interaction.get('error')
+        if not error:
+            return interaction['response']
+        if error['type'] == HTTP_ERROR:
+            raise urllib.error.HTTPError(interaction['request'], error['code'], error['message'], None, None)
+        elif error['type'] == PROCESS_ERROR:
+            raise subprocess.CalledProcessError(returncode=error['code'], cmd=interaction['request'])
+        else:
+            raise Exception(error['message'])
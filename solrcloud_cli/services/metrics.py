@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+DEFAULT_PREFIX = 'solrcloud_cli'
+DEFAULT_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900]
+
+# Histograms
+COMMAND_DURATION = 'command_duration_seconds'
+PHASE_DURATION = 'phase_duration_seconds'
+REQUEST_DURATION = 'request_duration_seconds'
+SUBMISSION_DELAY = 'submission_delay_seconds'
+
+# Counters
+REQUESTS = 'requests_total'
+GATEWAY_TIMEOUTS = 'gateway_timeouts_total'
+RETRIES = 'retries_total'
+POLL_ITERATIONS = 'poll_iterations_total'
+
+# Gauges
+CONCURRENCY_LIMIT = 'concurrency_limit'
+
+DESCRIPTIONS = {
+    COMMAND_DURATION: 'Duration of a command for one stack',
+    PHASE_DURATION: 'Duration of the phases of a command',
+    REQUEST_DURATION: 'Latency of Collections API requests and senza commands',
+    SUBMISSION_DELAY: 'Delay of Collections API operations to keep the overseer queues short',
+    REQUESTS: 'Number of Collections API requests and senza commands by status',
+    GATEWAY_TIMEOUTS: 'Number of Collections API requests answered with HTTP 504',
+    RETRIES: 'Number of retried operations',
+    POLL_ITERATIONS: 'Number of iterations of loops waiting for the cluster',
+    CONCURRENCY_LIMIT: 'Number of Collections API operations allowed in flight'
+}
+
+
+class Metrics:
+    """
+    Thread safe collection of counters, gauges and latency histograms of one run of the CLI. Metrics are identified by
+    name and labels and can be exported as JSON or as textfile for the node_exporter. Gauges keep their last value and,
+    in the JSON export only, the lowest and highest value they have been set to.
+    """
+
+    __buckets = None
+    __counters = None
+    __gauges = None
+    __histograms = None
+    __lock = None
+
+    def __init__(self, buckets: list = None):
+        self.__buckets = sorted(buckets or DEFAULT_BUCKETS)
+        self.__counters = dict()
+        self.__gauges = dict()
+        self.__histograms = dict()
+        self.__lock = threading.Lock()
+
+    def increment(self, name: str, labels: dict = None, value: int = 1):
+        key = self.__get_key(name, labels)
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, labels: dict = None):
+        key = self.__get_key(name, labels)
+        with self.__lock:
+            gauge = self.__gauges.get(key)
+            if gauge:
+                self.__gauges[key] = {'value': value, 'min': min(gauge['min'], value), 'max': max(gauge['max'], value)}
+            else:
+                self.__gauges[key] = {'value': value, 'min': value, 'max': value}
+
+    def observe(self, name: str, seconds: float, labels: dict = None):
+        key = self.__get_key(name, labels)
+        with self.__lock:
+            histogram = self.__histograms.setdefault(key, {
+                'buckets': [0] * len(self.__buckets),
+                'sum': 0.0,
+                'count': 0
+            })
+            for index, bucket in enumerate(self.__buckets):
+                if seconds <= bucket:
+                    histogram['buckets'][index] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+
+    @contextmanager
+    def timer(self, name: str, labels: dict = None):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, labels)
+
+    def get_counter(self, name: str, labels: dict = None):
+        with self.__lock:
+            return self.__counters.get(self.__get_key(name, labels), 0)
+
+    def get_gauge(self, name: str, labels: dict = None):
+        with self.__lock:
+            gauge = self.__gauges.get(self.__get_key(name, labels))
+            return dict(gauge) if gauge else None
+
+    def get_histogram(self, name: str, labels: dict = None):
+        with self.__lock:
+            histogram = self.__histograms.get(self.__get_key(name, labels))
+            return dict(histogram, buckets=list(histogram['buckets'])) if histogram else None
+
+    def to_dict(self):
+        with self.__lock:
+            return {
+                'counters': list(map(lambda x: {
+                    'name': x[0][0],
+                    'labels': dict(x[0][1]),
+                    'value': x[1]
+                }, sorted(self.__counters.items()))),
+                'gauges': list(map(lambda x: dict(x[1], name=x[0][0], labels=dict(x[0][1])),
+                                   sorted(self.__gauges.items()))),
+                'histograms': list(map(lambda x: {
+                    'name': x[0][0],
+                    'labels': dict(x[0][1]),
+                    'buckets': dict(zip(map(str, self.__buckets), x[1]['buckets'])),
+                    'sum': round(x[1]['sum'], 6),
+                    'count': x[1]['count']
+                }, sorted(self.__histograms.items())))
+            }
+
+    def save_json(self, file_name: str):
+        self.__write_file(file_name, json.dumps(self.to_dict(), indent=2, sort_keys=True))
+
+    def save_textfile(self, file_name: str, prefix: str = DEFAULT_PREFIX):
+        """
+        Write all metrics in the Prometheus text format. The file is replaced atomically, so that the node_exporter
+        never reads a partially written file.
+        """
+        metrics = self.to_dict()
+        lines = list()
+        for name in sorted(set(map(lambda x: x['name'], metrics['counters']))):
+            lines += self.__get_header(prefix, name, 'counter')
+            for counter in filter(lambda x: x['name'] == name, metrics['counters']):
+                lines.append('{}_{}{} {}'.format(prefix, name, self.__format_labels(counter['labels']),
+                                                 counter['value']))
+        for name in sorted(set(map(lambda x: x['name'], metrics['gauges']))):
+            lines += self.__get_header(prefix, name, 'gauge')
+            for gauge in filter(lambda x: x['name'] == name, metrics['gauges']):
+                lines.append('{}_{}{} {}'.format(prefix, name, self.__format_labels(gauge['labels']), gauge['value']))
+        for name in sorted(set(map(lambda x: x['name'], metrics['histograms']))):
+            lines += self.__get_header(prefix, name, 'histogram')
+            for histogram in filter(lambda x: x['name'] == name, metrics['histograms']):
+                for bucket in self.__buckets:
+                    labels = dict(histogram['labels'], le=str(bucket))
+                    lines.append('{}_{}_bucket{} {}'.format(prefix, name, self.__format_labels(labels),
+                                                            histogram['buckets'][str(bucket)]))
+                labels = dict(histogram['labels'], le='+Inf')
+                lines.append('{}_{}_bucket{} {}'.format(prefix, name, self.__format_labels(labels),
+                                                        histogram['count']))
+                lines.append('{}_{}_sum{} {}'.format(prefix, name, self.__format_labels(histogram['labels']),
+                                                     histogram['sum']))
+                lines.append('{}_{}_count{} {}'.format(prefix, name, self.__format_labels(histogram['labels']),
+                                                       histogram['count']))
+        self.__write_file(file_name, '\n'.join(lines) + '\n')
+
+    @staticmethod
+    def __get_key(name: str, labels: dict):
+        return name, tuple(sorted((labels or dict()).items()))
+
+    @staticmethod
+    def __get_header(prefix: str, name: str, metric_type: str):
+        return [
+            '# HELP {}_{} {}'.format(prefix, name, DESCRIPTIONS.get(name, name)),
+            '# TYPE {}_{} {}'.format(prefix, name, metric_type)
+        ]
+
+    @staticmethod
+    def __format_labels(labels: dict):
+        if not labels:
+            return ''
+        return '{' + ','.join(map(lambda x: '{}="{}"'.format(x[0], str(x[1]).replace('\\', '\\\\')
+                                                             .replace('"', '\\"')), sorted(labels.items()))) + '}'
+
+    @staticmethod
+    def __write_file(file_name: str, content: str):
+        temporary_file_name = file_name + '.tmp'
+        with open(temporary_file_name, 'w') as fd:
+            fd.write(content)
+        os.replace(temporary_file_name, file_name)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+
+ADD_REPLICA = 'ADDREPLICA'
+DELETE_REPLICA = 'DELETEREPLICA'
+SWITCH_TRAFFIC = 'SWITCHTRAFFIC'
+
+
+class MigrationPlan:
+    """
+    Explicit list of all operations migrating a Solr cloud cluster to a new stack version. Every operation has a stable
+    id and lists the ids of the operations it depends on, so that plans can be stored, diffed and executed in parallel.
+    """
+
+    __stack_name = ''
+    __stack_version = ''
+    __operations = None
+
+    def __init__(self, stack_name: str, stack_version: str, operations: list = None):
+        self.__stack_name = stack_name
+        self.__stack_version = stack_version
+        self.__operations = operations or list()
+
+    def get_stack_name(self):
+        return self.__stack_name
+
+    def get_stack_version(self):
+        return self.__stack_version
+
+    def get_operations(self):
+        return self.__operations
+
+    def add_replica(self, collection_name: str, shard_name: str, node_name: str):
+        return self.__add_operation({
+            'id': '{}:{}/{}/{}'.format(ADD_REPLICA, collection_name, shard_name, node_name),
+            'action': ADD_REPLICA,
+            'collection': collection_name,
+            'shard': shard_name,
+            'node': node_name,
+            'depends_on': []
+        })
+
+    def switch_traffic(self, depends_on: list):
+        return self.__add_operation({
+            'id': '{}:{}'.format(SWITCH_TRAFFIC, self.__stack_version),
+            'action': SWITCH_TRAFFIC,
+            'stack_version': self.__stack_version,
+            'depends_on': sorted(depends_on)
+        })
+
+    def delete_replica(self, collection_name: str, shard_name: str, replica_name: str, node_name: str,
+                       depends_on: list):
+        return self.__add_operation({
+            'id': '{}:{}/{}/{}'.format(DELETE_REPLICA, collection_name, shard_name, replica_name),
+            'action': DELETE_REPLICA,
+            'collection': collection_name,
+            'shard': shard_name,
+            'replica': replica_name,
+            'node': node_name,
+            'depends_on': sorted(depends_on)
+        })
+
+    def get_critical_path_length(self):
+        """
+        Number of operations on the longest dependency chain, i.e. the number of sequential steps needed to apply the
+        plan with unlimited parallelism.
+        """
+        operations = dict(map(lambda x: (x['id'], x), self.__operations))
+        path_lengths = dict()
+
+        def get_path_length(operation_id):
+            if operation_id not in path_lengths:
+                depends_on = operations[operation_id]['depends_on']
+                path_lengths[operation_id] = 1 + max(map(get_path_length, depends_on), default=0)
+            return path_lengths[operation_id]
+
+        return max(map(get_path_length, operations.keys()), default=0)
+
+    def get_summary(self):
+        actions = list(map(lambda x: x['action'], self.__operations))
+        return 'Plan for stack [{}] version [{}]: [{}] ADDREPLICA, [{}] DELETEREPLICA, [{}] SWITCHTRAFFIC, ' \
+               'critical path of [{}] operations'.format(self.__stack_name, self.__stack_version,
+                                                         actions.count(ADD_REPLICA), actions.count(DELETE_REPLICA),
+                                                         actions.count(SWITCH_TRAFFIC),
+                                                         self.get_critical_path_length())
+
+    def save(self, file_name: str):
+        with open(file_name, 'w') as fd:
+            json.dump({
+                'stack_name': self.__stack_name,
+                'stack_version': self.__stack_version,
+                'operations': self.__operations
+            }, fd, indent=2, sort_keys=True)
+
+    @staticmethod
+    def load(file_name: str):
+        with open(file_name, 'r') as fd:
+            plan = json.load(fd)
+        return MigrationPlan(plan['stack_name'], plan['stack_version'], plan['operations'])
+
+    def __add_operation(self, operation: dict):
+        self.__operations.append(operation)
+        return operation['id']
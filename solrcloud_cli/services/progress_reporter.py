@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+import time
+
+
+class ProgressReporter:
+    """
+    Writes the progress of long running phases as one JSON object per line. Every event counts the units completed in
+    a phase, e.g. replicas that became active, and carries the throughput observed since the first event of the phase
+    and the estimated time until the phase is complete. Rates are tracked per stack and region, so that commands
+    running concurrently for several regions of a stack do not mix their progress.
+    """
+
+    __stream = None
+    __close_stream = False
+    __rates = None
+    __lock = None
+
+    def __init__(self, stream, close_stream: bool = False):
+        self.__stream = stream
+        self.__close_stream = close_stream
+        self.__rates = dict()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def open_file(file_name: str):
+        return ProgressReporter(open(file_name, 'a'), close_stream=True)
+
+    @staticmethod
+    def open_fd(fd: int):
+        return ProgressReporter(os.fdopen(fd, 'w', closefd=False), close_stream=True)
+
+    def report(self, stack_name: str, phase: str, unit: str, done: int, total: int = None, region: str = None,
+               **fields):
+        now = time.time()
+        event = {
+            'time': round(now, 3),
+            'stack': stack_name,
+            'phase': phase,
+            'unit': unit,
+            'done': done
+        }
+        if region:
+            event['region'] = region
+        with self.__lock:
+            first_time, first_done = self.__rates.setdefault((stack_name, region, phase, unit), (now, done))
+            throughput = None
+            if now > first_time and done > first_done:
+                throughput = (done - first_done) / (now - first_time)
+                event['throughput'] = round(throughput, 3)
+            if total is not None:
+                event['total'] = total
+                event['remaining'] = max(total - done, 0)
+                if throughput:
+                    event['eta_seconds'] = round(event['remaining'] / throughput, 1)
+            event.update(fields)
+            self.__stream.write(json.dumps(event, sort_keys=True) + '\n')
+            self.__stream.flush()
+
+    def close(self):
+        with self.__lock:
+            if self.__close_stream:
+                self.__stream.close()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import itertools
+import logging
+import math
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CONCURRENCY = 4
+
+
+class QueryResults:
+    """
+    Latencies of all successful queries of one run and the number of failed queries.
+    """
+
+    __latencies = None
+    __errors = 0
+    __duration = 0
+
+    def __init__(self, latencies: list, errors: int, duration: float):
+        self.__latencies = sorted(latencies)
+        self.__errors = errors
+        self.__duration = duration
+
+    def get_number_of_queries(self):
+        return len(self.__latencies)
+
+    def get_number_of_errors(self):
+        return self.__errors
+
+    def get_duration(self):
+        return self.__duration
+
+    def get_percentile(self, percentile: float):
+        """
+        Latency in milliseconds below which the given percentage of queries completed, using the nearest rank.
+        """
+        if not self.__latencies:
+            return 0
+        rank = int(math.ceil(percentile / 100 * len(self.__latencies)))
+        return self.__latencies[max(rank, 1) - 1] * 1000
+
+    def get_throughput(self):
+        return len(self.__latencies) / self.__duration if self.__duration else 0
+
+
+class QueryRunner:
+    """
+    Sends queries to Solr with a fixed number of concurrent workers. Queries are either sent once or repeatedly until
+    the given duration is over.
+    """
+
+    __send_request = None
+    __concurrency = DEFAULT_CONCURRENCY
+
+    def __init__(self, send_request, concurrency: int = DEFAULT_CONCURRENCY):
+        self.__send_request = send_request
+        self.__concurrency = concurrency
+
+    def run(self, urls: list, duration: float = None):
+        queries = itertools.cycle(urls) if duration else iter(urls)
+        lock = threading.Lock()
+        latencies = list()
+        errors = list()
+        start = time.time()
+
+        def send_queries():
+            while True:
+                with lock:
+                    if duration and time.time() - start >= duration:
+                        return
+                    url = next(queries, None)
+                if url is None:
+                    return
+                query_start = time.time()
+                try:
+                    self.__send_request(url)
+                    latencies.append(time.time() - query_start)
+                except Exception as e:
+                    logging.debug('Query [{}] failed: {}'.format(url, e))
+                    errors.append(url)
+
+        with ThreadPoolExecutor(max_workers=self.__concurrency) as executor:
+            workers = list(map(lambda x: executor.submit(send_queries), range(self.__concurrency)))
+            for worker in workers:
+                worker.result()
+        return QueryResults(latencies, len(errors), time.time() - start)
+
+    @staticmethod
+    def load_queries(file_name: str):
+        """
+        Read a query file with one query per line, given as collection name and query parameters separated by
+        whitespace, e.g. 'products q=shoes&fq=brand:acme&rows=10'. Empty lines and lines starting with # are ignored.
+        Returns an ordered mapping from collection name to the parameters of its queries.
+        """
+        queries = OrderedDict()
+        with open(file_name, 'r') as fd:
+            for line in map(lambda x: x.strip(), fd):
+                if not line or line.startswith('#'):
+                    continue
+                collection_name, _, parameters = line.partition(' ')
+                if not parameters.strip():
+                    raise Exception('Query without parameters in [{}]: [{}]'.format(file_name, line))
+                queries.setdefault(collection_name, list()).append(parameters.strip())
+        return queries
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+from collections import namedtuple, OrderedDict
+
+DEFAULT_STALL_TIMEOUT = 300
+
+RecoveryStatus = namedtuple('RecoveryStatus', ['collection', 'node', 'core', 'bytes_downloaded', 'bytes_to_download',
+                                               'rate', 'eta_seconds', 'stalled_seconds'])
+
+
+class RecoveryMonitor:
+    """
+    Tracks the index replication of recovering replicas between polls of the cluster state. The transfer rate of a
+    replica is computed from the bytes downloaded between its last two samples, a replica is stalled if its download
+    has not progressed within the stall timeout.
+    """
+
+    __stall_timeout = DEFAULT_STALL_TIMEOUT
+    __replicas = None
+
+    def __init__(self, stall_timeout: int = DEFAULT_STALL_TIMEOUT):
+        self.__stall_timeout = stall_timeout
+        self.__replicas = OrderedDict()
+
+    def update(self, collection: str, node: str, core: str, progress: tuple = None):
+        """
+        Record a sample of a recovering replica. The progress is a tuple of bytes downloaded and bytes to download or
+        None if the replica is not replicating its index at the moment.
+        """
+        now = time.time()
+        previous = self.__replicas.get((node, core))
+        bytes_downloaded, bytes_to_download = progress if progress else (None, None)
+        if previous is None:
+            status = RecoveryStatus(collection=collection, node=node, core=core, bytes_downloaded=bytes_downloaded,
+                                    bytes_to_download=bytes_to_download, rate=None, eta_seconds=None,
+                                    stalled_seconds=0)
+            self.__replicas[(node, core)] = (now, now, status)
+            return status
+
+        sample_time, progress_time, previous_status = previous
+        if bytes_downloaded is not None and bytes_downloaded != previous_status.bytes_downloaded:
+            rate = None
+            if previous_status.bytes_downloaded is not None and bytes_downloaded > previous_status.bytes_downloaded \
+                    and now > sample_time:
+                rate = (bytes_downloaded - previous_status.bytes_downloaded) / (now - sample_time)
+            eta_seconds = None
+            if rate and bytes_to_download:
+                eta_seconds = round(max(bytes_to_download - bytes_downloaded, 0) / rate, 1)
+            progress_time = now
+            status = previous_status._replace(bytes_downloaded=bytes_downloaded, bytes_to_download=bytes_to_download,
+                                              rate=rate, eta_seconds=eta_seconds, stalled_seconds=0)
+        else:
+            status = previous_status._replace(rate=0 if previous_status.rate is not None else None, eta_seconds=None,
+                                              stalled_seconds=round(now - progress_time, 1))
+        self.__replicas[(node, core)] = (now, progress_time, status)
+        return status
+
+    def retain(self, replicas: list):
+        """
+        Forget all replicas except the given (node, core) tuples, e.g. when replicas have become active.
+        """
+        keep = set(replicas)
+        for key in list(self.__replicas.keys()):
+            if key not in keep:
+                del self.__replicas[key]
+
+    def get_status(self):
+        return list(map(lambda x: x[2], self.__replicas.values()))
+
+    def get_rates_by_node(self):
+        return self.__get_rates(lambda x: x.node)
+
+    def get_rates_by_collection(self):
+        return self.__get_rates(lambda x: x.collection)
+
+    def get_stalled_replicas(self):
+        return list(filter(lambda x: x.stalled_seconds > self.__stall_timeout, self.get_status()))
+
+    def __get_rates(self, get_key):
+        rates = OrderedDict()
+        for status in self.get_status():
+            rates[get_key(status)] = rates.get(get_key(status), 0) + (status.rate or 0)
+        return rates
+
+    @staticmethod
+    def parse_replication_details(details: dict):
+        """
+        Extract bytes downloaded and bytes to download from the response of the replication handler's details command.
+        Returns None if the core is not replicating its index.
+        """
+        replication = details.get('details', dict())
+        follower = replication.get('follower', replication.get('slave'))
+        if not follower or str(follower.get('isReplicating', 'false')).lower() != 'true':
+            return None
+        bytes_downloaded = RecoveryMonitor.__parse_bytes(follower, 'bytesDownloaded')
+        bytes_to_download = RecoveryMonitor.__parse_bytes(follower, 'bytesToDownload')
+        if bytes_downloaded is None or bytes_to_download is None:
+            return None
+        return bytes_downloaded, bytes_to_download
+
+    @staticmethod
+    def __parse_bytes(follower: dict, key: str):
+        # Solr reports readable sizes like '1.2 GB' under the plain key and the exact number under '<key>InBytes'
+        for value in [follower.get(key + 'InBytes'), follower.get(key)]:
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                continue
+        return None
@@ -1,17 +1,32 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import asyncio
 import json
 import logging
 import subprocess
 import sys
 import time
 
+from contextlib import contextmanager
+
+from solrcloud_cli.services.interaction_log import SENZA_INTERACTION
+from solrcloud_cli.services.metrics import REQUEST_DURATION, REQUESTS, POLL_ITERATIONS
+from solrcloud_cli.services.tracer import Span
+
 SENZA = 'senza'
 DEFAULT_REGION = 'eu-west-1'
 FIRST_STACK_VERSION = 'blue'
 SECOND_STACK_VERSION = 'green'
 
+# Senza commands that are executed without JSON output and only return their exit code
+NON_JSON_COMMANDS = ['create', 'delete']
+
+# CloudFormation statuses of stack versions whose deletion has been issued but not completed
+DELETE_IN_PROGRESS = 'DELETE_IN_PROGRESS'
+DELETE_FAILED = 'DELETE_FAILED'
+DELETION_STATUSES = [DELETE_IN_PROGRESS, DELETE_FAILED]
+
 DEFAULT_STACK_CREATION_RETRY_WAIT = 10
 DEFAULT_STACK_CREATION_RETRY_TIMEOUT = 900
 
@@ -27,6 +42,10 @@ class SenzaWrapper:
     __region = DEFAULT_REGION
 
     __parameters = None
+    __interaction_log = None
+    __metrics = None
+    __progress_reporter = None
+    __tracer = None
 
     def __init__(self, config_file_name: str):
         self.__config_file_name = config_file_name
@@ -44,73 +63,125 @@ class SenzaWrapper:
     def set_region(self, region: str):
         self.__region = region
 
+    def set_interaction_log(self, interaction_log):
+        """
+        Record all senza commands with an InteractionRecorder or answer them with an InteractionReplayer.
+        """
+        self.__interaction_log = interaction_log
+
+    def set_metrics(self, metrics):
+        self.__metrics = metrics
+
+    def set_progress_reporter(self, progress_reporter):
+        self.__progress_reporter = progress_reporter
+
+    def set_tracer(self, tracer):
+        self.__tracer = tracer
+
     def add_parameter(self, key: str, value):
         if key and value:
             self.__parameters[key] = value
 
-    def delete_stack_version(self, stack_name: str, stack_version: str):
+    def delete_stack_version(self, stack_name: str, stack_version: str, wait: bool = True):
         # Delete stack version
         logging.info("Deleting [{0}] on [{1}].".format(stack_name, stack_version))
         self.__execute_senza('delete', stack_name, stack_version)
+        if not wait:
+            logging.info("Not waiting for deletion of [{0}] on [{1}].".format(stack_name, stack_version))
+            return
+
+        # Wait until deletion is complete
+        while self.__execute_senza('list', stack_name, stack_version):
+            self.__count_poll_iteration('stack-deletion')
+            self.__sleep(self.__retry_wait)
+            sys.stdout.write('.')
+            sys.stdout.flush()
+        logging.info("[{0}] on [{1}] has been deleted.".format(stack_name, stack_version))
+
+    async def delete_stack_version_async(self, stack_name: str, stack_version: str, wait: bool = True):
+        # Delete stack version
+        logging.info("Deleting [{0}] on [{1}].".format(stack_name, stack_version))
+        await self.__execute_senza_async('delete', stack_name, stack_version)
+        if not wait:
+            logging.info("Not waiting for deletion of [{0}] on [{1}].".format(stack_name, stack_version))
+            return
 
         # Wait until deletion is complete
-        delete_complete = False
-        while not delete_complete:
-            list_output = self.__execute_senza('list', stack_name, stack_version)
-            if not list_output:
-                delete_complete = True
-                logging.info("[{0}] on [{1}] has been deleted.".format(stack_name, stack_version))
-            time.sleep(self.__retry_wait)
+        while await self.__execute_senza_async('list', stack_name, stack_version):
+            self.__count_poll_iteration('stack-deletion')
+            await self.__sleep_async(self.__retry_wait)
             sys.stdout.write('.')
             sys.stdout.flush()
+        logging.info("[{0}] on [{1}] has been deleted.".format(stack_name, stack_version))
+
+    def get_stack_versions_in_deletion(self, stack_name: str):
+        stack_versions = self.__execute_senza('list', stack_name) or list()
+        return list(filter(lambda x: x['status'] in DELETION_STATUSES, stack_versions))
+
+    async def get_stack_versions_in_deletion_async(self, stack_name: str):
+        stack_versions = await self.__execute_senza_async('list', stack_name) or list()
+        return list(filter(lambda x: x['status'] in DELETION_STATUSES, stack_versions))
 
     def get_stack_instances(self, stack_name: str, stack_version: str):
         instances = self.__execute_senza('instances', stack_name, stack_version)
         return list(map(lambda x: x['private_ip'], instances))
 
+    async def get_stack_instances_async(self, stack_name: str, stack_version: str):
+        instances = await self.__execute_senza_async('instances', stack_name, stack_version)
+        return list(map(lambda x: x['private_ip'], instances))
+
     def get_active_stack_version(self, stack_name: str):
-        active_versions = list(filter(lambda x: x['weight%'] == float(100), self.get_all_stack_versions(stack_name)))
-        if active_versions:
-            active_version = active_versions[0]['version']
-        else:
-            active_version = None
-        return active_version
+        return self.__get_stack_version_with_weight(self.get_all_stack_versions(stack_name), 100)
+
+    async def get_active_stack_version_async(self, stack_name: str):
+        return self.__get_stack_version_with_weight(await self.get_all_stack_versions_async(stack_name), 100)
 
     def get_passive_stack_version(self, stack_name: str):
-        passive_versions = list(filter(lambda x: x['weight%'] == float(0), self.get_all_stack_versions(stack_name)))
-        if passive_versions:
-            passive_version = passive_versions[0]['version']
-        else:
-            passive_version = None
-        return passive_version
+        return self.__get_stack_version_with_weight(self.get_all_stack_versions(stack_name), 0)
+
+    async def get_passive_stack_version_async(self, stack_name: str):
+        return self.__get_stack_version_with_weight(await self.get_all_stack_versions_async(stack_name), 0)
 
     def get_all_stack_versions(self, stack_name: str):
         return self.__execute_senza('traffic', stack_name)
 
-    def create_stack(self, stack_name: str, stack_version: str, image_version: str):
-        senza_parameters = list()
-        senza_parameters.append('ImageVersion=' + image_version)
-        for key, value in self.__parameters.items():
-            senza_parameters.append(key + '=' + str(value))
+    async def get_all_stack_versions_async(self, stack_name: str):
+        return await self.__execute_senza_async('traffic', stack_name)
 
+    def create_stack(self, stack_name: str, stack_version: str, image_version: str):
         result = self.__execute_senza('create', '--disable-rollback', self.__config_file_name, stack_version,
-                                      *senza_parameters)
+                                      *self.__get_senza_parameters(image_version))
+        if result != 0:
+            raise Exception('Failed to create new cluster with error code [{}]'.format(result))
+        timer = 0
+        while timer < self.__stack_creation_retry_timeout:
+            events = self.get_events(stack_name, stack_version)
+            self.__report_created_resources(stack_name, events)
+            if self.__is_stack_creation_complete(events, stack_name, stack_version, image_version):
+                return
+
+            self.__count_poll_iteration('stack-creation')
+            self.__sleep(self.__stack_creation_retry_wait)
+            timer += self.__stack_creation_retry_wait
+            sys.stdout.write('.')
+            sys.stdout.flush()
+        else:
+            raise Exception('Timeout while creating new stack version')
+
+    async def create_stack_async(self, stack_name: str, stack_version: str, image_version: str):
+        result = await self.__execute_senza_async('create', '--disable-rollback', self.__config_file_name,
+                                                  stack_version, *self.__get_senza_parameters(image_version))
         if result != 0:
             raise Exception('Failed to create new cluster with error code [{}]'.format(result))
         timer = 0
         while timer < self.__stack_creation_retry_timeout:
-            events = sorted(self.get_events(stack_name, stack_version), key=lambda k: k['event_time'])
-            if events:
-                last_event = events[-1]
-                if last_event['ResourceStatus'] == 'CREATE_COMPLETE' and \
-                        last_event['resource_type'] == 'CloudFormation::Stack':
-                    return
-                elif last_event['ResourceStatus'] in ['CREATE_FAILED', 'ROLLBACK_IN_PROGRESS', 'DELETE_IN_PROGRESS',
-                                                      'DELETE_COMPLETE', 'ROLLBACK_COMPLETE']:
-                    raise Exception('Creation of stack [{}] version [{}] with image version [{}] failed'
-                                    .format(stack_name, stack_version, image_version))
-
-            time.sleep(self.__stack_creation_retry_wait)
+            events = await self.get_events_async(stack_name, stack_version)
+            self.__report_created_resources(stack_name, events)
+            if self.__is_stack_creation_complete(events, stack_name, stack_version, image_version):
+                return
+
+            self.__count_poll_iteration('stack-creation')
+            await self.__sleep_async(self.__stack_creation_retry_wait)
             timer += self.__stack_creation_retry_wait
             sys.stdout.write('.')
             sys.stdout.flush()
@@ -120,8 +191,163 @@ class SenzaWrapper:
     def get_events(self, stack_name: str, stack_version: str):
         return self.__execute_senza('events', stack_name, stack_version)
 
+    async def get_events_async(self, stack_name: str, stack_version: str):
+        return await self.__execute_senza_async('events', stack_name, stack_version)
+
     def switch_traffic(self, stack_name: str, stack_version: str, weight: int):
         traffic_output = self.__execute_senza('traffic', stack_name, stack_version, str(weight))
+        self.__verify_traffic_output(traffic_output, stack_name, stack_version, weight)
+
+    async def switch_traffic_async(self, stack_name: str, stack_version: str, weight: int):
+        traffic_output = await self.__execute_senza_async('traffic', stack_name, stack_version, str(weight))
+        self.__verify_traffic_output(traffic_output, stack_name, stack_version, weight)
+
+    def __get_senza_parameters(self, image_version: str):
+        senza_parameters = list()
+        senza_parameters.append('ImageVersion=' + image_version)
+        for key, value in self.__parameters.items():
+            senza_parameters.append(key + '=' + str(value))
+        return senza_parameters
+
+    def __get_senza_command(self, command: str, args: tuple):
+        senza_command = [SENZA, command, '--region', self.__region]
+        if command not in NON_JSON_COMMANDS:
+            senza_command += ['--output', 'json']
+        senza_command += list(args)
+        return senza_command
+
+    def __execute_senza(self, command: str, *args):
+        senza_command = self.__get_senza_command(command, args)
+        with self.__trace(command, args) as span:
+            start = time.time()
+            status = 'error'
+            try:
+                if self.__interaction_log:
+                    result = self.__interaction_log.execute(SENZA_INTERACTION, senza_command,
+                                                            lambda: self.__run_senza(command, senza_command))
+                else:
+                    result = self.__run_senza(command, senza_command)
+                status = self.__get_status(command, result)
+                return result
+            except subprocess.CalledProcessError as e:
+                status = str(e.returncode)
+                raise
+            finally:
+                span.set_attribute('status', status)
+                self.__record_command(command, status, time.time() - start)
+
+    def __run_senza(self, command: str, senza_command: list):
+        if command in NON_JSON_COMMANDS:
+            result = subprocess.call(senza_command)
+        else:
+            result = self.__parse_senza_output(subprocess.check_output(senza_command))
+        return result
+
+    async def __execute_senza_async(self, command: str, *args):
+        senza_command = self.__get_senza_command(command, args)
+        with self.__trace(command, args) as span:
+            start = time.time()
+            status = 'error'
+            try:
+                if self.__interaction_log:
+                    result = await self.__interaction_log.execute_async(
+                        SENZA_INTERACTION, senza_command, lambda: self.__run_senza_async(command, senza_command))
+                else:
+                    result = await self.__run_senza_async(command, senza_command)
+                status = self.__get_status(command, result)
+                return result
+            except subprocess.CalledProcessError as e:
+                status = str(e.returncode)
+                raise
+            finally:
+                span.set_attribute('status', status)
+                self.__record_command(command, status, time.time() - start)
+
+    async def __run_senza_async(self, command: str, senza_command: list):
+        if command in NON_JSON_COMMANDS:
+            process = await asyncio.create_subprocess_exec(*senza_command)
+            result = await process.wait()
+        else:
+            process = await asyncio.create_subprocess_exec(*senza_command, stdout=asyncio.subprocess.PIPE)
+            output, _ = await process.communicate()
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(returncode=process.returncode, cmd=senza_command, output=output)
+            result = self.__parse_senza_output(output)
+        return result
+
+    @contextmanager
+    def __trace(self, command: str, args: tuple):
+        attributes = {'region': self.__region, 'arguments': ' '.join(map(str, args))}
+        if self.__tracer:
+            with self.__tracer.span('senza ' + command, 'senza', attributes) as span:
+                yield span
+        else:
+            yield Span(attributes)
+
+    def __record_command(self, command: str, status: str, seconds: float):
+        if self.__metrics:
+            self.__metrics.observe(REQUEST_DURATION, seconds, {'kind': 'senza', 'action': command})
+            self.__metrics.increment(REQUESTS, {'kind': 'senza', 'action': command, 'status': status})
+
+    def __report_created_resources(self, stack_name: str, events: list):
+        if self.__progress_reporter:
+            created_resources = len(list(filter(lambda x: x['ResourceStatus'] == 'CREATE_COMPLETE' and
+                                                x['resource_type'] != 'CloudFormation::Stack', events or [])))
+            self.__progress_reporter.report(stack_name, 'create-stack', 'resources-created', created_resources,
+                                            region=self.__region)
+
+    def __count_poll_iteration(self, loop: str):
+        if self.__metrics:
+            self.__metrics.increment(POLL_ITERATIONS, {'loop': loop})
+
+    def __sleep(self, seconds: float):
+        if self.__interaction_log:
+            self.__interaction_log.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    async def __sleep_async(self, seconds: float):
+        if self.__interaction_log:
+            await self.__interaction_log.sleep_async(seconds)
+        else:
+            await asyncio.sleep(seconds)
+
+    @staticmethod
+    def __get_status(command: str, result):
+        # Commands without JSON output return their exit code, all others fail with an exception
+        return str(result) if command in NON_JSON_COMMANDS else '0'
+
+    @staticmethod
+    def __parse_senza_output(output):
+        if output and isinstance(output, bytes):
+            return json.loads(output.decode(encoding='utf-8'))
+        else:
+            return None
+
+    @staticmethod
+    def __get_stack_version_with_weight(stack_versions: list, weight: int):
+        matching_versions = list(filter(lambda x: x['weight%'] == float(weight), stack_versions))
+        if matching_versions:
+            return matching_versions[0]['version']
+        else:
+            return None
+
+    @staticmethod
+    def __is_stack_creation_complete(events: list, stack_name: str, stack_version: str, image_version: str):
+        events = sorted(events, key=lambda k: k['event_time'])
+        if events:
+            last_event = events[-1]
+            if last_event['ResourceStatus'] == 'CREATE_COMPLETE' and \
+                    last_event['resource_type'] == 'CloudFormation::Stack':
+                return True
+            elif last_event['ResourceStatus'] in ['CREATE_FAILED', 'ROLLBACK_IN_PROGRESS', 'DELETE_IN_PROGRESS',
+                                                  'DELETE_COMPLETE', 'ROLLBACK_COMPLETE']:
+                raise Exception('Creation of stack [{}] version [{}] with image version [{}] failed'
+                                .format(stack_name, stack_version, image_version))
+        return False
+
+    @staticmethod
+    def __verify_traffic_output(traffic_output, stack_name: str, stack_version: str, weight: int):
         if traffic_output and isinstance(traffic_output, list):
             for traffic_element in traffic_output:
                 if (traffic_element['stack_name'] == stack_name and traffic_element['version'] == stack_version and
@@ -138,19 +364,3 @@ class SenzaWrapper:
             return
         else:
             raise Exception('Unexpected output: [{}]'.format(traffic_output))
-
-    def __execute_senza(self, command: str, *args):
-        senza_command = [SENZA, command, '--region', self.__region]
-
-        if command in ['create', 'delete']:
-            senza_command += list(args)
-            result = subprocess.call(senza_command)
-        else:
-            senza_command += ['--output', 'json']
-            senza_command += list(args)
-            output = subprocess.check_output(senza_command)
-            if output and isinstance(output, bytes):
-                result = json.loads(output.decode(encoding='utf-8'))
-            else:
-                result = None
-        return result
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+
+DEFAULT_TARGET_QUEUE_SIZE = 20
+DEFAULT_MAX_DELAY = 10
+DEFAULT_SAMPLE_INTERVAL = 5
+MIN_DELAY = 0.1
+OVERSEER_QUEUES = ['overseer_queue_size', 'overseer_work_queue_size', 'overseer_collection_queue_size']
+
+
+class SubmissionThrottle:
+    """
+    Delays the submission of Collections API operations so that the overseer queues stay below a target size. The
+    queue size is sampled at most once per sample interval; the delay is doubled while the queues are above the target
+    and halved while they are below half of the target, so operations are submitted as fast as the overseer
+    processes them instead of flooding it.
+    """
+
+    __target_queue_size = DEFAULT_TARGET_QUEUE_SIZE
+    __max_delay = DEFAULT_MAX_DELAY
+    __sample_interval = DEFAULT_SAMPLE_INTERVAL
+    __delay = 0
+    __last_sample = None
+    __lock = None
+
+    def __init__(self, target_queue_size: int = DEFAULT_TARGET_QUEUE_SIZE, max_delay: float = DEFAULT_MAX_DELAY,
+                 sample_interval: float = DEFAULT_SAMPLE_INTERVAL):
+        if target_queue_size < 1:
+            raise Exception('Invalid target size of overseer queues: [{}]'.format(target_queue_size))
+        self.__target_queue_size = target_queue_size
+        self.__max_delay = max_delay
+        self.__sample_interval = sample_interval
+        self.__lock = threading.Lock()
+
+    def get_delay(self):
+        return self.__delay
+
+    def wait(self, get_queue_size, sleep=None):
+        """
+        Sleep for the current delay before an operation is submitted. If the last sample is older than the sample
+        interval, the queue size is sampled with the given function first. The delay is waited with the given sleep
+        function, e.g. to compress it while a deployment is replayed. Returns the seconds slept.
+        """
+        with self.__lock:
+            if self.__last_sample is None or time.time() - self.__last_sample >= self.__sample_interval:
+                self.__last_sample = time.time()
+                try:
+                    self.update(get_queue_size())
+                except Exception as e:
+                    logging.warning('Could not sample size of overseer queues: {}'.format(e))
+            delay = self.__delay
+        if delay:
+            (sleep or time.sleep)(delay)
+        return delay
+
+    def update(self, queue_size: int):
+        if queue_size > self.__target_queue_size:
+            delay = min(max(self.__delay * 2, MIN_DELAY), self.__max_delay)
+        elif queue_size < self.__target_queue_size / 2:
+            delay = self.__delay / 2 if self.__delay / 2 >= MIN_DELAY else 0
+        else:
+            delay = self.__delay
+        if delay != self.__delay:
+            logging.info('Changing submission delay to [{}]s at overseer queue size [{}]'.format(delay, queue_size))
+        self.__delay = delay
+        return delay
+
+    @staticmethod
+    def get_queue_size(overseer_status: dict):
+        return sum(map(lambda x: int(overseer_status.get(x, 0)), OVERSEER_QUEUES))
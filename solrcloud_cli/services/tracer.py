@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+class Span:
+    """
+    Attributes of a traced operation, which can be extended while the operation is running.
+    """
+
+    __attributes = None
+
+    def __init__(self, attributes: dict = None):
+        self.__attributes = dict(attributes or dict())
+
+    def set_attribute(self, key: str, value):
+        self.__attributes[key] = value
+
+    def get_attributes(self):
+        return self.__attributes
+
+
+class Tracer:
+    """
+    Records spans of phases, Solr requests and senza commands and exports them in the Trace Event Format, which can be
+    loaded into chrome://tracing or Perfetto. Spans are nested by time within each thread, so the spans of a phase
+    show the requests and commands it has been waiting for.
+    """
+
+    __events = None
+    __thread_ids = None
+    __lock = None
+
+    def __init__(self):
+        self.__events = list()
+        self.__thread_ids = set()
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, category: str, attributes: dict = None):
+        span = Span(attributes)
+        start = time.time()
+        try:
+            yield span
+        except Exception as e:
+            span.set_attribute('error', str(e))
+            raise
+        finally:
+            self.__add_span(name, category, start, time.time(), span.get_attributes())
+
+    def counter(self, name: str, values: dict):
+        """
+        Record the current values of a counter, which trace viewers show as a graph over time.
+        """
+        event = {
+            'name': name,
+            'ph': 'C',
+            'ts': int(time.time() * 1000000),
+            'pid': os.getpid(),
+            'args': values
+        }
+        with self.__lock:
+            self.__events.append(event)
+
+    def get_events(self):
+        with self.__lock:
+            return list(self.__events)
+
+    def save(self, file_name: str):
+        with open(file_name, 'w') as fd:
+            json.dump({'traceEvents': self.get_events(), 'displayTimeUnit': 'ms'}, fd)
+
+    def __add_span(self, name: str, category: str, start: float, end: float, attributes: dict):
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': int(start * 1000000),
+            'dur': int((end - start) * 1000000),
+            'pid': os.getpid(),
+            'tid': thread.ident,
+            'args': attributes
+        }
+        with self.__lock:
+            if thread.ident not in self.__thread_ids:
+                self.__thread_ids.add(thread.ident)
+                self.__events.append({
+                    'name': 'thread_name',
+                    'ph': 'M',
+                    'pid': os.getpid(),
+                    'tid': thread.ident,
+                    'args': {'name': thread.name}
+                })
+            self.__events.append(event)
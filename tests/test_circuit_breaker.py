@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import urllib.error
+import urllib.request
+
+from mock import MagicMock, patch
+from unittest import TestCase
+
+from solrcloud_cli.controllers.cluster_bootstrap_controller import ClusterBootstrapController
+from solrcloud_cli.controllers.cluster_delete_controller import ClusterDeleteController
+from solrcloud_cli.controllers.cluster_deployment_controller import ClusterDeploymentController
+from solrcloud_cli.services.circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, HALF_OPEN, OPEN
+
+BASE_URL = 'http://example.org/solr'
+API_URL = BASE_URL + '/admin/collections'
+STACK_NAME = 'test'
+
+
+class TestCircuitBreaker(TestCase):
+
+    def test_should_open_after_consecutive_failures_and_fail_fast(self):
+        circuit_breaker = CircuitBreaker(BASE_URL, failure_threshold=3)
+
+        for failed in [True, True, False, True, True]:
+            circuit_breaker.before_request()
+            circuit_breaker.after_request(failed)
+        self.assertEqual(CLOSED, circuit_breaker.get_state())
+
+        circuit_breaker.after_request(True)
+        self.assertEqual(OPEN, circuit_breaker.get_state())
+        with self.assertRaisesRegex(CircuitOpenError, 'is open'):
+            circuit_breaker.before_request()
+
+    @patch('time.time')
+    def test_should_close_after_successful_probe(self, time_mock):
+        time_mock.return_value = 100.0
+        circuit_breaker = CircuitBreaker(BASE_URL, failure_threshold=1, reset_timeout=60)
+        circuit_breaker.after_request(True)
+
+        time_mock.return_value = 160.0
+        self.assertTrue(circuit_breaker.before_request())
+        self.assertEqual(HALF_OPEN, circuit_breaker.get_state())
+        with self.assertRaisesRegex(CircuitOpenError, 'is half-open'):
+            circuit_breaker.before_request()
+
+        circuit_breaker.after_request(False)
+        self.assertEqual(CLOSED, circuit_breaker.get_state())
+        self.assertFalse(circuit_breaker.before_request())
+
+    @patch('time.time')
+    def test_should_open_again_after_failed_probe(self, time_mock):
+        time_mock.return_value = 100.0
+        circuit_breaker = CircuitBreaker(BASE_URL, failure_threshold=5, reset_timeout=60)
+        for _ in range(5):
+            circuit_breaker.after_request(True)
+
+        time_mock.return_value = 160.0
+        circuit_breaker.before_request()
+        circuit_breaker.after_request(True)
+
+        self.assertEqual(OPEN, circuit_breaker.get_state())
+        time_mock.return_value = 219.0
+        with self.assertRaises(CircuitOpenError):
+            circuit_breaker.before_request()
+        time_mock.return_value = 220.0
+        self.assertTrue(circuit_breaker.before_request())
+
+    def test_should_exhaust_and_refill_retry_budget(self):
+        circuit_breaker = CircuitBreaker(BASE_URL, retry_budget=2)
+
+        circuit_breaker.spend_retry('CREATE')
+        circuit_breaker.spend_retry('ADDREPLICA')
+        with self.assertRaisesRegex(CircuitOpenError, r'not retrying \[CREATE\]'):
+            circuit_breaker.spend_retry('CREATE')
+
+        for _ in range(10):
+            circuit_breaker.after_request(False)
+        self.assertEqual(1, circuit_breaker.get_remaining_retries())
+        circuit_breaker.spend_retry('CREATE')
+        for _ in range(30):
+            circuit_breaker.after_request(False)
+        self.assertEqual(2, circuit_breaker.get_remaining_retries())
+
+    def test_should_fail_fast_for_all_controllers_sharing_the_endpoint(self):
+        urlopen_mock = urllib.request.urlopen = MagicMock(
+            side_effect=urllib.error.HTTPError(API_URL, 503, 'Service Unavailable', {}, None))
+        circuit_breaker = CircuitBreaker(BASE_URL, failure_threshold=2)
+        controllers = list()
+        for stack_name in ['first', 'second']:
+            controller = ClusterDeleteController(base_url=BASE_URL, stack_name=stack_name, oauth_token='token',
+                                                 senza_wrapper=MagicMock())
+            controller.set_circuit_breaker(circuit_breaker)
+            controllers.append(controller)
+
+        for controller in controllers:
+            with self.assertRaises(Exception):
+                controller.get_cluster_state()
+        with self.assertRaisesRegex(Exception, r'Circuit breaker of Solr endpoint \[{}\] is open'.format(BASE_URL)):
+            controllers[0].get_cluster_state()
+
+        self.assertEqual(2, urlopen_mock.call_count)
+
+    def test_should_not_guard_requests_to_single_nodes(self):
+        response_mock = MagicMock()
+        response_mock.getcode.return_value = 200
+        response_mock.read.return_value = json.dumps({}).encode('utf-8')
+        urllib.request.urlopen = MagicMock(return_value=response_mock)
+        circuit_breaker = CircuitBreaker(BASE_URL, failure_threshold=1)
+        circuit_breaker.after_request(True)
+        controller = ClusterDeleteController(base_url=BASE_URL, stack_name=STACK_NAME, oauth_token='token',
+                                             senza_wrapper=MagicMock())
+        controller.set_circuit_breaker(circuit_breaker)
+
+        controller._send_request('http://10.0.0.1:8983/solr/admin/metrics?wt=json')
+
+        with self.assertRaises(CircuitOpenError):
+            controller._send_request(API_URL + '?action=CLUSTERSTATUS&wt=json')
+
+    def test_should_fail_when_probe_does_not_complete_within_reset_timeout(self):
+        circuit_breaker = CircuitBreaker(BASE_URL, failure_threshold=1, reset_timeout=0.05, wait=True)
+        circuit_breaker.after_request(True)
+        self.assertTrue(circuit_breaker.before_request())
+
+        with self.assertRaisesRegex(CircuitOpenError, r'Probe of Solr endpoint \[{}\] did not complete'.format(
+                BASE_URL)):
+            circuit_breaker.before_request()
+        self.assertEqual(HALF_OPEN, circuit_breaker.get_state())
+
+    def test_should_not_open_on_gateway_timeouts(self):
+        urlopen_mock = urllib.request.urlopen = MagicMock(
+            side_effect=urllib.error.HTTPError(API_URL, 504, 'Gateway Timeout', {}, None))
+        circuit_breaker = CircuitBreaker(BASE_URL, failure_threshold=2)
+        controller = ClusterDeleteController(base_url=BASE_URL, stack_name=STACK_NAME, oauth_token='token',
+                                             senza_wrapper=MagicMock())
+        controller.set_circuit_breaker(circuit_breaker)
+
+        for _ in range(3):
+            with self.assertRaises(urllib.error.HTTPError):
+                controller._send_request(API_URL + '?action=CLUSTERSTATUS&wt=json')
+
+        self.assertEqual(CLOSED, circuit_breaker.get_state())
+        self.assertEqual(3, urlopen_mock.call_count)
+
+    @patch('time.sleep')
+    def test_should_neither_sleep_nor_spend_retries_while_circuit_is_open(self, sleep_mock):
+        urlopen_mock = urllib.request.urlopen = MagicMock()
+        circuit_breaker = CircuitBreaker(BASE_URL, failure_threshold=1, retry_budget=3)
+        circuit_breaker.after_request(True)
+        bootstrap_controller = ClusterBootstrapController(base_url=BASE_URL, stack_name=STACK_NAME, sharding_level=1,
+                                                          replication_factor=1, image_version='0.0.0',
+                                                          oauth_token='token', senza_wrapper=MagicMock())
+        deployment_controller = ClusterDeploymentController(base_url=BASE_URL, stack_name=STACK_NAME,
+                                                            image_version='0.0.0', oauth_token='token',
+                                                            senza_wrapper=MagicMock())
+        for controller in [bootstrap_controller, deployment_controller]:
+            controller.set_circuit_breaker(circuit_breaker)
+
+        for _ in range(4):
+            with self.assertRaisesRegex(Exception, 'is open'):
+                bootstrap_controller.add_collection_to_cluster('test')
+            with self.assertRaisesRegex(Exception, 'is open'):
+                deployment_controller.add_replica_to_cluster('test', 'shard1', '0.0.0.0:8983_solr')
+
+        self.assertEqual(3, circuit_breaker.get_remaining_retries())
+        sleep_mock.assert_not_called()
+        urlopen_mock.assert_not_called()
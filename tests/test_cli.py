@@ -1,4 +1,11 @@
 import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 
 from mock import patch, Mock
 from unittest import TestCase
@@ -10,6 +17,27 @@ from solrcloud_cli.controllers.cluster_deployment_controller import ClusterDeplo
 from solrcloud_cli.controllers.cluster_bootstrap_controller import ClusterBootstrapController
 
 from solrcloud_cli.cli import solrcloud_cli
+from solrcloud_cli.services.senza_wrapper import SenzaWrapper
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be imported when a command is executed
+LAZY_MODULES = [
+    'solrcloud_cli.controllers.cluster_bootstrap_controller',
+    'solrcloud_cli.controllers.cluster_delete_controller',
+    'solrcloud_cli.controllers.cluster_deployment_controller',
+    'solrcloud_cli.services.senza_wrapper',
+    'yaml',
+    'urllib.request'
+]
+
+
+def write_config(application_id: str, account: str):
+    fd, config = tempfile.mkstemp(suffix='.yaml')
+    with os.fdopen(fd, 'w') as config_file:
+        config_file.write('ApplicationId: {}\nSolrBaseUrl: http://{}.example.org/solr/\nAccount: {}\n'
+                          .format(application_id, application_id, account))
+    return config
 
 
 class TestCLI(TestCase):
@@ -25,6 +53,16 @@ class TestCLI(TestCase):
         self.assertIn('positional arguments:', output)
         self.assertIn('optional arguments:', output)
 
+    def test_should_not_import_controllers_when_importing_cli(self):
+        statement = 'import sys, solrcloud_cli.cli; print(chr(10).join(sys.modules.keys()))'
+        output, _ = subprocess.Popen([sys.executable, '-c', statement], cwd=ROOT_DIR,
+                                     stdout=subprocess.PIPE).communicate()
+        imported_modules = output.decode('utf-8').split()
+
+        self.assertIn('solrcloud_cli.cli', imported_modules)
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, imported_modules, 'Module is imported on startup')
+
     def test_should_return_error_if_no_argument_given(self):
         with self.assertRaises(SystemExit) as ex:
             solrcloud_cli([])
@@ -95,9 +133,275 @@ class TestCLI(TestCase):
         solrcloud_cli(['switch'])
         mock_method.assert_called_once_with()
 
+    @patch('solrcloud_cli.controllers.cluster_deployment_controller.ClusterDeploymentController.__init__',
+           Mock(return_value=None))
+    @patch.object(ClusterDeploymentController, 'reap_deleted_clusters')
+    def test_should_execute_reap_command(self, mock_method):
+        solrcloud_cli(['reap'])
+        mock_method.assert_called_once_with()
+
+    @patch('solrcloud_cli.controllers.cluster_deployment_controller.ClusterDeploymentController.__init__',
+           Mock(return_value=None))
+    @patch.object(ClusterDeploymentController, 'set_migration_plan_file')
+    @patch.object(ClusterDeploymentController, 'apply_migration')
+    def test_should_execute_apply_command_with_plan_file(self, mock_method, plan_file_mock):
+        solrcloud_cli(['--plan-file', 'test-plan.json', 'apply'])
+        mock_method.assert_called_once_with()
+        plan_file_mock.assert_called_once_with('test-plan.json')
+
+    @patch('solrcloud_cli.controllers.cluster_deployment_controller.ClusterDeploymentController.__init__',
+           Mock(return_value=None))
+    @patch.object(ClusterDeploymentController, 'set_interaction_log')
+    @patch.object(SenzaWrapper, 'set_interaction_log')
+    @patch.object(ClusterDeploymentController, 'deploy_new_version')
+    def test_should_record_interactions_of_command(self, mock_method, senza_log_mock, controller_log_mock):
+        directory = tempfile.mkdtemp()
+        try:
+            record_file = os.path.join(directory, 'interactions.log')
+            solrcloud_cli(['--record', record_file, 'deploy'])
+            mock_method.assert_called_once_with()
+            interaction_log = controller_log_mock.call_args[0][0]
+            self.assertEqual(record_file, interaction_log.get_file_name())
+            senza_log_mock.assert_called_once_with(interaction_log)
+        finally:
+            shutil.rmtree(directory)
+
+    @patch('solrcloud_cli.controllers.cluster_deployment_controller.ClusterDeploymentController.__init__',
+           Mock(return_value=None))
+    @patch.object(ClusterDeploymentController, 'set_traffic_ramp')
+    @patch.object(ClusterDeploymentController, 'switch_traffic')
+    def test_should_execute_switch_command_with_traffic_ramp(self, mock_method, traffic_ramp_mock):
+        solrcloud_cli(['--traffic-ramp', '10,25,50', 'switch'])
+        mock_method.assert_called_once_with()
+        traffic_ramp_mock.assert_called_once_with([10, 25, 50])
+
     @patch('solrcloud_cli.controllers.cluster_delete_controller.ClusterDeleteController.__init__',
            Mock(return_value=None))
     @patch.object(ClusterDeleteController, 'delete_cluster')
     def test_should_execute_delete_command(self, mock_method):
         solrcloud_cli(['delete'])
         mock_method.assert_called_once_with()
+
+    @patch('solrcloud_cli.controllers.cluster_deployment_controller.ClusterDeploymentController.__init__',
+           Mock(return_value=None))
+    @patch.object(ClusterDeploymentController, 'deploy_new_version')
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_should_execute_deploy_command_in_all_regions(self, out, mock_method):
+        solrcloud_cli(['--region', 'eu-west-1', '--region', 'eu-central-1', 'deploy'])
+
+        self.assertEqual(2, len(mock_method.call_args_list))
+        output = out.getvalue()
+        self.assertIn('Region [eu-west-1]: [deploy] succeeded', output)
+        self.assertIn('Region [eu-central-1]: [deploy] succeeded', output)
+
+    @patch('solrcloud_cli.controllers.cluster_deployment_controller.ClusterDeploymentController.__init__',
+           Mock(return_value=None))
+    @patch.object(ClusterDeploymentController, 'switch_traffic', side_effect=[None, Exception('test')])
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_should_execute_command_in_all_regions_although_it_failed_in_one_region(self, out, mock_method):
+        with self.assertRaisesRegex(Exception, 'Command \\[switch\\] failed in regions: \\[eu-[a-z]+-1\\]'):
+            solrcloud_cli(['--region', 'eu-west-1', '--region', 'eu-central-1', 'switch'])
+
+        self.assertEqual(2, len(mock_method.call_args_list))
+        self.assertIn('[switch] failed: test', out.getvalue())
+
+    @patch('solrcloud_cli.controllers.cluster_deployment_controller.ClusterDeploymentController.__init__',
+           Mock(return_value=None))
+    @patch.object(ClusterDeploymentController, 'set_region')
+    @patch.object(ClusterDeploymentController, 'switch_traffic')
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_should_pass_region_to_controller(self, out, mock_method, set_region_mock):
+        solrcloud_cli(['--region', 'eu-west-1', '--region', 'eu-central-1', 'switch'])
+
+        self.assertListEqual(['eu-central-1', 'eu-west-1'],
+                             sorted(map(lambda x: x[0][0], set_region_mock.call_args_list)))
+
+    @patch('solrcloud_cli.controllers.cluster_deployment_controller.ClusterDeploymentController.__init__',
+           Mock(return_value=None))
+    @patch.object(ClusterDeploymentController, 'set_connection_pool')
+    @patch.object(ClusterDeploymentController, 'switch_traffic')
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_should_share_connection_pool_in_all_regions(self, out, mock_method, set_connection_pool_mock):
+        solrcloud_cli(['--region', 'eu-west-1', '--region', 'eu-central-1', 'switch'])
+
+        connection_pools = list(map(lambda x: x[0][0], set_connection_pool_mock.call_args_list))
+        self.assertEqual(2, len(connection_pools))
+        self.assertIs(connection_pools[0], connection_pools[1])
+
+    @patch.object(ClusterDeploymentController, 'switch_traffic')
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_should_use_solr_base_url_of_region(self, out, mock_method):
+        fd, config = tempfile.mkstemp(suffix='.yaml')
+        with os.fdopen(fd, 'w') as config_file:
+            config_file.write('ApplicationId: solrcloud-test\n'
+                              'SolrBaseUrl:\n'
+                              '  eu-west-1: http://eu-west-1.example.org/solr/\n'
+                              '  eu-central-1: http://eu-central-1.example.org/solr/\n')
+        init_mock = Mock(return_value=None)
+        try:
+            with patch.object(ClusterDeploymentController, '__init__', init_mock):
+                solrcloud_cli(['-f', config, '--region', 'eu-west-1', '--region', 'eu-central-1', 'switch'])
+        finally:
+            os.remove(config)
+
+        base_urls = sorted(map(lambda x: x[1]['base_url'], init_mock.call_args_list))
+        self.assertListEqual(['http://eu-central-1.example.org/solr/', 'http://eu-west-1.example.org/solr/'],
+                             base_urls)
+
+    @patch('solrcloud_cli.controllers.cluster_deployment_controller.ClusterDeploymentController.__init__',
+           Mock(return_value=None))
+    @patch.object(ClusterDeploymentController, 'switch_traffic')
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_should_fail_for_region_missing_in_setting(self, out, mock_method):
+        fd, config = tempfile.mkstemp(suffix='.yaml')
+        with os.fdopen(fd, 'w') as config_file:
+            config_file.write('ApplicationId: solrcloud-test\n'
+                              'SolrBaseUrl:\n'
+                              '  eu-west-1: http://eu-west-1.example.org/solr/\n')
+        try:
+            with self.assertRaisesRegex(Exception, r'failed in regions: \[eu-central-1\]'):
+                solrcloud_cli(['-f', config, '--region', 'eu-west-1', '--region', 'eu-central-1', 'switch'])
+        finally:
+            os.remove(config)
+
+        self.assertEqual(1, len(mock_method.call_args_list))
+        self.assertIn('Setting [SolrBaseUrl] has no value for region [eu-central-1]', out.getvalue())
+
+    @patch.object(ClusterDeploymentController, 'deploy_new_version')
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_should_reject_benchmark_with_node_migration(self, out, mock_method):
+        solrcloud_cli(['-f', os.path.join(ROOT_DIR, 'example.yaml'), '--benchmark-queries', 'queries.txt',
+                       '--migration-strategy', 'node', 'deploy'])
+
+        self.assertIn('Benchmark queries can not be combined with node migration', out.getvalue())
+        self.assertIn('usage: ', out.getvalue())
+        mock_method.assert_not_called()
+
+    @patch.object(ClusterDeploymentController, 'deploy_new_version')
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_should_reject_journal_file_for_multiple_regions(self, out, mock_method):
+        solrcloud_cli(['-f', os.path.join(ROOT_DIR, 'example.yaml'), '--region', 'eu-west-1', '--region',
+                       'eu-central-1', '--journal-file', 'journal.json', 'deploy'])
+
+        self.assertIn('Journal file can only be given for a single stack and region: journal.json', out.getvalue())
+        self.assertIn('usage: ', out.getvalue())
+        mock_method.assert_not_called()
+
+    @patch.object(ClusterDeploymentController, 'deploy_new_version')
+    @patch.object(SenzaWrapper, 'add_parameter')
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_should_execute_deploy_command_for_all_stacks_of_fleet(self, out, parameter_mock, deploy_mock):
+        configs = [write_config('solrcloud-a', 'team-a'), write_config('solrcloud-b', 'team-b')]
+        init_mock = Mock(return_value=None)
+        try:
+            with patch.object(ClusterDeploymentController, '__init__', init_mock):
+                solrcloud_cli(['-f', configs[0], '-f', configs[1], 'deploy'])
+        finally:
+            for config in configs:
+                os.remove(config)
+
+        self.assertEqual(2, len(deploy_mock.call_args_list))
+        stack_names = sorted(map(lambda x: x[1]['stack_name'], init_mock.call_args_list))
+        self.assertListEqual(['solrcloud-a', 'solrcloud-b'], stack_names)
+        self.assertNotIn('Account', map(lambda x: x[0][0], parameter_mock.call_args_list))
+        self.assertIn('Stack [solrcloud-a]: [deploy] succeeded', out.getvalue())
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_should_not_exceed_concurrency_limit_per_account_for_fleet(self, out):
+        configs = [write_config('solrcloud-a', 'team-a'), write_config('solrcloud-b', 'team-a'),
+                   write_config('solrcloud-c', 'team-b'), write_config('solrcloud-d', 'team-b')]
+        accounts = {'solrcloud-a': 'team-a', 'solrcloud-b': 'team-a', 'solrcloud-c': 'team-b', 'solrcloud-d': 'team-b'}
+        lock = threading.Lock()
+        running = {'team-a': 0, 'team-b': 0, 'all': 0}
+        max_running = {'team-a': 0, 'team-b': 0, 'all': 0}
+        deployed_stacks = list()
+
+        def init(controller, **kwargs):
+            controller.stack_name = kwargs['stack_name']
+
+        def deploy(controller):
+            account = accounts[controller.stack_name]
+            with lock:
+                for key in [account, 'all']:
+                    running[key] += 1
+                    max_running[key] = max(max_running[key], running[key])
+            time.sleep(0.05)
+            with lock:
+                for key in [account, 'all']:
+                    running[key] -= 1
+                deployed_stacks.append(controller.stack_name)
+
+        try:
+            with patch.object(ClusterDeploymentController, '__init__', init), \
+                    patch.object(ClusterDeploymentController, 'deploy_new_version', deploy):
+                solrcloud_cli(['-f', configs[0], '-f', configs[1], '-f', configs[2], '-f', configs[3],
+                               '--max-concurrency', '3', '--max-concurrency-per-account', '1', 'deploy'])
+        finally:
+            for config in configs:
+                os.remove(config)
+
+        self.assertListEqual(sorted(accounts.keys()), sorted(deployed_stacks))
+        self.assertEqual(1, max_running['team-a'])
+        self.assertEqual(1, max_running['team-b'])
+        self.assertLessEqual(max_running['all'], 2)
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_should_not_exceed_global_concurrency_limit_for_fleet(self, out):
+        configs = list(map(lambda x: write_config('solrcloud-' + x, 'team-' + x), ['a', 'b', 'c', 'd']))
+        lock = threading.Lock()
+        running = {'all': 0, 'max': 0}
+
+        def deploy(controller):
+            with lock:
+                running['all'] += 1
+                running['max'] = max(running['max'], running['all'])
+            time.sleep(0.05)
+            with lock:
+                running['all'] -= 1
+
+        try:
+            with patch.object(ClusterDeploymentController, '__init__', Mock(return_value=None)), \
+                    patch.object(ClusterDeploymentController, 'deploy_new_version', deploy):
+                solrcloud_cli(['-f', configs[0], '-f', configs[1], '-f', configs[2], '-f', configs[3],
+                               '--max-concurrency', '2', 'deploy'])
+        finally:
+            for config in configs:
+                os.remove(config)
+
+        self.assertEqual(0, running['all'])
+        self.assertLessEqual(running['max'], 2)
+
+    @patch('solrcloud_cli.controllers.cluster_deployment_controller.ClusterDeploymentController.__init__',
+           Mock(return_value=None))
+    @patch.object(ClusterDeploymentController, 'deploy_new_version', side_effect=Exception('test'))
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_should_report_all_failed_stacks_of_fleet(self, out, deploy_mock):
+        configs = [write_config('solrcloud-a', 'team-a'), write_config('solrcloud-b', 'team-b')]
+        try:
+            with self.assertRaisesRegex(Exception, 'Command \\[deploy\\] failed in stacks: '
+                                                   '\\[solrcloud-a, solrcloud-b\\]'):
+                solrcloud_cli(['-f', configs[0], '-f', configs[1], 'deploy'])
+        finally:
+            for config in configs:
+                os.remove(config)
+
+    @patch('solrcloud_cli.controllers.cluster_deployment_controller.ClusterDeploymentController.__init__',
+           Mock(return_value=None))
+    @patch.object(ClusterDeploymentController, 'deploy_new_version')
+    @patch.object(ClusterDeploymentController, 'set_circuit_breaker')
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_should_share_circuit_breaker_of_solr_endpoint_in_all_regions(self, out, circuit_breaker_mock,
+                                                                          deploy_mock):
+        fd, config = tempfile.mkstemp(suffix='.yaml')
+        with os.fdopen(fd, 'w') as config_file:
+            config_file.write('ApplicationId: solrcloud-test\nSolrBaseUrl: http://example.org/solr/\n')
+        try:
+            solrcloud_cli(['-f', config, '--region', 'eu-west-1', '--region', 'eu-central-1', '--circuit-breaker',
+                           '--retry-budget', '10', 'deploy'])
+        finally:
+            os.remove(config)
+
+        self.assertEqual(2, len(circuit_breaker_mock.call_args_list))
+        circuit_breakers = list(map(lambda x: x[0][0], circuit_breaker_mock.call_args_list))
+        self.assertIs(circuit_breakers[0], circuit_breakers[1])
+        self.assertEqual(10, circuit_breakers[0].get_remaining_retries())
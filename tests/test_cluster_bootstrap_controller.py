@@ -8,6 +8,7 @@ from testfixtures import log_capture
 
 import json
 import os
+import re
 import urllib.error
 import urllib.request
 import urllib.response
@@ -132,6 +133,69 @@ class TestClusterBootstrapController(TestCase):
         urllib.request.urlopen = MagicMock(side_effect=side_effects)
         self.assertEqual(0, self.__controller.add_collection_to_cluster('test'))
 
+    def test_should_wait_for_final_state_of_created_collection(self):
+        def send_request(request):
+            response_mock = MagicMock()
+            response_mock.getcode.return_value = HTTP_CODE_OK
+            content = {'status': {'state': 'completed'}} if 'action=REQUESTSTATUS' in request.get_full_url() else {}
+            response_mock.read.return_value = json.dumps(content).encode('utf-8')
+            return response_mock
+
+        urlopen_mock = urllib.request.urlopen = MagicMock(side_effect=send_request)
+        self.__controller.set_wait_for_final_state(True)
+
+        self.assertEqual(0, self.__controller.add_collection_to_cluster('test'))
+
+        called_urls = list(map(lambda x: x[0][0].get_full_url(), urlopen_mock.call_args_list))
+        self.assertEqual(4, len(called_urls))
+        self.assertRegex(called_urls[1], '^' + re.escape(
+            API_URL + '?action=CREATE&name=test&numShards=1&replicationFactor=3&maxShardsPerNode=1'
+                      '&collection.configName=test&waitForFinalState=true&async=' + STACK_NAME + '-') + '[0-9a-f]+$')
+        request_id = called_urls[1].split('&async=')[1]
+        self.assertListEqual([
+            API_URL + '?action=DELETESTATUS&requestid=' + request_id + '&wt=json',
+            API_URL + '?action=REQUESTSTATUS&requestid=' + request_id + '&wt=json',
+            API_URL + '?action=DELETESTATUS&requestid=' + request_id + '&wt=json'
+        ], [called_urls[0]] + called_urls[2:])
+
+    def test_should_delete_collection_and_retry_when_async_creation_failed(self):
+        states = ['failed', 'completed']
+
+        def send_request(request):
+            response_mock = MagicMock()
+            response_mock.getcode.return_value = HTTP_CODE_OK
+            content = {}
+            if 'action=REQUESTSTATUS' in request.get_full_url():
+                content = {'status': {'state': states.pop(0), 'msg': 'replica did not become active'}}
+            response_mock.read.return_value = json.dumps(content).encode('utf-8')
+            return response_mock
+
+        urlopen_mock = urllib.request.urlopen = MagicMock(side_effect=send_request)
+        self.__controller.set_wait_for_final_state(True)
+
+        self.assertEqual(0, self.__controller.add_collection_to_cluster('test'))
+
+        actions = list(map(lambda x: re.search('action=([A-Z]+)', x[0][0].get_full_url()).group(1),
+                           urlopen_mock.call_args_list))
+        self.assertListEqual(['DELETESTATUS', 'CREATE', 'REQUESTSTATUS', 'DELETESTATUS', 'DELETE',
+                              'DELETESTATUS', 'CREATE', 'REQUESTSTATUS', 'DELETESTATUS'], actions)
+        self.assertIn(API_URL + '?action=DELETE&name=test',
+                      list(map(lambda x: x[0][0].get_full_url(), urlopen_mock.call_args_list)))
+
+    def test_should_raise_exception_when_async_creation_keeps_failing(self):
+        response_mock = MagicMock()
+        response_mock.getcode.return_value = HTTP_CODE_OK
+        response_mock.read.return_value = json.dumps({'status': {'state': 'failed', 'msg': 'no space left'}}).encode(
+            'utf-8')
+        urlopen_mock = urllib.request.urlopen = MagicMock(return_value=response_mock)
+        self.__controller.set_wait_for_final_state(True)
+
+        with self.assertRaisesRegex(Exception, 'failed: no space left'):
+            self.__controller.add_collection_to_cluster('test')
+
+        creates = list(filter(lambda x: 'action=CREATE' in x[0][0].get_full_url(), urlopen_mock.call_args_list))
+        self.assertEqual(2, len(creates))
+
     def test_should_add_all_collections_to_cluster(self):
         urlopen_mock = MagicMock(side_effect=self.__side_effect_return_cluster_state)
         urllib.request.urlopen = urlopen_mock
@@ -1,17 +1,29 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from mock import MagicMock
+from mock import call, patch, MagicMock
 from unittest import TestCase
-from solrcloud_cli.controllers.cluster_deployment_controller import ClusterDeploymentController
+from solrcloud_cli.controllers.cluster_deployment_controller import ClusterDeploymentController, \
+    REPLICATION_RATE_PROPERTY
+from solrcloud_cli.services.concurrency_limiter import ConcurrencyLimiter
+from solrcloud_cli.services.metrics import Metrics, PHASE_DURATION, REQUEST_DURATION, REQUESTS, RETRIES
+from solrcloud_cli.services.migration_plan import MigrationPlan
+from solrcloud_cli.services.progress_reporter import ProgressReporter
+from solrcloud_cli.services.query_runner import QueryResults
+from solrcloud_cli.services.recovery_monitor import RecoveryMonitor
 from solrcloud_cli.services.senza_wrapper import SenzaWrapper
 
+import io
 import json
+import os
 import re
+import tempfile
 import urllib.error
 import urllib.request
 import urllib.response
 
+from collections import OrderedDict
+
 BASE_URL = 'http://example.org/solr'
 API_URL = BASE_URL + '/admin/collections'
 STACK_NAME = 'test'
@@ -319,6 +331,33 @@ CLUSTER_INACTIVE_SHARD_NO_REPLICAS = {
 }
 
 
+def create_collection(shards: int, replication_factor: int, nodes: list):
+    collection = {'replicationFactor': str(replication_factor), 'shards': {}}
+    for shard in range(shards):
+        replicas = dict()
+        for replica in range(replication_factor):
+            replicas['core_shard{}_replica{}'.format(shard + 1, replica + 1)] = {
+                'core': 'core_shard{}_replica{}'.format(shard + 1, replica + 1),
+                'node_name': nodes[(shard * replication_factor + replica) % len(nodes)] + ':8983_solr',
+                'state': 'active'
+            }
+        collection['shards']['shard{}'.format(shard + 1)] = {'state': 'active', 'replicas': replicas}
+    return collection
+
+
+def create_query_metrics_response(requests: int, errors: int, p99_latency: float):
+    response_mock = MagicMock()
+    response_mock.getcode.return_value = 200
+    response_mock.read.return_value = json.dumps({'metrics': {
+        'solr.core.{}.shard1.replica_n1'.format(COLLECTION): {
+            'QUERY./select.requestTimes': {'count': requests, 'p99_ms': p99_latency},
+            'QUERY./select.errors': {'count': errors}
+        },
+        'solr.jvm': {}
+    }}).encode('utf-8')
+    return response_mock
+
+
 class TestClusterDeploymentController(TestCase):
 
     __controller = None
@@ -362,6 +401,24 @@ class TestClusterDeploymentController(TestCase):
         urllib.request.urlopen = MagicMock(side_effect=side_effects)
         self.assertEqual(0, self.__controller.add_replica_to_cluster('test', 'test', 'test'))
 
+    def test_should_record_metrics_of_retried_request_when_adding_replica(self):
+        response_mock = MagicMock()
+        response_mock.getcode.return_value = HTTP_CODE_OK
+        side_effects = [
+            urllib.error.HTTPError(url=None, code=HTTP_CODE_BAD_REQUEST, msg=None, hdrs=None, fp=None),
+            response_mock
+        ]
+        urllib.request.urlopen = MagicMock(side_effect=side_effects)
+        metrics = Metrics()
+        self.__controller.set_metrics(metrics)
+
+        self.__controller.add_replica_to_cluster('test', 'test', 'test')
+
+        self.assertEqual(1, metrics.get_counter(REQUESTS, {'kind': 'solr', 'action': 'ADDREPLICA', 'status': '400'}))
+        self.assertEqual(1, metrics.get_counter(REQUESTS, {'kind': 'solr', 'action': 'ADDREPLICA', 'status': '200'}))
+        self.assertEqual(1, metrics.get_counter(RETRIES, {'operation': 'ADDREPLICA'}))
+        self.assertEqual(2, metrics.get_histogram(REQUEST_DURATION, {'kind': 'solr', 'action': 'ADDREPLICA'})['count'])
+
     def test_should_return_failure_because_of_unknown_http_error_when_adding_new_replica_to_cluster(self):
         urllib.request.urlopen = MagicMock(side_effect=self.__side_effect_unknown_http_error)
         with self.assertRaisesRegex(Exception, 'Failed sending request to Solr \[{}\]: HTTP Error {}: .*'
@@ -399,6 +456,49 @@ class TestClusterDeploymentController(TestCase):
         for url in urls:
             self.assertIn(url, called_urls, 'URL was not called')
 
+    def test_should_report_progress_when_adding_nodes_to_cluster(self):
+        urllib.request.urlopen = MagicMock(side_effect=[
+            self.__side_effect_return_cluster_state_all_registered_nodes(None),
+            self.__side_effect_all_ok(''),
+            self.__side_effect_all_ok(''),
+            self.__side_effect_all_ok(''),
+            self.__side_effect_return_cluster_state_all_nodes(None)
+        ])
+        senza_mock = MagicMock()
+        senza_mock.get_stack_instances.return_value = NEW_NODES
+        self.__controller.set_senza_wrapper(senza_mock)
+        stream = io.StringIO()
+        self.__controller.set_progress_reporter(ProgressReporter(stream))
+
+        self.__controller.add_new_nodes_to_cluster()
+
+        events = list(map(json.loads, stream.getvalue().splitlines()))
+        self.assertListEqual([('replicas-added', 1, 3), ('replicas-added', 2, 3), ('replicas-added', 3, 3),
+                              ('replicas-active', 3, 3)],
+                             list(map(lambda x: (x['unit'], x['done'], x['total']), events)))
+        self.assertEqual(0, events[-1]['remaining'])
+
+    def test_should_not_request_cluster_state_when_creating_controller(self):
+        urlopen_mock = MagicMock(side_effect=self.__side_effect_return_cluster_state_old_nodes)
+        urllib.request.urlopen = urlopen_mock
+        senza_mock = MagicMock()
+
+        controller = ClusterDeploymentController(base_url=BASE_URL, stack_name=STACK_NAME,
+                                                 image_version=IMAGE_VERSION, oauth_token=OAUTH_TOKEN,
+                                                 senza_wrapper=senza_mock)
+        controller.switch_traffic()
+
+        urlopen_mock.assert_not_called()
+
+    def test_should_discover_cluster_layout_only_once(self):
+        urlopen_mock = MagicMock(side_effect=self.__side_effect_return_cluster_state_old_nodes)
+        urllib.request.urlopen = urlopen_mock
+
+        self.__controller.discover_cluster_layout()
+        self.__controller.discover_cluster_layout()
+
+        self.assertEquals(1, len(urlopen_mock.call_args_list), 'Cluster layout was discovered more than once')
+
     def test_should_return_error_because_of_not_enough_nodes_for_cluster_layout(self):
         urllib.request.urlopen = MagicMock(side_effect=self.__side_effect_return_cluster_state_old_nodes)
         senza_mock = MagicMock()
@@ -407,6 +507,69 @@ class TestClusterDeploymentController(TestCase):
         with self.assertRaises(Exception, msg='Not enough instances for current cluster layout: [2]<[3]'):
             self.__controller.add_new_nodes_to_cluster()
 
+    def test_should_require_as_many_nodes_as_the_largest_collection_has_replicas(self):
+        cluster_state = {'cluster': {'collections': {
+            'small': create_collection(1, 2, OLD_NODES),
+            'large': create_collection(2, 2, OLD_NODES)
+        }}}
+        layout = ClusterDeploymentController.get_cluster_layout(cluster_state)
+
+        self.assertEquals(4, ClusterDeploymentController.get_required_number_of_nodes(layout))
+
+    def test_should_spread_replicas_of_collections_with_different_layouts_over_new_nodes(self):
+        new_nodes = ['1.1.1.0', '1.1.1.1', '1.1.1.2', '1.1.1.3']
+        cluster_state = {'cluster': {'collections': OrderedDict([
+            ('first', create_collection(1, 2, OLD_NODES)),
+            ('second', create_collection(1, 2, OLD_NODES)),
+            ('third', create_collection(2, 2, OLD_NODES))
+        ])}}
+        layout = ClusterDeploymentController.get_cluster_layout(cluster_state)
+
+        replicas = ClusterDeploymentController.get_missing_replicas(cluster_state, layout, new_nodes)
+
+        self.assertListEqual([
+            ('first', 'shard1', '1.1.1.0:8983_solr'),
+            ('first', 'shard1', '1.1.1.1:8983_solr'),
+            ('second', 'shard1', '1.1.1.2:8983_solr'),
+            ('second', 'shard1', '1.1.1.3:8983_solr'),
+            ('third', 'shard1', '1.1.1.0:8983_solr'),
+            ('third', 'shard1', '1.1.1.1:8983_solr'),
+            ('third', 'shard2', '1.1.1.2:8983_solr'),
+            ('third', 'shard2', '1.1.1.3:8983_solr')
+        ], replicas)
+
+    def test_should_find_replicas_on_nodes_for_every_shard(self):
+        cluster_state = {'cluster': {'collections': {COLLECTION: create_collection(2, 2, OLD_NODES + NEW_NODES)}}}
+
+        replicas = ClusterDeploymentController.get_replicas_on_nodes(cluster_state, [OLD_NODES[0], NEW_NODES[0]])
+
+        self.assertDictEqual({
+            (COLLECTION, 'shard1'): ['core_shard1_replica1'],
+            (COLLECTION, 'shard2'): ['core_shard2_replica2']
+        }, dict(replicas))
+
+    def test_should_detect_replicas_that_are_not_active(self):
+        cluster_state = {'cluster': {'collections': {COLLECTION: create_collection(2, 2, OLD_NODES)}}}
+        self.assertTrue(ClusterDeploymentController.are_all_replicas_active(cluster_state))
+
+        cluster_state['cluster']['collections'][COLLECTION]['shards']['shard2']['replicas']['core_shard2_replica1'][
+            'state'] = 'recovering'
+        self.assertFalse(ClusterDeploymentController.are_all_replicas_active(cluster_state))
+
+    def test_should_only_place_replicas_that_do_not_exist_on_new_nodes(self):
+        cluster_state = {'cluster': {'collections': {COLLECTION: create_collection(1, 3, OLD_NODES)}}}
+        cluster_state['cluster']['collections'][COLLECTION]['shards']['shard1']['replicas']['new_replica'] = {
+            'node_name': NEW_NODES[1] + ':8983_solr', 'state': 'active'
+        }
+        layout = ClusterDeploymentController.get_cluster_layout(cluster_state)
+
+        replicas = ClusterDeploymentController.get_missing_replicas(cluster_state, layout, NEW_NODES)
+
+        self.assertListEqual([
+            (COLLECTION, 'shard1', '1.1.1.0:8983_solr'),
+            (COLLECTION, 'shard1', '1.1.1.2:8983_solr')
+        ], replicas)
+
     def test_should_wait_until_all_nodes_are_active(self):
         http_calls = [
             self.__side_effect_return_cluster_state_all_registered_nodes(None),
@@ -682,6 +845,44 @@ class TestClusterDeploymentController(TestCase):
         senza_passive_versions_mock.assert_called_once_with(STACK_NAME)
         senza_delete_mock.assert_called_once_with(STACK_NAME, 'test-version')
 
+    def test_should_not_wait_for_deletion_of_a_cluster_if_not_requested(self):
+        senza_mock = SenzaWrapper(CONFIG)
+        senza_delete_mock = senza_mock.delete_stack_version = MagicMock()
+        senza_mock.get_passive_stack_version = MagicMock(return_value='test-version')
+
+        controller = ClusterDeploymentController(base_url=BASE_URL, stack_name=STACK_NAME,
+                                                 image_version=IMAGE_VERSION, oauth_token=OAUTH_TOKEN,
+                                                 senza_wrapper=senza_mock)
+        controller.set_wait_for_cluster_deletion(False)
+        controller.delete_cluster()
+
+        senza_delete_mock.assert_called_once_with(STACK_NAME, 'test-version', wait=False)
+
+    def test_should_wait_until_deleted_cluster_versions_are_gone_when_reaping(self):
+        senza_mock = MagicMock()
+        senza_mock.get_stack_versions_in_deletion.side_effect = [
+            [{'version': 'green', 'status': 'DELETE_IN_PROGRESS'}],
+            []
+        ]
+        self.__controller.set_senza_wrapper(senza_mock)
+        self.__controller.set_reaper_retry_wait(0)
+
+        self.__controller.reap_deleted_clusters()
+
+        self.assertEquals(2, len(senza_mock.get_stack_versions_in_deletion.call_args_list))
+
+    def test_should_raise_exception_if_deletion_of_cluster_version_failed_when_reaping(self):
+        senza_mock = MagicMock()
+        senza_mock.get_stack_versions_in_deletion.return_value = [{'version': 'green', 'status': 'DELETE_FAILED'}]
+        self.__controller.set_senza_wrapper(senza_mock)
+        self.__controller.set_reaper_retry_wait(0)
+
+        with self.assertRaisesRegex(Exception, 'Deletion of stack \\[{}\\] is not complete for versions: \\[green\\]'
+                                               .format(STACK_NAME)):
+            self.__controller.reap_deleted_clusters()
+
+        senza_mock.get_stack_versions_in_deletion.assert_called_once_with(STACK_NAME)
+
     def test_should_not_raise_any_exception_when_switching_to_another_cluster_version(self):
         senza_mock = SenzaWrapper(CONFIG)
         senza_switch_mock = senza_mock.switch_traffic = MagicMock()
@@ -695,6 +896,494 @@ class TestClusterDeploymentController(TestCase):
         senza_passive_versions_mock.assert_called_once_with(STACK_NAME)
         senza_switch_mock.assert_called_once_with(STACK_NAME, 'test-version', 100)
 
+    def test_should_ramp_traffic_in_steps_while_new_nodes_are_healthy(self):
+        urllib.request.urlopen = MagicMock(side_effect=[
+            create_query_metrics_response(0, 0, 0),
+            create_query_metrics_response(100, 0, 50),
+            create_query_metrics_response(300, 1, 80)
+        ])
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'green'
+        senza_mock.get_stack_instances.return_value = NEW_NODES[:1]
+        self.__controller.set_senza_wrapper(senza_mock)
+        self.__controller.set_traffic_ramp([10, 50])
+        self.__controller.set_ramp_step_wait(0)
+
+        self.__controller.switch_traffic()
+
+        self.assertListEqual([call(STACK_NAME, 'green', 10), call(STACK_NAME, 'green', 50),
+                              call(STACK_NAME, 'green', 100)], senza_mock.switch_traffic.call_args_list)
+        self.assertEqual('http://{}:8983/solr/admin/metrics?group=core&prefix=QUERY./select&wt=json'.format(
+            NEW_NODES[0]), urllib.request.urlopen.call_args[0][0].get_full_url())
+
+    def test_should_pause_traffic_ramp_while_latency_exceeds_threshold(self):
+        urllib.request.urlopen = MagicMock(side_effect=[
+            create_query_metrics_response(0, 0, 0),
+            create_query_metrics_response(100, 0, 2000),
+            create_query_metrics_response(200, 0, 100)
+        ])
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'green'
+        senza_mock.get_stack_instances.return_value = NEW_NODES[:1]
+        self.__controller.set_senza_wrapper(senza_mock)
+        self.__controller.set_traffic_ramp([10])
+        self.__controller.set_ramp_step_wait(0)
+        self.__controller.set_ramp_max_p99_latency(1000)
+
+        self.__controller.switch_traffic()
+
+        self.assertListEqual([call(STACK_NAME, 'green', 10), call(STACK_NAME, 'green', 100)],
+                             senza_mock.switch_traffic.call_args_list)
+
+    def test_should_roll_back_traffic_ramp_if_error_rate_exceeds_threshold(self):
+        urllib.request.urlopen = MagicMock(side_effect=[
+            create_query_metrics_response(0, 0, 0),
+            create_query_metrics_response(100, 5, 50)
+        ])
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'green'
+        senza_mock.get_stack_instances.return_value = NEW_NODES[:1]
+        self.__controller.set_senza_wrapper(senza_mock)
+        self.__controller.set_traffic_ramp([10, 50])
+        self.__controller.set_ramp_step_wait(0)
+        self.__controller.set_ramp_max_pauses(0)
+        self.__controller.set_ramp_max_error_rate(0.01)
+
+        with self.assertRaisesRegex(Exception, 'Traffic ramp to stack \\[{}\\] version \\[green\\] rolled back at '
+                                               '\\[10\\]%'.format(STACK_NAME)):
+            self.__controller.switch_traffic()
+
+        self.assertListEqual([call(STACK_NAME, 'green', 10), call(STACK_NAME, 'green', 0)],
+                             senza_mock.switch_traffic.call_args_list)
+
+    def test_should_roll_back_traffic_ramp_if_query_metrics_of_new_nodes_are_unavailable(self):
+        urllib.request.urlopen = MagicMock(side_effect=urllib.error.HTTPError(
+            url=None, code=500, msg='Server Error', hdrs=None, fp=None))
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'green'
+        senza_mock.get_stack_instances.return_value = NEW_NODES
+        self.__controller.set_senza_wrapper(senza_mock)
+        self.__controller.set_traffic_ramp([10, 50])
+        self.__controller.set_ramp_step_wait(0)
+        self.__controller.set_ramp_max_pauses(1)
+
+        with self.assertRaisesRegex(Exception, 'rolled back at \\[10\\]%: .*sampled nodes \\[0/3\\]'):
+            self.__controller.switch_traffic()
+
+        self.assertListEqual([call(STACK_NAME, 'green', 10), call(STACK_NAME, 'green', 0)],
+                             senza_mock.switch_traffic.call_args_list)
+        self.assertEqual(9, urllib.request.urlopen.call_count)
+
+    def test_should_reject_traffic_ramp_with_invalid_weights(self):
+        with self.assertRaisesRegex(Exception, 'Traffic weights must be between 1 and 100'):
+            self.__controller.set_traffic_ramp([0, 50])
+
+    def test_should_pair_every_old_node_with_a_new_node(self):
+        cluster_state = {'cluster': {'collections': {
+            COLLECTION: create_collection(2, 2, OLD_NODES[:2] + NEW_NODES[:1])
+        }}}
+
+        self.assertListEqual([
+            ('0.0.0.0:8983_solr', '1.1.1.0:8983_solr'),
+            ('0.0.0.1:8983_solr', '1.1.1.1:8983_solr')
+        ], ClusterDeploymentController.get_node_pairs(cluster_state, NEW_NODES))
+        with self.assertRaisesRegex(Exception, 'Not enough new nodes to replace old nodes: \\[1\\]<\\[3\\]'):
+            ClusterDeploymentController.get_node_pairs(cluster_state, NEW_NODES[1:2])
+
+    def test_should_replace_old_nodes_with_async_requests(self):
+        cluster_state = {'cluster': {'collections': {COLLECTION: create_collection(2, 2, OLD_NODES[:2])}}}
+        states = {}
+
+        def send_request(request):
+            response_mock = MagicMock()
+            response_mock.getcode.return_value = HTTP_CODE_OK
+            url = request.get_full_url()
+            content = {}
+            if 'action=REQUESTSTATUS' in url:
+                request_id = re.search('requestid=([^&]+)', url).group(1)
+                states[request_id] = 'completed' if request_id in states else 'running'
+                content = {'status': {'state': states[request_id]}}
+            response_mock.read.return_value = json.dumps(content).encode('utf-8')
+            return response_mock
+
+        urlopen_mock = urllib.request.urlopen = MagicMock(side_effect=send_request)
+        self.__controller.set_migration_concurrency(2)
+        self.__controller.set_add_node_retry_wait(0.01)
+
+        self.__controller.replace_old_nodes(cluster_state, NEW_NODES)
+
+        urls = list(map(lambda x: x[0][0].get_full_url(), urlopen_mock.call_args_list))
+        replace_urls = sorted(filter(lambda x: 'action=REPLACENODE' in x, urls))
+        self.assertEqual(2, len(replace_urls))
+        self.assertRegex(replace_urls[0], re.escape(API_URL + '?action=REPLACENODE&sourceNode=0.0.0.0:8983_solr'
+                                                    '&targetNode=1.1.1.0:8983_solr&async=' + STACK_NAME + '-'))
+        self.assertRegex(replace_urls[1], 'sourceNode=0.0.0.1:8983_solr&targetNode=1.1.1.1:8983_solr')
+        self.assertEqual(2, len(states))
+        for request_id in states.keys():
+            self.assertEqual(2, urls.count(API_URL + '?action=DELETESTATUS&requestid=' + request_id + '&wt=json'))
+            self.assertEqual(2, urls.count(API_URL + '?action=REQUESTSTATUS&requestid=' + request_id + '&wt=json'))
+
+    def test_should_raise_exception_when_async_request_fails(self):
+        response_mock = MagicMock()
+        response_mock.getcode.return_value = HTTP_CODE_OK
+        response_mock.read.return_value = json.dumps({'status': {
+            'state': 'failed', 'msg': 'found [1] in failed tasks'}}).encode('utf-8')
+        urllib.request.urlopen = MagicMock(return_value=response_mock)
+
+        with self.assertRaisesRegex(Exception, 'Async request \\[test-[0-9a-f]+\\] failed: found \\[1\\] in failed'):
+            self.__controller.replace_node('0.0.0.0:8983_solr', '1.1.1.0:8983_solr')
+
+    def test_should_let_solr_wait_for_final_state_of_added_replicas(self):
+        cluster_state = {'cluster': {'collections': {COLLECTION: create_collection(1, 3, OLD_NODES)}}}
+        urlopen_mock = urllib.request.urlopen = MagicMock(
+            side_effect=self.__create_bulk_delete_side_effect([cluster_state]))
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'green'
+        senza_mock.get_stack_instances.return_value = NEW_NODES
+        self.__controller.set_senza_wrapper(senza_mock)
+        self.__controller.set_wait_for_final_state(True)
+
+        self.__controller.add_new_nodes_to_cluster()
+
+        urls = list(map(lambda x: x[0][0].get_full_url(), urlopen_mock.call_args_list))
+        self.assertEqual(1, urls.count(API_URL + '?action=CLUSTERSTATUS&wt=json'))
+        add_replica_urls = list(filter(lambda x: 'action=ADDREPLICA' in x, urls))
+        add_replica_url = API_URL + '?action=ADDREPLICA&collection={}&shard=shard1&node={}:8983_solr' \
+                                    '&waitForFinalState=true'
+        self.assertListEqual(list(map(lambda x: add_replica_url.format(COLLECTION, x), NEW_NODES)),
+                             list(map(lambda x: x.split('&async=')[0], add_replica_urls)))
+        self.assertEqual(3, len(list(filter(lambda x: 'action=REQUESTSTATUS' in x, urls))))
+
+    def test_should_journal_replicas_only_after_solr_reports_them_active(self):
+        cluster_state = {'cluster': {'collections': {COLLECTION: create_collection(1, 2, OLD_NODES[:2])}}}
+        request_ids = list()
+
+        def send_request(request):
+            response_mock = MagicMock()
+            response_mock.getcode.return_value = HTTP_CODE_OK
+            url = request.get_full_url()
+            content = {}
+            if 'action=CLUSTERSTATUS' in url:
+                content = cluster_state
+            elif 'action=ADDREPLICA' in url:
+                request_ids.append(url.split('&async=')[1])
+            elif 'action=REQUESTSTATUS' in url:
+                state = 'completed' if 'requestid=' + request_ids[0] + '&' in url else 'failed'
+                content = {'status': {'state': state, 'msg': 'recovery failed'}}
+            response_mock.read.return_value = json.dumps(content).encode('utf-8')
+            return response_mock
+
+        urllib.request.urlopen = MagicMock(side_effect=send_request)
+        self.__set_new_nodes()
+        journal_mock = MagicMock()
+        journal_mock.has_replica.return_value = False
+        self.__controller.set_journal(journal_mock)
+        self.__controller.set_wait_for_final_state(True)
+
+        with self.assertRaisesRegex(Exception, 'failed: recovery failed'):
+            self.__controller.add_new_nodes_to_cluster()
+
+        self.assertEqual(2, len(request_ids))
+        journal_mock.add_replica.assert_called_once_with(COLLECTION, 'shard1', NEW_NODES[0] + ':8983_solr')
+
+    def test_should_find_shards_without_enough_active_replicas_outside_nodes(self):
+        cluster_state = {'cluster': {'collections': OrderedDict([
+            ('first', create_collection(1, 4, OLD_NODES[:2] + NEW_NODES[:2])),
+            ('second', create_collection(1, 3, OLD_NODES[:2] + NEW_NODES[:1]))
+        ])}}
+
+        self.assertListEqual([('second', 'shard1')],
+                             ClusterDeploymentController.get_unhealthy_shards(cluster_state, OLD_NODES))
+        self.assertListEqual([('first', 'shard1'), ('second', 'shard1')],
+                             ClusterDeploymentController.get_unhealthy_shards(cluster_state))
+
+        for collection in cluster_state['cluster']['collections'].values():
+            collection['shards']['shard1']['replicas']['core_shard1_replica1']['leader'] = 'true'
+        self.assertListEqual([], ClusterDeploymentController.get_unhealthy_shards(cluster_state))
+
+    def __create_bulk_delete_side_effect(self, cluster_states: list):
+        def send_request(request):
+            response_mock = MagicMock()
+            response_mock.getcode.return_value = HTTP_CODE_OK
+            url = request.get_full_url()
+            content = {}
+            if 'action=CLUSTERSTATUS' in url:
+                content = cluster_states.pop(0) if len(cluster_states) > 1 else cluster_states[0]
+            elif 'action=REQUESTSTATUS' in url:
+                content = {'status': {'state': 'completed'}}
+            response_mock.read.return_value = json.dumps(content).encode('utf-8')
+            return response_mock
+        return send_request
+
+    def test_should_delete_old_nodes_in_bulk_when_all_shards_stay_healthy(self):
+        before = {'cluster': {'collections': {COLLECTION: create_collection(2, 4, OLD_NODES[:2] + NEW_NODES[:2])}}}
+        after = {'cluster': {'collections': {COLLECTION: create_collection(2, 2, NEW_NODES[:2])}}}
+        for shard in after['cluster']['collections'][COLLECTION]['shards'].values():
+            list(shard['replicas'].values())[0]['leader'] = 'true'
+        urlopen_mock = urllib.request.urlopen = MagicMock(
+            side_effect=self.__create_bulk_delete_side_effect([before, after]))
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'blue'
+        senza_mock.get_stack_instances.return_value = OLD_NODES
+        self.__controller.set_senza_wrapper(senza_mock)
+        self.__controller.set_delete_nodes_in_bulk(True)
+
+        self.__controller.delete_old_nodes_from_cluster()
+
+        urls = list(map(lambda x: x[0][0].get_full_url(), urlopen_mock.call_args_list))
+        self.assertListEqual([
+            API_URL + '?action=DELETENODE&node=0.0.0.0:8983_solr',
+            API_URL + '?action=DELETENODE&node=0.0.0.1:8983_solr'
+        ], sorted(map(lambda x: x.split('&async=')[0], filter(lambda x: 'action=DELETENODE' in x, urls))))
+        self.assertEqual(0, len(list(filter(lambda x: 'action=DELETEREPLICA' in x, urls))))
+        self.assertEqual(2, urls.count(API_URL + '?action=CLUSTERSTATUS&wt=json'))
+
+    def test_should_delete_replicas_one_by_one_when_shard_would_lose_too_many_replicas(self):
+        cluster_state = {'cluster': {'collections': {
+            COLLECTION: create_collection(1, 3, OLD_NODES[:2] + NEW_NODES[:1])
+        }}}
+        urlopen_mock = urllib.request.urlopen = MagicMock(
+            side_effect=self.__create_bulk_delete_side_effect([cluster_state]))
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'blue'
+        senza_mock.get_stack_instances.return_value = OLD_NODES
+        self.__controller.set_senza_wrapper(senza_mock)
+        self.__controller.set_delete_nodes_in_bulk(True)
+        self.__controller.verify_shard_health = MagicMock()
+
+        self.__controller.delete_old_nodes_from_cluster()
+
+        urls = list(map(lambda x: x[0][0].get_full_url(), urlopen_mock.call_args_list))
+        self.assertEqual(0, len(list(filter(lambda x: 'action=DELETENODE' in x, urls))))
+        delete_replica_url = API_URL + '?action=DELETEREPLICA&collection={}&shard=shard1&replica={}'
+        self.assertListEqual([
+            delete_replica_url.format(COLLECTION, 'core_shard1_replica1'),
+            delete_replica_url.format(COLLECTION, 'core_shard1_replica2')
+        ], list(filter(lambda x: 'action=DELETEREPLICA' in x, urls)))
+
+    def test_should_limit_replication_rate_once_while_adding_replicas_and_restore_it(self):
+        def create_response(content: dict):
+            response_mock = MagicMock()
+            response_mock.getcode.return_value = HTTP_CODE_OK
+            response_mock.read.return_value = json.dumps(content).encode('utf-8')
+            return response_mock
+
+        cluster_state = {'cluster': {
+            'collections': OrderedDict([('first', create_collection(1, 1, OLD_NODES)),
+                                        ('second', create_collection(1, 1, OLD_NODES))]),
+            'live_nodes': list(map(lambda x: x + ':8983_solr', OLD_NODES[:1] + NEW_NODES[:1]))
+        }}
+        urlopen_mock = urllib.request.urlopen = MagicMock(side_effect=[
+            create_response({'overlay': {'userProps': {REPLICATION_RATE_PROPERTY: '50'}}}),
+            create_response({'overlay': {}}),
+            create_response({}),
+            create_response({}),
+            create_response({}),
+            create_response({})
+        ])
+        self.__controller.set_replication_max_rate(20)
+
+        with self.__controller.limit_replication_rate(cluster_state):
+            self.assertEqual(4, urlopen_mock.call_count)
+
+        requests = list(map(lambda x: x[0][0], urlopen_mock.call_args_list))
+        self.assertListEqual([
+            BASE_URL + '/first/config/overlay?wt=json',
+            BASE_URL + '/second/config/overlay?wt=json',
+            BASE_URL + '/first/config',
+            BASE_URL + '/second/config',
+            BASE_URL + '/first/config',
+            BASE_URL + '/second/config'
+        ], list(map(lambda x: x.get_full_url(), requests)))
+        self.assertListEqual([
+            {'set-user-property': {REPLICATION_RATE_PROPERTY: '20'}},
+            {'set-user-property': {REPLICATION_RATE_PROPERTY: '20'}},
+            {'set-user-property': {REPLICATION_RATE_PROPERTY: '50'}},
+            {'unset-user-property': REPLICATION_RATE_PROPERTY}
+        ], list(map(lambda x: json.loads(x.data.decode('utf-8')), filter(lambda x: x.data, requests))))
+        self.assertEqual('application/json', requests[2].get_header('Content-type'))
+
+    def test_should_limit_replication_rate_while_solr_waits_for_final_state_of_added_replicas(self):
+        cluster_state = {'cluster': {'collections': {COLLECTION: create_collection(1, 3, OLD_NODES)}}}
+        urlopen_mock = urllib.request.urlopen = MagicMock(
+            side_effect=self.__create_bulk_delete_side_effect([cluster_state]))
+        self.__set_new_nodes()
+        self.__controller.set_wait_for_final_state(True)
+        self.__controller.set_replication_max_rate(20)
+
+        self.__controller.add_new_nodes_to_cluster()
+
+        self.assertListEqual(['set', 'ADDREPLICA', 'ADDREPLICA', 'ADDREPLICA', 'REQUESTSTATUS', 'REQUESTSTATUS',
+                              'REQUESTSTATUS', 'unset'], self.__get_replication_rate_and_actions(urlopen_mock))
+
+    def test_should_wait_for_added_replicas_while_concurrency_limit_is_reached(self):
+        cluster_state = {'cluster': {'collections': {COLLECTION: create_collection(1, 3, OLD_NODES)}}}
+        urlopen_mock = urllib.request.urlopen = MagicMock(
+            side_effect=self.__create_bulk_delete_side_effect([cluster_state]))
+        self.__set_new_nodes()
+        self.__controller.set_wait_for_final_state(True)
+        self.__controller.set_concurrency_limiter(ConcurrencyLimiter(max_limit=1))
+
+        self.__controller.add_new_nodes_to_cluster()
+
+        self.assertListEqual(['ADDREPLICA', 'REQUESTSTATUS', 'ADDREPLICA', 'REQUESTSTATUS', 'ADDREPLICA',
+                              'REQUESTSTATUS'], self.__get_replication_rate_and_actions(urlopen_mock))
+
+    def test_should_limit_replication_rate_while_replacing_old_nodes(self):
+        cluster_state = {'cluster': {'collections': {COLLECTION: create_collection(1, 2, OLD_NODES[:2])}}}
+        urlopen_mock = urllib.request.urlopen = MagicMock(
+            side_effect=self.__create_bulk_delete_side_effect([cluster_state]))
+        self.__set_new_nodes()
+        self.__controller.set_migration_strategy('node')
+        self.__controller.set_migration_concurrency(1)
+        self.__controller.set_replication_max_rate(20)
+
+        self.__controller.add_new_nodes_to_cluster()
+
+        self.assertListEqual(['set', 'REPLACENODE', 'REQUESTSTATUS', 'REPLACENODE', 'REQUESTSTATUS', 'unset'],
+                             self.__get_replication_rate_and_actions(urlopen_mock))
+
+    def __set_new_nodes(self):
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'green'
+        senza_mock.get_stack_instances.return_value = NEW_NODES
+        self.__controller.set_senza_wrapper(senza_mock)
+
+    @staticmethod
+    def __get_replication_rate_and_actions(urlopen_mock: MagicMock):
+        """
+        Changes of the replication rate and all Collections API operations and status requests in the order they were
+        sent.
+        """
+        actions = list()
+        for request in map(lambda x: x[0][0], urlopen_mock.call_args_list):
+            if request.data:
+                actions.append(list(json.loads(request.data.decode('utf-8')).keys())[0].split('-')[0])
+            else:
+                action = re.search('action=([A-Z]+)', request.get_full_url())
+                if action and action.group(1) in ['ADDREPLICA', 'REPLACENODE', 'REQUESTSTATUS']:
+                    actions.append(action.group(1))
+        return actions
+
+    @patch('time.time')
+    def test_should_fail_early_when_recovery_of_replica_stalls(self, time_mock):
+        cluster_state = {'cluster': {'collections': {
+            COLLECTION: create_collection(1, 2, [OLD_NODES[0], NEW_NODES[0]])
+        }}}
+        cluster_state['cluster']['collections'][COLLECTION]['shards']['shard1']['replicas']['core_shard1_replica2'][
+            'state'] = 'recovering'
+        details = {'details': {'slave': {'isReplicating': 'true', 'bytesDownloadedInBytes': 100,
+                                         'bytesToDownloadInBytes': 1000}}}
+        response_mock = MagicMock()
+        response_mock.getcode.return_value = HTTP_CODE_OK
+        response_mock.read.return_value = json.dumps(details).encode('utf-8')
+        urlopen_mock = urllib.request.urlopen = MagicMock(return_value=response_mock)
+        self.__controller.set_recovery_stall_timeout(60)
+        monitor = RecoveryMonitor(stall_timeout=60)
+        replicas = [(COLLECTION, 'shard1', NEW_NODES[0] + ':8983_solr')]
+
+        time_mock.return_value = 100.0
+        self.__controller.monitor_recoveries(monitor, cluster_state, replicas)
+        time_mock.return_value = 160.0
+        self.__controller.monitor_recoveries(monitor, cluster_state, replicas)
+        time_mock.return_value = 170.0
+        with self.assertRaisesRegex(Exception, 'Recovery of replicas has not progressed for more than \\[60\\]s: '
+                                               '\\[core_shard1_replica2 on 1.1.1.0\\]'):
+            self.__controller.monitor_recoveries(monitor, cluster_state, replicas)
+
+        self.assertEqual('http://1.1.1.0:8983/solr/core_shard1_replica2/replication?command=details&wt=json',
+                         urlopen_mock.call_args[0][0].get_full_url())
+
+    def test_should_send_warm_up_queries_to_every_replica_on_new_nodes(self):
+        cluster_state = {'cluster': {'collections': OrderedDict([
+            ('first', create_collection(1, 2, NEW_NODES[:2] + OLD_NODES)),
+            ('second', create_collection(1, 1, OLD_NODES))
+        ])}}
+        response_mock = MagicMock()
+        response_mock.getcode.return_value = HTTP_CODE_OK
+        response_mock.read.return_value = json.dumps(cluster_state).encode('utf-8')
+        urlopen_mock = urllib.request.urlopen = MagicMock(return_value=response_mock)
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'green'
+        senza_mock.get_stack_instances.return_value = NEW_NODES
+        self.__controller.set_senza_wrapper(senza_mock)
+        fd, query_file = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as queries:
+            queries.write('first q=shoes\nsecond q=shirts\n')
+        self.__controller.set_warm_up_query_file(query_file)
+        try:
+            self.__controller.warm_up_new_nodes()
+        finally:
+            os.remove(query_file)
+
+        called_urls = list(map(lambda x: x[0][0].get_full_url(), urlopen_mock.call_args_list))
+        self.assertEqual(API_URL + '?action=CLUSTERSTATUS&wt=json', called_urls[0])
+        self.assertListEqual(sorted([
+            'http://1.1.1.0:8983/solr/core_shard1_replica1/select?q=shoes&distrib=false',
+            'http://1.1.1.1:8983/solr/core_shard1_replica2/select?q=shoes&distrib=false'
+        ]), sorted(called_urls[1:]))
+
+    def test_should_skip_warm_up_without_query_file(self):
+        urlopen_mock = urllib.request.urlopen = MagicMock()
+        self.__controller.warm_up_new_nodes()
+        urlopen_mock.assert_not_called()
+
+    def test_should_refuse_switch_when_new_nodes_are_slower_than_old_nodes(self):
+        old_results = QueryResults([0.010] * 90 + [0.050] * 10, 0, 1)
+        new_results = QueryResults([0.011] * 90 + [0.090] * 10, 0, 1)
+
+        regressions = ClusterDeploymentController.get_benchmark_regressions(old_results, new_results, 0.2)
+
+        self.assertListEqual(['p95 latency [90.0]ms > [50.0]ms', 'p99 latency [90.0]ms > [50.0]ms'], regressions)
+
+    def test_should_accept_new_nodes_within_benchmark_tolerance(self):
+        old_results = QueryResults([0.010] * 100, 0, 1)
+        new_results = QueryResults([0.011] * 90, 0, 1)
+
+        self.assertListEqual([], ClusterDeploymentController.get_benchmark_regressions(old_results, new_results, 0.2))
+        self.assertListEqual(['throughput [90.0]/s < [100.0]/s'], ClusterDeploymentController.get_benchmark_regressions(
+            old_results, QueryResults([0.010] * 90, 0, 1), 0.05))
+        self.assertListEqual(['[3] failed queries'], ClusterDeploymentController.get_benchmark_regressions(
+            old_results, QueryResults([0.010] * 100, 3, 1), 0.2))
+
+    def test_should_fail_benchmark_without_baseline_of_old_nodes(self):
+        regressions = ClusterDeploymentController.get_benchmark_regressions(
+            QueryResults([], 0, 30), QueryResults([0.01, 0.02], 0, 30), 0.2)
+
+        self.assertListEqual(['no baseline, old nodes answered no queries'], regressions)
+
+    def test_should_benchmark_old_and_new_nodes_with_same_queries(self):
+        cluster_state = {'cluster': {'collections': OrderedDict([
+            ('first', create_collection(1, 2, [NEW_NODES[0], OLD_NODES[0]]))
+        ])}}
+        response_mock = MagicMock()
+        response_mock.getcode.return_value = HTTP_CODE_OK
+        response_mock.read.return_value = json.dumps(cluster_state).encode('utf-8')
+        urlopen_mock = urllib.request.urlopen = MagicMock(return_value=response_mock)
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'green'
+        senza_mock.get_active_stack_version.return_value = 'blue'
+        senza_mock.get_stack_instances.side_effect = lambda stack, version: OLD_NODES if version == 'blue' else \
+            NEW_NODES
+        self.__controller.set_senza_wrapper(senza_mock)
+        self.__controller.set_benchmark_time(0)
+        self.__controller.set_benchmark_tolerance(100)
+        fd, query_file = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as queries:
+            queries.write('first q=shoes\n')
+        self.__controller.set_benchmark_query_file(query_file)
+        try:
+            self.__controller.benchmark_new_nodes()
+        finally:
+            os.remove(query_file)
+
+        called_urls = list(map(lambda x: x[0][0].get_full_url(), urlopen_mock.call_args_list))
+        self.assertListEqual([
+            API_URL + '?action=CLUSTERSTATUS&wt=json',
+            'http://0.0.0.0:8983/solr/core_shard1_replica2/select?q=shoes&distrib=false',
+            'http://1.1.1.0:8983/solr/core_shard1_replica1/select?q=shoes&distrib=false'
+        ], called_urls)
+
     def test_should_not_raise_exceptions_when_executing_all_deployment_steps(self):
         test_version = 'test-version'
         instances = [
@@ -718,6 +1407,8 @@ class TestClusterDeploymentController(TestCase):
         controller.set_add_node_retry_count(1)
         controller.set_add_node_retry_wait(0)
         controller.set_add_node_timeout(1)
+        metrics = Metrics()
+        controller.set_metrics(metrics)
 
         http_calls = [
             self.__side_effect_return_cluster_state_all_registered_nodes(None),  # create_cluster
@@ -746,6 +1437,185 @@ class TestClusterDeploymentController(TestCase):
         senza_switch_mock.assert_called_once_with(STACK_NAME, test_version, 100)
         senza_delete_mock.assert_called_once_with(STACK_NAME, test_version)
         senza_instances_mock.assert_called_with(STACK_NAME, test_version)
+        for phase in ['create-new-cluster', 'add-new-nodes', 'switch', 'delete-old-nodes', 'delete-old-cluster']:
+            self.assertEqual(1, metrics.get_histogram(PHASE_DURATION, {'phase': phase, 'stack': STACK_NAME,
+                                                                       'region': ''})['count'])
+
+    def test_should_skip_completed_phases_when_resuming_deployment(self):
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'green'
+        journal_mock = MagicMock()
+        journal_mock.matches.return_value = True
+        journal_mock.get_stack_version.return_value = 'green'
+        journal_mock.is_phase_complete.side_effect = lambda x: x in ['create-new-cluster', 'add-new-nodes']
+
+        controller = ClusterDeploymentController(base_url=BASE_URL, stack_name=STACK_NAME,
+                                                 image_version=IMAGE_VERSION, oauth_token=OAUTH_TOKEN,
+                                                 senza_wrapper=senza_mock)
+        controller.set_journal(journal_mock)
+        controller.set_resume_deployment(True)
+        create_mock = controller.create_cluster = MagicMock()
+        add_mock = controller.add_new_nodes_to_cluster = MagicMock()
+        switch_mock = controller.switch_traffic = MagicMock()
+        delete_nodes_mock = controller.delete_old_nodes_from_cluster = MagicMock()
+        delete_mock = controller.delete_cluster = MagicMock()
+
+        controller.deploy_new_version()
+
+        create_mock.assert_not_called()
+        add_mock.assert_not_called()
+        switch_mock.assert_called_once_with()
+        delete_nodes_mock.assert_called_once_with()
+        delete_mock.assert_called_once_with()
+        journal_mock.start.assert_not_called()
+        journal_mock.complete_phase.assert_any_call('switch')
+        journal_mock.clear.assert_called_once_with()
+
+    def test_should_raise_exception_if_journal_does_not_match_stack_version_when_resuming(self):
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'blue'
+        journal_mock = MagicMock()
+        journal_mock.matches.return_value = True
+        journal_mock.get_stack_version.return_value = 'green'
+        journal_mock.is_phase_complete.return_value = False
+        self.__controller.set_senza_wrapper(senza_mock)
+        self.__controller.set_journal(journal_mock)
+        self.__controller.set_resume_deployment(True)
+
+        with self.assertRaisesRegex(Exception, 'does not match current deployment'):
+            self.__controller.deploy_new_version()
+
+    def test_should_start_new_journal_when_not_resuming_deployment(self):
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'green'
+        journal_mock = MagicMock()
+        journal_mock.is_phase_complete.return_value = False
+        self.__controller.set_senza_wrapper(senza_mock)
+        self.__controller.set_journal(journal_mock)
+        for method in ['create_cluster', 'add_new_nodes_to_cluster', 'warm_up_new_nodes', 'benchmark_new_nodes',
+                       'switch_traffic', 'delete_old_nodes_from_cluster', 'delete_cluster']:
+            setattr(self.__controller, method, MagicMock())
+
+        self.__controller.deploy_new_version()
+
+        journal_mock.start.assert_called_once_with(STACK_NAME, IMAGE_VERSION, 'green')
+        self.assertEquals(['create-new-cluster', 'add-new-nodes', 'warm-up', 'benchmark', 'switch',
+                           'delete-old-nodes', 'delete-old-cluster'],
+                          list(map(lambda x: x[0][0], journal_mock.complete_phase.call_args_list)))
+
+    def test_should_add_replicas_recorded_in_journal_that_are_missing_in_cluster_state(self):
+        http_calls = [
+            self.__side_effect_return_cluster_state_all_registered_nodes(None),
+            self.__side_effect_all_ok(''),
+            self.__side_effect_all_ok(''),
+            self.__side_effect_all_ok(''),
+            self.__side_effect_return_cluster_state_all_nodes(None)
+        ]
+        urlopen_mock = MagicMock(side_effect=http_calls)
+        urllib.request.urlopen = urlopen_mock
+        senza_mock = MagicMock()
+        senza_mock.get_stack_instances.return_value = NEW_NODES
+        journal_mock = MagicMock()
+        journal_mock.has_replica.side_effect = lambda collection, shard, node: node == NEW_NODES[0] + ':8983_solr'
+        self.__controller.set_senza_wrapper(senza_mock)
+        self.__controller.set_journal(journal_mock)
+
+        self.__controller.add_new_nodes_to_cluster()
+
+        called_urls = list(map(lambda x: x[0][0].get_full_url(), urlopen_mock.call_args_list))
+        added_nodes = list(map(lambda x: re.search('node=([^&]+)', x).group(1),
+                               filter(lambda x: 'ADDREPLICA' in x, called_urls)))
+        self.assertListEqual(list(map(lambda x: x + ':8983_solr', NEW_NODES)), added_nodes)
+        self.assertEquals(3, len(journal_mock.add_replica.call_args_list))
+
+    def test_should_create_migration_plan_from_one_cluster_state(self):
+        urlopen_mock = MagicMock(side_effect=self.__side_effect_return_cluster_state_all_registered_nodes)
+        urllib.request.urlopen = urlopen_mock
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'green'
+        senza_mock.get_stack_instances.return_value = NEW_NODES
+        self.__controller.set_senza_wrapper(senza_mock)
+
+        plan = self.__controller.create_migration_plan()
+
+        operations = dict(map(lambda x: (x['id'], x), plan.get_operations()))
+        additions = sorted(filter(lambda x: x.startswith('ADDREPLICA'), operations.keys()))
+        deletions = sorted(filter(lambda x: x.startswith('DELETEREPLICA'), operations.keys()))
+        self.assertEquals(1, len(urlopen_mock.call_args_list), 'Cluster state was requested more than once')
+        self.assertListEqual(['ADDREPLICA:{}/{}/{}:8983_solr'.format(COLLECTION, SHARD, x) for x in NEW_NODES],
+                             additions)
+        self.assertListEqual(additions, operations['SWITCHTRAFFIC:green']['depends_on'])
+        self.assertEquals(3, len(deletions))
+        for deletion in deletions:
+            self.assertListEqual(additions + ['SWITCHTRAFFIC:green'], operations[deletion]['depends_on'])
+
+    def test_should_apply_operations_of_migration_plan_after_their_dependencies(self):
+        plan = MigrationPlan(STACK_NAME, 'green')
+        additions = [plan.add_replica(COLLECTION, SHARD, node + ':8983_solr') for node in NEW_NODES]
+        switch_traffic = plan.switch_traffic(additions)
+        plan.delete_replica(COLLECTION, SHARD, 'test-node01_shard1_replica1', '0.0.0.0:8983_solr',
+                            additions + [switch_traffic])
+        urllib.request.urlopen = MagicMock(side_effect=self.__side_effect_return_cluster_state_all_nodes)
+        executed_operations = list()
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'green'
+        senza_mock.switch_traffic.side_effect = lambda *args: executed_operations.append('switch')
+        self.__controller.set_senza_wrapper(senza_mock)
+        self.__controller.add_replica_to_cluster = MagicMock(
+            side_effect=lambda *args: executed_operations.append('add'))
+        self.__controller.delete_replica_from_cluster = MagicMock(
+            side_effect=lambda *args: executed_operations.append('delete'))
+
+        self.__controller.apply_migration_plan(plan)
+
+        self.assertListEqual(['add', 'add', 'add', 'switch', 'delete'], executed_operations)
+        senza_mock.switch_traffic.assert_called_once_with(STACK_NAME, 'green', 100)
+        self.__controller.delete_replica_from_cluster.assert_called_once_with(COLLECTION, SHARD,
+                                                                              'test-node01_shard1_replica1')
+
+    def test_should_raise_exception_if_added_replicas_of_migration_plan_do_not_become_active(self):
+        plan = MigrationPlan(STACK_NAME, 'green')
+        plan.switch_traffic([plan.add_replica(COLLECTION, SHARD, '1.1.1.2:8983_solr')])
+        urllib.request.urlopen = MagicMock(side_effect=self.__side_effect_return_cluster_state_all_nodes_one_not_active)
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'green'
+        self.__controller.set_senza_wrapper(senza_mock)
+        self.__controller.add_replica_to_cluster = MagicMock()
+        self.__controller.set_add_node_timeout(0)
+
+        with self.assertRaisesRegex(Exception, 'Timeout while waiting for replicas to become active'):
+            self.__controller.apply_migration_plan(plan)
+
+        senza_mock.switch_traffic.assert_not_called()
+
+    def test_should_raise_exception_if_migration_plan_has_unresolvable_dependencies(self):
+        plan = MigrationPlan(STACK_NAME, 'green')
+        plan.switch_traffic(['ADDREPLICA:unknown'])
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'green'
+        self.__controller.set_senza_wrapper(senza_mock)
+
+        with self.assertRaisesRegex(Exception, 'Migration plan has unresolvable dependencies'):
+            self.__controller.apply_migration_plan(plan)
+
+    def test_should_raise_exception_if_migration_plan_is_for_other_stack(self):
+        with self.assertRaisesRegex(Exception, 'Migration plan is for stack \\[other\\], not for \\[test\\]'):
+            self.__controller.apply_migration_plan(MigrationPlan('other', 'green'))
+
+    def test_should_raise_exception_if_migration_plan_is_for_other_stack_version(self):
+        plan = MigrationPlan(STACK_NAME, 'green')
+        plan.switch_traffic([plan.add_replica(COLLECTION, SHARD, '1.1.1.2:8983_solr')])
+        senza_mock = MagicMock()
+        senza_mock.get_passive_stack_version.return_value = 'blue'
+        self.__controller.set_senza_wrapper(senza_mock)
+        self.__controller.add_replica_to_cluster = MagicMock()
+
+        with self.assertRaisesRegex(Exception, 'Migration plan is for stack version \\[green\\], but the passive '
+                                               'stack version is \\[blue\\]'):
+            self.__controller.apply_migration_plan(plan)
+
+        self.__controller.add_replica_to_cluster.assert_not_called()
+        senza_mock.switch_traffic.assert_not_called()
 
     def test_should_not_raise_exception_if_shard_is_healthy(self):
         self.__controller.verify_shard_health(COLLECTION, SHARD)
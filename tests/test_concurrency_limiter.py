@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import re
+import threading
+import urllib.error
+import urllib.request
+
+from mock import MagicMock, patch
+from unittest import TestCase
+
+from solrcloud_cli.controllers.cluster_controller import AsyncRequestError
+from solrcloud_cli.controllers.cluster_delete_controller import ClusterDeleteController
+from solrcloud_cli.controllers.cluster_deployment_controller import ClusterDeploymentController
+from solrcloud_cli.services.concurrency_limiter import ConcurrencyLimiter
+from solrcloud_cli.services.metrics import Metrics, CONCURRENCY_LIMIT
+
+BASE_URL = 'http://example.org/solr'
+STACK_NAME = 'test'
+OLD_NODES = ['0.0.0.0', '0.0.0.1', '0.0.0.2', '0.0.0.3']
+NEW_NODES = ['1.1.1.0', '1.1.1.1', '1.1.1.2', '1.1.1.3']
+
+
+def create_cluster_state(nodes: list):
+    replicas = dict(map(lambda x: ('core_node{}'.format(x[0]), {'node_name': x[1] + ':8983_solr', 'state': 'active'}),
+                        enumerate(nodes)))
+    return {'cluster': {'collections': {'test': {'shards': {'shard1': {'state': 'active', 'replicas': replicas}}}}}}
+
+
+class TestConcurrencyLimiter(TestCase):
+
+    def test_should_increase_limit_additively_up_to_maximum(self):
+        limiter = ConcurrencyLimiter(max_limit=3)
+
+        limits = list()
+        for _ in range(6):
+            limits.append(limiter.release(limiter.acquire()))
+
+        self.assertListEqual([2, 2, 2, 3, 3, 3], limits)
+
+    @patch('time.time')
+    def test_should_halve_limit_once_per_burst_of_congested_operations(self, time_mock):
+        time_mock.return_value = 100.0
+        limiter = ConcurrencyLimiter(max_limit=8, initial_limit=8)
+        starts = list(map(lambda x: limiter.acquire(), range(3)))
+
+        time_mock.return_value = 101.0
+        self.assertEqual(4, limiter.release(starts[0], congested=True))
+        self.assertEqual(4, limiter.release(starts[1], congested=True))
+        self.assertEqual(2, limiter.release(limiter.acquire(), congested=True))
+        time_mock.return_value = 200.0
+        self.assertEqual(2, limiter.release(starts[2]))
+        self.assertEqual(1, limiter.release(limiter.acquire(), congested=True))
+
+    @patch('time.time')
+    def test_should_treat_slow_operations_as_congested(self, time_mock):
+        time_mock.return_value = 100.0
+        limiter = ConcurrencyLimiter(max_limit=4, initial_limit=4, latency_threshold=30)
+        start = limiter.acquire()
+
+        time_mock.return_value = 131.0
+
+        self.assertEqual(2, limiter.release(start))
+
+    def test_should_block_operations_above_limit(self):
+        limiter = ConcurrencyLimiter(max_limit=1)
+        self.assertTrue(limiter.has_capacity())
+        start = limiter.acquire()
+        self.assertFalse(limiter.has_capacity())
+        acquired = threading.Event()
+
+        thread = threading.Thread(target=lambda: acquired.set() if limiter.acquire() else None)
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+
+        limiter.release(start)
+        thread.join(1)
+        self.assertTrue(acquired.is_set())
+
+    def test_should_reject_invalid_limits(self):
+        with self.assertRaisesRegex(Exception, 'Invalid concurrency limits'):
+            ConcurrencyLimiter(max_limit=0)
+
+    def test_should_lower_limit_of_controller_on_gateway_timeout(self):
+        response_mock = MagicMock()
+        response_mock.getcode.return_value = 200
+        urllib.request.urlopen = MagicMock(side_effect=[
+            response_mock,
+            urllib.error.HTTPError(url=None, code=504, msg=None, hdrs=None, fp=None)
+        ])
+        metrics = Metrics()
+        controller = ClusterDeleteController(base_url=BASE_URL, stack_name=STACK_NAME, oauth_token='token',
+                                             senza_wrapper=MagicMock())
+        controller.set_concurrency_limiter(ConcurrencyLimiter(max_limit=4, initial_limit=2))
+        controller.set_metrics(metrics)
+
+        controller.delete_collection_in_cluster('first')
+        self.assertEqual({'value': 2, 'min': 2, 'max': 2}, metrics.get_gauge(CONCURRENCY_LIMIT))
+        controller.delete_collection_in_cluster('second')
+
+        self.assertEqual({'value': 1, 'min': 1, 'max': 2}, metrics.get_gauge(CONCURRENCY_LIMIT))
+
+    def test_should_limit_async_operations_until_solr_completed_them(self):
+        lock = threading.Lock()
+        running = {'now': 0, 'max': 0}
+        polls = dict()
+
+        def send_request(request):
+            response_mock = MagicMock()
+            response_mock.getcode.return_value = 200
+            url = request.get_full_url()
+            content = {}
+            with lock:
+                if 'action=REPLACENODE' in url:
+                    running['now'] += 1
+                    running['max'] = max(running['max'], running['now'])
+                elif 'action=REQUESTSTATUS' in url:
+                    request_id = re.search('requestid=([^&]+)', url).group(1)
+                    polls[request_id] = polls.get(request_id, 0) + 1
+                    state = 'completed' if polls[request_id] == 3 else 'running'
+                    if state == 'completed':
+                        running['now'] -= 1
+                    content = {'status': {'state': state}}
+            response_mock.read.return_value = json.dumps(content).encode('utf-8')
+            return response_mock
+
+        urllib.request.urlopen = MagicMock(side_effect=send_request)
+        limiter = ConcurrencyLimiter(max_limit=2)
+        controller = ClusterDeploymentController(base_url=BASE_URL, stack_name=STACK_NAME, image_version='0.0.0',
+                                                 oauth_token='token', senza_wrapper=MagicMock())
+        controller.set_concurrency_limiter(limiter)
+        controller.set_migration_concurrency(4)
+        controller.set_add_node_retry_wait(0.01)
+
+        controller.replace_old_nodes(create_cluster_state(OLD_NODES), NEW_NODES)
+
+        self.assertEqual(4, len(polls))
+        self.assertEqual(0, running['now'])
+        self.assertLessEqual(running['max'], 2)
+        self.assertEqual(0, limiter.get_in_flight())
+
+    def test_should_lower_limit_when_async_operation_failed(self):
+        def send_request(request):
+            response_mock = MagicMock()
+            response_mock.getcode.return_value = 200
+            content = {'status': {'state': 'failed', 'msg': 'replica did not become active'}} \
+                if 'action=REQUESTSTATUS' in request.get_full_url() else {}
+            response_mock.read.return_value = json.dumps(content).encode('utf-8')
+            return response_mock
+
+        urllib.request.urlopen = MagicMock(side_effect=send_request)
+        limiter = ConcurrencyLimiter(max_limit=4, initial_limit=4)
+        controller = ClusterDeploymentController(base_url=BASE_URL, stack_name=STACK_NAME, image_version='0.0.0',
+                                                 oauth_token='token', senza_wrapper=MagicMock())
+        controller.set_concurrency_limiter(limiter)
+
+        with self.assertRaises(AsyncRequestError):
+            controller.replace_node(OLD_NODES[0] + ':8983_solr', NEW_NODES[0] + ':8983_solr')
+
+        self.assertEqual(2, limiter.get_limit())
+        self.assertEqual(0, limiter.get_in_flight())
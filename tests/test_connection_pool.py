@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import threading
+import urllib.error
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from mock import MagicMock
+from unittest import TestCase
+
+from solrcloud_cli.controllers.cluster_delete_controller import ClusterDeleteController
+from solrcloud_cli.services.connection_pool import ConnectionPool
+
+STACK_NAME = 'test'
+
+
+class SolrHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        self.server.requests.append(self.path)
+        code = 500 if 'action=FAIL' in self.path else 200
+        self.__respond(code, json.dumps({'responseHeader': {'status': 0}}).encode('utf-8'))
+        # Close the connection without announcing it, like Solr does after its idle timeout
+        self.close_connection = 'close=true' in self.path
+
+    def do_POST(self):
+        self.server.connections.add(self.client_address)
+        self.server.bodies.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+        self.__respond(200, b'{}')
+
+    def __respond(self, code: int, content: bytes):
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestConnectionPool(TestCase):
+
+    def setUp(self):
+        self.__server = ThreadingHTTPServer(('127.0.0.1', 0), SolrHandler)
+        self.__server.connections = set()
+        self.__server.requests = list()
+        self.__server.bodies = list()
+        threading.Thread(target=self.__server.serve_forever, args=(0.05,), daemon=True).start()
+        self.__base_url = 'http://127.0.0.1:{}/solr'.format(self.__server.server_address[1])
+        self.__pool = ConnectionPool()
+
+    def tearDown(self):
+        self.__pool.close()
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def test_should_reuse_connection_for_requests_of_all_controllers(self):
+        controllers = list()
+        for stack_name in ['first', 'second']:
+            controller = ClusterDeleteController(base_url=self.__base_url, stack_name=stack_name, oauth_token='token',
+                                                 senza_wrapper=MagicMock())
+            controller.set_connection_pool(self.__pool)
+            controllers.append(controller)
+
+        for controller in controllers + controllers:
+            self.assertEqual({'responseHeader': {'status': 0}}, controller.get_cluster_state())
+
+        self.assertEqual(4, len(self.__server.requests))
+        self.assertEqual(1, len(self.__server.connections))
+        self.assertEqual(1, self.__pool.get_opened_connections())
+
+    def test_should_raise_http_error_and_keep_connection(self):
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self.__pool.request(self.__base_url + '/admin/collections?action=FAIL', {})
+        status, content = self.__pool.request(self.__base_url + '/admin/collections?action=CLUSTERSTATUS', {})
+
+        self.assertEqual(500, context.exception.code)
+        self.assertEqual(200, status)
+        self.assertEqual(1, len(self.__server.connections))
+
+    def test_should_send_data_as_post_request(self):
+        controller = ClusterDeleteController(base_url=self.__base_url, stack_name=STACK_NAME, oauth_token='token',
+                                             senza_wrapper=MagicMock())
+        controller.set_connection_pool(self.__pool)
+
+        controller._send_request(self.__base_url + '/test/config', {'set-user-property': {'key': 'value'}})
+
+        self.assertListEqual([{'set-user-property': {'key': 'value'}}], self.__server.bodies)
+
+    def test_should_reopen_idle_connection_closed_by_solr(self):
+        self.__pool.request(self.__base_url + '/admin/collections?action=CLUSTERSTATUS&close=true', {})
+        status, content = self.__pool.request(self.__base_url + '/admin/collections?action=CLUSTERSTATUS', {})
+
+        self.assertEqual(200, status)
+        self.assertEqual(2, len(self.__server.connections))
+        self.assertEqual(2, self.__pool.get_opened_connections())
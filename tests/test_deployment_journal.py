@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+from solrcloud_cli.services.deployment_journal import DeploymentJournal
+
+STACK_NAME = 'test'
+IMAGE_VERSION = '0.0.0'
+STACK_VERSION = 'green'
+
+
+class TestDeploymentJournal(TestCase):
+
+    __directory = None
+    __file_name = None
+
+    def setUp(self):
+        self.__directory = tempfile.mkdtemp()
+        self.__file_name = os.path.join(self.__directory, 'journal', 'test.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.__directory)
+
+    def test_should_persist_completed_phases_and_replicas(self):
+        journal = DeploymentJournal(self.__file_name)
+        journal.start(STACK_NAME, IMAGE_VERSION, STACK_VERSION)
+        journal.complete_phase('create-new-cluster')
+        journal.add_replica('collection', 'shard1', '1.1.1.1:8983_solr')
+
+        restored_journal = DeploymentJournal(self.__file_name)
+
+        self.assertTrue(restored_journal.matches(STACK_NAME, IMAGE_VERSION))
+        self.assertEqual(STACK_VERSION, restored_journal.get_stack_version())
+        self.assertTrue(restored_journal.is_phase_complete('create-new-cluster'))
+        self.assertFalse(restored_journal.is_phase_complete('add-new-nodes'))
+        self.assertTrue(restored_journal.has_replica('collection', 'shard1', '1.1.1.1:8983_solr'))
+        self.assertFalse(restored_journal.has_replica('collection', 'shard2', '1.1.1.1:8983_solr'))
+
+    def test_should_not_match_deployment_of_other_image_version(self):
+        journal = DeploymentJournal(self.__file_name)
+        journal.start(STACK_NAME, IMAGE_VERSION, STACK_VERSION)
+
+        self.assertFalse(DeploymentJournal(self.__file_name).matches(STACK_NAME, '0.0.1'))
+
+    def test_should_discard_previous_deployment_when_starting(self):
+        journal = DeploymentJournal(self.__file_name)
+        journal.start(STACK_NAME, IMAGE_VERSION, STACK_VERSION)
+        journal.complete_phase('create-new-cluster')
+
+        journal.start(STACK_NAME, '0.0.1', 'blue')
+
+        self.assertFalse(DeploymentJournal(self.__file_name).is_phase_complete('create-new-cluster'))
+
+    def test_should_remove_journal_file_when_clearing(self):
+        journal = DeploymentJournal(self.__file_name)
+        journal.start(STACK_NAME, IMAGE_VERSION, STACK_VERSION)
+
+        journal.clear()
+
+        self.assertFalse(os.path.exists(self.__file_name))
+        self.assertFalse(journal.matches(STACK_NAME, IMAGE_VERSION))
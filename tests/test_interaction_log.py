@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import urllib.error
+
+from mock import patch, MagicMock
+from unittest import TestCase
+
+from solrcloud_cli.controllers.cluster_delete_controller import ClusterDeleteController
+from solrcloud_cli.services.interaction_log import InteractionRecorder, InteractionReplayer, SOLR_INTERACTION, \
+    SENZA_INTERACTION
+from solrcloud_cli.services.senza_wrapper import SenzaWrapper
+
+API_URL = 'http://example.org/solr/admin/collections'
+CLUSTER_STATE = {'cluster': {'collections': {}, 'live_nodes': ['1.1.1.1:8983_solr']}}
+STACK_VERSIONS = [{'stack_name': 'test', 'version': 'blue', 'weight%': 100.0}]
+
+
+class TestInteractionLog(TestCase):
+
+    __directory = None
+    __file_name = None
+
+    def setUp(self):
+        self.__directory = tempfile.mkdtemp()
+        self.__file_name = os.path.join(self.__directory, 'interactions.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.__directory)
+
+    def test_should_record_response_and_latency_of_interaction(self):
+        recorder = InteractionRecorder(self.__file_name)
+        response = recorder.execute(SOLR_INTERACTION, API_URL, lambda: 'content')
+        recorder.close()
+
+        with open(self.__file_name, 'r') as fd:
+            interactions = list(map(json.loads, fd))
+
+        self.assertEqual('content', response)
+        self.assertEqual(1, len(interactions))
+        self.assertEqual(SOLR_INTERACTION, interactions[0]['kind'])
+        self.assertEqual(API_URL, interactions[0]['request'])
+        self.assertEqual('content', interactions[0]['response'])
+        self.assertIn('time', interactions[0])
+        self.assertIn('latency', interactions[0])
+
+    def test_should_replay_identical_requests_in_recorded_order(self):
+        recorder = InteractionRecorder(self.__file_name)
+        recorder.execute(SOLR_INTERACTION, API_URL, lambda: 'first')
+        recorder.execute(SOLR_INTERACTION, API_URL, lambda: 'second')
+        recorder.close()
+
+        send_mock = MagicMock()
+        replayer = InteractionReplayer(self.__file_name)
+
+        self.assertEqual('first', replayer.execute(SOLR_INTERACTION, API_URL, send_mock))
+        self.assertEqual('second', replayer.execute(SOLR_INTERACTION, API_URL, send_mock))
+        self.assertFalse(send_mock.called)
+        with self.assertRaisesRegex(Exception, 'No recorded interaction left'):
+            replayer.execute(SOLR_INTERACTION, API_URL, send_mock)
+
+    def test_should_replay_recorded_errors(self):
+        def send_failing_request():
+            raise urllib.error.HTTPError(API_URL, 504, 'Gateway Timeout', None, None)
+
+        def execute_failing_command():
+            raise subprocess.CalledProcessError(returncode=1, cmd=['senza', 'list'])
+
+        recorder = InteractionRecorder(self.__file_name)
+        with self.assertRaises(urllib.error.HTTPError):
+            recorder.execute(SOLR_INTERACTION, API_URL, send_failing_request)
+        with self.assertRaises(subprocess.CalledProcessError):
+            recorder.execute(SENZA_INTERACTION, ['senza', 'list'], execute_failing_command)
+        recorder.close()
+
+        replayer = InteractionReplayer(self.__file_name)
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            replayer.execute(SOLR_INTERACTION, API_URL, MagicMock())
+        self.assertEqual(504, context.exception.code)
+        with self.assertRaises(subprocess.CalledProcessError):
+            replayer.execute(SENZA_INTERACTION, ['senza', 'list'], MagicMock())
+
+    @patch('time.sleep')
+    def test_should_replay_latencies_with_speed(self, sleep_mock):
+        with open(self.__file_name, 'w') as fd:
+            fd.write(json.dumps({'kind': SOLR_INTERACTION, 'request': API_URL, 'response': 'content', 'time': 0,
+                                 'latency': 2.0}) + '\n')
+
+        InteractionReplayer(self.__file_name, speed=4).execute(SOLR_INTERACTION, API_URL, MagicMock())
+
+        sleep_mock.assert_called_once_with(0.5)
+
+    @patch('time.sleep')
+    def test_should_compress_waits_between_polls_with_speed(self, sleep_mock):
+        self.__write_request_status_interactions()
+
+        controller = self.__create_controller(InteractionReplayer(self.__file_name, speed=10))
+        controller._wait_for_async_request('test-1', timeout=600, retry_wait=30)
+
+        self.assertListEqual([3.0, 3.0], list(filter(None, map(lambda x: x[0][0], sleep_mock.call_args_list))))
+
+    @patch('time.sleep')
+    def test_should_skip_waits_between_polls_without_speed(self, sleep_mock):
+        self.__write_request_status_interactions()
+        replayer = InteractionReplayer(self.__file_name)
+
+        controller = self.__create_controller(replayer)
+        controller._wait_for_async_request('test-1', timeout=600, retry_wait=30)
+        replayer.sleep(60)
+
+        self.assertFalse(sleep_mock.called)
+        self.assertEqual(0, replayer.get_number_of_remaining_interactions())
+
+    @patch('time.sleep')
+    def test_should_compress_waits_of_senza_with_speed(self, sleep_mock):
+        with open(self.__file_name, 'w') as fd:
+            delete_command = ['senza', 'delete', '--region', 'eu-west-1', 'test', 'blue']
+            list_command = ['senza', 'list', '--region', 'eu-west-1', '--output', 'json', 'test', 'blue']
+            for request, response in [(delete_command, 0), (list_command, [{'status': 'DELETE_IN_PROGRESS'}]),
+                                      (list_command, [])]:
+                fd.write(json.dumps({'kind': SENZA_INTERACTION, 'request': request, 'response': response,
+                                     'time': 0, 'latency': 0}) + '\n')
+        senza_wrapper = SenzaWrapper('test.yaml')
+        senza_wrapper.set_retry_wait(20)
+        senza_wrapper.set_interaction_log(InteractionReplayer(self.__file_name, speed=4))
+
+        senza_wrapper.delete_stack_version('test', 'blue')
+
+        self.assertListEqual([5.0], list(filter(None, map(lambda x: x[0][0], sleep_mock.call_args_list))))
+
+    @patch('subprocess.check_output')
+    @patch('urllib.request.urlopen')
+    def test_should_drive_controller_from_recorded_interactions(self, urlopen_mock, check_output_mock):
+        response_mock = MagicMock()
+        response_mock.getcode.return_value = 200
+        response_mock.read.return_value = json.dumps(CLUSTER_STATE).encode('utf-8')
+        urlopen_mock.return_value = response_mock
+        check_output_mock.return_value = json.dumps(STACK_VERSIONS).encode('utf-8')
+
+        recorder = InteractionRecorder(self.__file_name)
+        controller = self.__create_controller(recorder)
+        recorded_state = controller.get_cluster_state()
+        recorded_version = controller._senza.get_active_stack_version('test')
+        recorder.close()
+
+        urlopen_mock.reset_mock()
+        check_output_mock.reset_mock()
+        replayer = InteractionReplayer(self.__file_name)
+        controller = self.__create_controller(replayer)
+
+        self.assertEqual(recorded_state, controller.get_cluster_state())
+        self.assertEqual(recorded_version, controller._senza.get_active_stack_version('test'))
+        self.assertEqual(0, replayer.get_number_of_remaining_interactions())
+        self.assertFalse(urlopen_mock.called)
+        self.assertFalse(check_output_mock.called)
+
+    def __write_request_status_interactions(self):
+        url = API_URL + '?action={}&requestid=test-1&wt=json'
+        with open(self.__file_name, 'w') as fd:
+            for action, state in [('REQUESTSTATUS', 'running'), ('REQUESTSTATUS', 'running'),
+                                  ('REQUESTSTATUS', 'completed'), ('DELETESTATUS', None)]:
+                fd.write(json.dumps({'kind': SOLR_INTERACTION, 'request': url.format(action),
+                                     'response': json.dumps({'status': {'state': state}}), 'time': 0,
+                                     'latency': 0}) + '\n')
+
+    @staticmethod
+    def __create_controller(interaction_log):
+        senza_wrapper = SenzaWrapper('test.yaml')
+        senza_wrapper.set_interaction_log(interaction_log)
+        controller = ClusterDeleteController(base_url='http://example.org/solr/', stack_name='test',
+                                             oauth_token='token', senza_wrapper=senza_wrapper)
+        controller.set_interaction_log(interaction_log)
+        return controller
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+from solrcloud_cli.services.metrics import Metrics, CONCURRENCY_LIMIT, REQUEST_DURATION, REQUESTS
+
+LABELS = {'kind': 'solr', 'action': 'ADDREPLICA'}
+
+
+class TestMetrics(TestCase):
+
+    __directory = None
+
+    def setUp(self):
+        self.__directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.__directory)
+
+    def test_should_count_per_name_and_labels(self):
+        metrics = Metrics()
+        metrics.increment(REQUESTS, dict(LABELS, status='200'))
+        metrics.increment(REQUESTS, dict(LABELS, status='200'))
+        metrics.increment(REQUESTS, dict(LABELS, status='504'))
+
+        self.assertEqual(2, metrics.get_counter(REQUESTS, dict(LABELS, status='200')))
+        self.assertEqual(1, metrics.get_counter(REQUESTS, dict(LABELS, status='504')))
+        self.assertEqual(0, metrics.get_counter(REQUESTS, dict(LABELS, status='500')))
+
+    def test_should_observe_latencies_in_cumulative_buckets(self):
+        metrics = Metrics(buckets=[1, 10])
+        metrics.observe(REQUEST_DURATION, 0.5, LABELS)
+        metrics.observe(REQUEST_DURATION, 5, LABELS)
+        metrics.observe(REQUEST_DURATION, 50, LABELS)
+
+        histogram = metrics.get_histogram(REQUEST_DURATION, LABELS)
+
+        self.assertListEqual([1, 2], histogram['buckets'])
+        self.assertEqual(3, histogram['count'])
+        self.assertEqual(55.5, histogram['sum'])
+
+    def test_should_keep_last_lowest_and_highest_value_of_gauges(self):
+        file_name = os.path.join(self.__directory, 'metrics.prom')
+        metrics = Metrics()
+        for limit in [1, 4, 2]:
+            metrics.set_gauge(CONCURRENCY_LIMIT, limit)
+
+        metrics.save_textfile(file_name)
+
+        self.assertEqual({'value': 2, 'min': 1, 'max': 4}, metrics.get_gauge(CONCURRENCY_LIMIT))
+        self.assertIsNone(metrics.get_gauge(CONCURRENCY_LIMIT, LABELS))
+        with open(file_name, 'r') as fd:
+            lines = fd.read().splitlines()
+        self.assertIn('# TYPE solrcloud_cli_concurrency_limit gauge', lines)
+        self.assertIn('solrcloud_cli_concurrency_limit 2', lines)
+
+    def test_should_write_metrics_as_json(self):
+        file_name = os.path.join(self.__directory, 'metrics.json')
+        metrics = Metrics(buckets=[1])
+        metrics.increment(REQUESTS, dict(LABELS, status='200'))
+        metrics.observe(REQUEST_DURATION, 0.5, LABELS)
+
+        metrics.save_json(file_name)
+
+        with open(file_name, 'r') as fd:
+            content = json.load(fd)
+        self.assertEqual([{'name': REQUESTS, 'labels': dict(LABELS, status='200'), 'value': 1}], content['counters'])
+        self.assertEqual([{'name': REQUEST_DURATION, 'labels': LABELS, 'buckets': {'1': 1}, 'sum': 0.5, 'count': 1}],
+                         content['histograms'])
+
+    def test_should_write_metrics_as_prometheus_textfile(self):
+        file_name = os.path.join(self.__directory, 'solrcloud.prom')
+        metrics = Metrics(buckets=[1])
+        metrics.increment(REQUESTS, dict(LABELS, status='200'))
+        metrics.observe(REQUEST_DURATION, 0.5, LABELS)
+
+        metrics.save_textfile(file_name)
+
+        with open(file_name, 'r') as fd:
+            lines = fd.read().splitlines()
+        self.assertIn('# TYPE solrcloud_cli_requests_total counter', lines)
+        self.assertIn('solrcloud_cli_requests_total{action="ADDREPLICA",kind="solr",status="200"} 1', lines)
+        self.assertIn('# TYPE solrcloud_cli_request_duration_seconds histogram', lines)
+        self.assertIn('solrcloud_cli_request_duration_seconds_bucket{action="ADDREPLICA",kind="solr",le="1"} 1', lines)
+        self.assertIn('solrcloud_cli_request_duration_seconds_bucket{action="ADDREPLICA",kind="solr",le="+Inf"} 1',
+                      lines)
+        self.assertIn('solrcloud_cli_request_duration_seconds_count{action="ADDREPLICA",kind="solr"} 1', lines)
+        self.assertFalse(os.path.exists(file_name + '.tmp'))
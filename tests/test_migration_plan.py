@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+
+from unittest import TestCase
+from solrcloud_cli.services.migration_plan import MigrationPlan
+
+STACK_NAME = 'test'
+STACK_VERSION = 'green'
+
+
+class TestMigrationPlan(TestCase):
+
+    def test_should_return_stable_operation_ids(self):
+        plan = MigrationPlan(STACK_NAME, STACK_VERSION)
+
+        add_replica = plan.add_replica('collection', 'shard1', '1.1.1.1:8983_solr')
+        switch_traffic = plan.switch_traffic([add_replica])
+        delete_replica = plan.delete_replica('collection', 'shard1', 'core_node1', '0.0.0.0:8983_solr',
+                                             [add_replica, switch_traffic])
+
+        self.assertEqual('ADDREPLICA:collection/shard1/1.1.1.1:8983_solr', add_replica)
+        self.assertEqual('SWITCHTRAFFIC:green', switch_traffic)
+        self.assertEqual('DELETEREPLICA:collection/shard1/core_node1', delete_replica)
+
+    def test_should_return_length_of_longest_dependency_chain(self):
+        plan = MigrationPlan(STACK_NAME, STACK_VERSION)
+        first_replica = plan.add_replica('collection', 'shard1', '1.1.1.1:8983_solr')
+        second_replica = plan.add_replica('collection', 'shard2', '1.1.1.2:8983_solr')
+        switch_traffic = plan.switch_traffic([first_replica, second_replica])
+        plan.delete_replica('collection', 'shard1', 'core_node1', '0.0.0.0:8983_solr', [switch_traffic])
+
+        self.assertEqual(3, plan.get_critical_path_length())
+        self.assertEqual('Plan for stack [test] version [green]: [2] ADDREPLICA, [1] DELETEREPLICA, [1] SWITCHTRAFFIC, '
+                         'critical path of [3] operations', plan.get_summary())
+
+    def test_should_return_zero_as_critical_path_length_of_empty_plan(self):
+        self.assertEqual(0, MigrationPlan(STACK_NAME, STACK_VERSION).get_critical_path_length())
+
+    def test_should_load_saved_plan(self):
+        plan = MigrationPlan(STACK_NAME, STACK_VERSION)
+        plan.switch_traffic([plan.add_replica('collection', 'shard1', '1.1.1.1:8983_solr')])
+        fd, file_name = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            plan.save(file_name)
+            loaded_plan = MigrationPlan.load(file_name)
+        finally:
+            os.remove(file_name)
+
+        self.assertEqual(STACK_NAME, loaded_plan.get_stack_name())
+        self.assertEqual(STACK_VERSION, loaded_plan.get_stack_version())
+        self.assertListEqual(plan.get_operations(), loaded_plan.get_operations())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import io
+import json
+
+from mock import patch
+from unittest import TestCase
+from solrcloud_cli.services.progress_reporter import ProgressReporter
+
+STACK_NAME = 'test'
+
+
+class TestProgressReporter(TestCase):
+
+    @patch('time.time')
+    def test_should_report_throughput_and_eta_since_first_event_of_phase(self, time_mock):
+        stream = io.StringIO()
+        reporter = ProgressReporter(stream)
+
+        time_mock.return_value = 100.0
+        reporter.report(STACK_NAME, 'add-new-nodes', 'replicas-active', 10, 110)
+        time_mock.return_value = 120.0
+        reporter.report(STACK_NAME, 'add-new-nodes', 'replicas-active', 50, 110)
+
+        events = list(map(json.loads, stream.getvalue().splitlines()))
+
+        self.assertEqual(2, len(events))
+        self.assertEqual({'time': 100.0, 'stack': STACK_NAME, 'phase': 'add-new-nodes', 'unit': 'replicas-active',
+                          'done': 10, 'total': 110, 'remaining': 100}, events[0])
+        self.assertEqual(50, events[1]['done'])
+        self.assertEqual(60, events[1]['remaining'])
+        self.assertEqual(2.0, events[1]['throughput'])
+        self.assertEqual(30.0, events[1]['eta_seconds'])
+
+    @patch('time.time')
+    def test_should_track_rates_per_stack_and_phase(self, time_mock):
+        stream = io.StringIO()
+        reporter = ProgressReporter(stream)
+
+        time_mock.return_value = 100.0
+        reporter.report(STACK_NAME, 'add-new-nodes', 'replicas-added', 0, 10)
+        time_mock.return_value = 110.0
+        reporter.report('other', 'add-new-nodes', 'replicas-added', 5, 10)
+
+        events = list(map(json.loads, stream.getvalue().splitlines()))
+
+        self.assertNotIn('throughput', events[1])
+        self.assertNotIn('eta_seconds', events[1])
+
+    @patch('time.time')
+    def test_should_track_rates_per_region_of_a_stack(self, time_mock):
+        stream = io.StringIO()
+        reporter = ProgressReporter(stream)
+
+        time_mock.return_value = 100.0
+        reporter.report(STACK_NAME, 'add-new-nodes', 'replicas-added', 0, 10, region='eu-central-1')
+        time_mock.return_value = 110.0
+        reporter.report(STACK_NAME, 'add-new-nodes', 'replicas-added', 5, 10, region='eu-west-1')
+        time_mock.return_value = 120.0
+        reporter.report(STACK_NAME, 'add-new-nodes', 'replicas-added', 4, 10, region='eu-central-1')
+
+        events = list(map(json.loads, stream.getvalue().splitlines()))
+
+        self.assertListEqual(['eu-central-1', 'eu-west-1', 'eu-central-1'], list(map(lambda x: x['region'], events)))
+        self.assertNotIn('throughput', events[1])
+        self.assertEqual(0.2, events[2]['throughput'])
+
+    def test_should_report_events_without_total(self):
+        stream = io.StringIO()
+        ProgressReporter(stream).report(STACK_NAME, 'create-stack', 'resources-created', 3)
+
+        event = json.loads(stream.getvalue())
+
+        self.assertEqual(3, event['done'])
+        self.assertNotIn('total', event)
+        self.assertNotIn('remaining', event)
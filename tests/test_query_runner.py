@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+
+from mock import MagicMock
+from unittest import TestCase
+from solrcloud_cli.services.query_runner import QueryResults, QueryRunner
+
+URLS = ['http://1.1.1.1:8983/solr/core1/select?q=a', 'http://1.1.1.1:8983/solr/core1/select?q=b']
+
+
+class TestQueryRunner(TestCase):
+
+    def test_should_send_every_query_once_without_duration(self):
+        send_mock = MagicMock()
+
+        results = QueryRunner(send_mock, concurrency=2).run(URLS)
+
+        self.assertEqual(2, results.get_number_of_queries())
+        self.assertEqual(0, results.get_number_of_errors())
+        self.assertEqual(sorted(URLS), sorted(map(lambda x: x[0][0], send_mock.call_args_list)))
+
+    def test_should_repeat_queries_until_duration_is_over(self):
+        send_mock = MagicMock()
+
+        results = QueryRunner(send_mock, concurrency=1).run(URLS, duration=0.05)
+
+        self.assertGreater(results.get_number_of_queries(), len(URLS))
+        self.assertGreaterEqual(results.get_duration(), 0.05)
+
+    def test_should_count_failed_queries(self):
+        send_mock = MagicMock(side_effect=[None, Exception('HTTP Error 500')])
+
+        results = QueryRunner(send_mock, concurrency=1).run(URLS)
+
+        self.assertEqual(1, results.get_number_of_queries())
+        self.assertEqual(1, results.get_number_of_errors())
+
+    def test_should_return_latency_percentiles_in_milliseconds(self):
+        results = QueryResults(list(map(lambda x: x / 1000, range(100, 0, -1))), 0, 2)
+
+        self.assertEqual(50, results.get_percentile(50))
+        self.assertEqual(95, results.get_percentile(95))
+        self.assertEqual(99, results.get_percentile(99))
+        self.assertEqual(50, results.get_throughput())
+        self.assertEqual(0, QueryResults([], 0, 0).get_percentile(99))
+
+    def test_should_load_queries_per_collection(self):
+        fd, file_name = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w') as query_file:
+                query_file.write('# Sample of production queries\n\nproducts q=shoes&rows=10\n'
+                                 'brands q=*:*\nproducts q=shirts&fq=brand:acme\n')
+
+            queries = QueryRunner.load_queries(file_name)
+
+            self.assertListEqual(['products', 'brands'], list(queries.keys()))
+            self.assertListEqual(['q=shoes&rows=10', 'q=shirts&fq=brand:acme'], queries['products'])
+        finally:
+            os.remove(file_name)
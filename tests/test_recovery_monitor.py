@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from mock import patch
+from unittest import TestCase
+from solrcloud_cli.services.recovery_monitor import RecoveryMonitor
+
+COLLECTION = 'products'
+NODE = '1.1.1.0'
+CORE = 'products_shard1_replica4'
+
+
+class TestRecoveryMonitor(TestCase):
+
+    @patch('time.time')
+    def test_should_compute_rate_and_eta_between_samples(self, time_mock):
+        monitor = RecoveryMonitor()
+
+        time_mock.return_value = 100.0
+        monitor.update(COLLECTION, NODE, CORE, (0, 1000))
+        time_mock.return_value = 110.0
+        status = monitor.update(COLLECTION, NODE, CORE, (200, 1000))
+
+        self.assertEqual(20.0, status.rate)
+        self.assertEqual(40.0, status.eta_seconds)
+        self.assertEqual(0, status.stalled_seconds)
+
+    @patch('time.time')
+    def test_should_sum_rates_per_node_and_collection(self, time_mock):
+        monitor = RecoveryMonitor()
+
+        time_mock.return_value = 100.0
+        monitor.update(COLLECTION, NODE, CORE, (0, 1000))
+        monitor.update(COLLECTION, '1.1.1.1', 'products_shard2_replica4', (0, 1000))
+        monitor.update('brands', NODE, 'brands_shard1_replica4', (0, 1000))
+        time_mock.return_value = 110.0
+        monitor.update(COLLECTION, NODE, CORE, (100, 1000))
+        monitor.update(COLLECTION, '1.1.1.1', 'products_shard2_replica4', (300, 1000))
+        monitor.update('brands', NODE, 'brands_shard1_replica4', (500, 1000))
+
+        self.assertDictEqual({NODE: 60.0, '1.1.1.1': 30.0}, dict(monitor.get_rates_by_node()))
+        self.assertDictEqual({COLLECTION: 40.0, 'brands': 50.0}, dict(monitor.get_rates_by_collection()))
+
+    @patch('time.time')
+    def test_should_flag_replicas_without_progress_after_stall_timeout(self, time_mock):
+        monitor = RecoveryMonitor(stall_timeout=60)
+
+        time_mock.return_value = 100.0
+        monitor.update(COLLECTION, NODE, CORE, (200, 1000))
+        time_mock.return_value = 150.0
+        monitor.update(COLLECTION, NODE, CORE, (200, 1000))
+        self.assertListEqual([], monitor.get_stalled_replicas())
+
+        time_mock.return_value = 170.0
+        status = monitor.update(COLLECTION, NODE, CORE, None)
+
+        self.assertEqual(70.0, status.stalled_seconds)
+        self.assertListEqual([status], monitor.get_stalled_replicas())
+
+    @patch('time.time')
+    def test_should_forget_replicas_that_are_no_longer_recovering(self, time_mock):
+        time_mock.return_value = 100.0
+        monitor = RecoveryMonitor()
+        monitor.update(COLLECTION, NODE, CORE, (0, 1000))
+        monitor.update(COLLECTION, NODE, 'products_shard2_replica4', (0, 1000))
+
+        monitor.retain([(NODE, CORE)])
+
+        self.assertListEqual([CORE], list(map(lambda x: x.core, monitor.get_status())))
+
+    def test_should_parse_replication_details(self):
+        self.assertEqual((1024, 4096), RecoveryMonitor.parse_replication_details({'details': {'slave': {
+            'isReplicating': 'true', 'bytesDownloaded': '1 KB', 'bytesDownloadedInBytes': 1024,
+            'bytesToDownload': '4 KB', 'bytesToDownloadInBytes': 4096}}}))
+        self.assertEqual((10, 20), RecoveryMonitor.parse_replication_details({'details': {'follower': {
+            'isReplicating': True, 'bytesDownloaded': '10', 'bytesToDownload': '20'}}}))
+        self.assertIsNone(RecoveryMonitor.parse_replication_details({'details': {'slave': {
+            'isReplicating': 'false'}}}))
+        self.assertIsNone(RecoveryMonitor.parse_replication_details({'details': {}}))
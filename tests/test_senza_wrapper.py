@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import asyncio
 import json
 import subprocess
 
-from mock import MagicMock
+from mock import MagicMock, patch
 from unittest import TestCase
 from solrcloud_cli.services.senza_wrapper import SenzaWrapper
 
@@ -13,6 +14,38 @@ ALL_TRAFFIC = 100.0
 TEST_CONFIG = 'test.yaml'
 
 
+class FakeProcess:
+
+    def __init__(self, output=None, returncode=0):
+        self.output = output
+        self.returncode = returncode
+
+    async def communicate(self):
+        return self.output, None
+
+    async def wait(self):
+        return self.returncode
+
+
+def fake_subprocess_exec(*processes):
+    calls = list()
+    remaining_processes = list(processes)
+
+    async def create_subprocess_exec(*args, **kwargs):
+        calls.append(list(args))
+        return remaining_processes.pop(0)
+
+    return create_subprocess_exec, calls
+
+
+def run_async(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
 class TestSenzaWrapper(TestCase):
 
     __senza_wrapper = None
@@ -41,6 +74,31 @@ class TestSenzaWrapper(TestCase):
         list_mock.assert_called_with(['senza', 'list', '--region', 'eu-west-1', '--output', 'json', 'test', 'test'])
         self.assertEquals(2, len(list_mock.call_args_list), 'Unexpected number of senza list calls')
 
+    def test_should_not_wait_for_deletion_of_stack_version_if_not_requested(self):
+        delete_mock = MagicMock(return_value=0)
+        list_mock = MagicMock()
+
+        subprocess.call = delete_mock
+        subprocess.check_output = list_mock
+
+        self.__senza_wrapper.delete_stack_version('test', 'test', wait=False)
+
+        delete_mock.assert_called_once_with(['senza', 'delete', '--region', 'eu-west-1', 'test', 'test'])
+        list_mock.assert_not_called()
+
+    def test_should_return_stack_versions_in_deletion(self):
+        stack_versions = [
+            {'stack_name': 'test', 'version': 'blue', 'status': 'CREATE_COMPLETE'},
+            {'stack_name': 'test', 'version': 'green', 'status': 'DELETE_IN_PROGRESS'}
+        ]
+        list_mock = MagicMock(return_value=bytes(json.dumps(stack_versions), encoding='utf-8'))
+        subprocess.check_output = list_mock
+
+        result = self.__senza_wrapper.get_stack_versions_in_deletion('test')
+
+        self.assertListEqual([stack_versions[1]], result, 'Unexpected stack versions in deletion')
+        list_mock.assert_called_once_with(['senza', 'list', '--region', 'eu-west-1', '--output', 'json', 'test'])
+
     def test_should_return_all_instances_of_one_stack_version(self):
         instances = [
             {'stack_name': 'test-stack', 'stack_version': 'test-version', 'private_ip': '0.0.0.0'},
@@ -542,3 +600,92 @@ class TestSenzaWrapper(TestCase):
         events_mock.assert_called_once_with([
             'senza', 'events', '--region', 'eu-west-1', '--output', 'json', stack_name, stack_version
         ])
+
+    def test_should_return_all_instances_of_one_stack_version_asynchronously(self):
+        instances = [
+            {'stack_name': 'test-stack', 'stack_version': 'test-version', 'private_ip': '0.0.0.0'},
+            {'stack_name': 'test-stack', 'stack_version': 'test-version', 'private_ip': '1.1.1.1'}
+        ]
+        exec_mock, calls = fake_subprocess_exec(FakeProcess(bytes(json.dumps(instances), encoding='utf-8')))
+
+        with patch('asyncio.create_subprocess_exec', exec_mock):
+            result = run_async(self.__senza_wrapper.get_stack_instances_async('test-stack', 'test-version'))
+
+        self.assertListEqual(['0.0.0.0', '1.1.1.1'], result, "Getting stack instances failed.")
+        self.assertListEqual([
+            ['senza', 'instances', '--region', 'eu-west-1', '--output', 'json', 'test-stack', 'test-version']
+        ], calls)
+
+    def test_should_return_active_and_passive_stack_version_asynchronously(self):
+        stack_versions = [
+            {'identifier': 'test-passive', 'stack_name': 'test', 'version': 'passive', 'weight%': NO_TRAFFIC},
+            {'identifier': 'test-active', 'stack_name': 'test', 'version': 'active', 'weight%': ALL_TRAFFIC}
+        ]
+        output = bytes(json.dumps(stack_versions), encoding='utf-8')
+        exec_mock, calls = fake_subprocess_exec(FakeProcess(output), FakeProcess(output))
+
+        with patch('asyncio.create_subprocess_exec', exec_mock):
+            active_version = run_async(self.__senza_wrapper.get_active_stack_version_async('test'))
+            passive_version = run_async(self.__senza_wrapper.get_passive_stack_version_async('test'))
+
+        self.assertEquals('active', active_version, 'Result is not the active stack version')
+        self.assertEquals('passive', passive_version, 'Result is not the passive stack version')
+        self.assertEquals(2, len(calls), 'Unexpected number of senza traffic calls')
+
+    def test_should_raise_exception_if_asynchronous_senza_execution_returns_error_code(self):
+        exec_mock, calls = fake_subprocess_exec(FakeProcess(returncode=2))
+
+        with patch('asyncio.create_subprocess_exec', exec_mock):
+            with self.assertRaises(subprocess.CalledProcessError):
+                run_async(self.__senza_wrapper.switch_traffic_async('test', 'unknown', int(ALL_TRAFFIC)))
+
+        self.assertListEqual([
+            ['senza', 'traffic', '--region', 'eu-west-1', '--output', 'json', 'test', 'unknown',
+             str(int(ALL_TRAFFIC))]
+        ], calls)
+
+    def test_should_create_new_stack_version_asynchronously(self):
+        stack_name = 'test-stack'
+        stack_version = 'test-version'
+        image_version = '0.0.0'
+        events = [
+            {
+                'stack_name': stack_name,
+                'version': stack_version,
+                'resource_type': 'CloudFormation::Stack',
+                'event_time': '0',
+                'ResourceStatus': 'CREATE_COMPLETE'
+            }
+        ]
+        exec_mock, calls = fake_subprocess_exec(FakeProcess(returncode=0),
+                                                FakeProcess(bytes(json.dumps(events), encoding='utf-8')))
+
+        with patch('asyncio.create_subprocess_exec', exec_mock):
+            run_async(self.__senza_wrapper.create_stack_async(stack_name, stack_version, image_version))
+
+        self.assertListEqual([
+            ['senza', 'create', '--region', 'eu-west-1', '--disable-rollback', TEST_CONFIG, stack_version,
+             'ImageVersion=' + image_version],
+            ['senza', 'events', '--region', 'eu-west-1', '--output', 'json', stack_name, stack_version]
+        ], calls)
+
+    def test_should_raise_exception_if_asynchronous_senza_execution_failed_on_creating_a_new_stack_version(self):
+        exec_mock, calls = fake_subprocess_exec(FakeProcess(returncode=1))
+
+        with patch('asyncio.create_subprocess_exec', exec_mock):
+            with self.assertRaisesRegex(Exception, r'Failed to create new cluster with error code \[1\]'):
+                run_async(self.__senza_wrapper.create_stack_async('test-stack', 'test-version', '0.0.0'))
+
+    def test_should_return_success_when_deleting_stack_version_asynchronously_with_one_retry(self):
+        exec_mock, calls = fake_subprocess_exec(FakeProcess(returncode=0),
+                                                FakeProcess(bytes(json.dumps({'output': 'test'}), encoding='utf-8')),
+                                                FakeProcess(None))
+
+        with patch('asyncio.create_subprocess_exec', exec_mock):
+            run_async(self.__senza_wrapper.delete_stack_version_async('test', 'test'))
+
+        self.assertListEqual([
+            ['senza', 'delete', '--region', 'eu-west-1', 'test', 'test'],
+            ['senza', 'list', '--region', 'eu-west-1', '--output', 'json', 'test', 'test'],
+            ['senza', 'list', '--region', 'eu-west-1', '--output', 'json', 'test', 'test']
+        ], calls)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import urllib.request
+
+from mock import MagicMock, patch
+from unittest import TestCase
+
+from solrcloud_cli.controllers.cluster_delete_controller import ClusterDeleteController
+from solrcloud_cli.services.metrics import Metrics, SUBMISSION_DELAY
+from solrcloud_cli.services.submission_throttle import SubmissionThrottle
+
+BASE_URL = 'http://example.org/solr'
+API_URL = BASE_URL + '/admin/collections'
+STACK_NAME = 'test'
+
+
+class TestSubmissionThrottle(TestCase):
+
+    def test_should_double_delay_while_queue_is_above_target(self):
+        throttle = SubmissionThrottle(target_queue_size=20, max_delay=0.5)
+
+        self.assertEqual(0.1, throttle.update(30))
+        self.assertEqual(0.2, throttle.update(30))
+        self.assertEqual(0.4, throttle.update(21))
+        self.assertEqual(0.5, throttle.update(100))
+
+    def test_should_keep_delay_near_target_and_halve_it_below_half_of_target(self):
+        throttle = SubmissionThrottle(target_queue_size=20)
+        throttle.update(30)
+        throttle.update(30)
+
+        self.assertEqual(0.2, throttle.update(15))
+        self.assertEqual(0.1, throttle.update(5))
+        self.assertEqual(0, throttle.update(5))
+
+    def test_should_sum_sizes_of_overseer_queues(self):
+        self.assertEqual(12, SubmissionThrottle.get_queue_size({
+            'overseer_queue_size': 2, 'overseer_work_queue_size': 0, 'overseer_collection_queue_size': 10,
+            'overseer_operations': []}))
+
+    @patch('time.sleep')
+    @patch('time.time')
+    def test_should_sample_queue_size_once_per_interval(self, time_mock, sleep_mock):
+        throttle = SubmissionThrottle(target_queue_size=20, sample_interval=5)
+        get_queue_size = MagicMock(return_value=50)
+
+        time_mock.return_value = 100.0
+        self.assertEqual(0.1, throttle.wait(get_queue_size))
+        time_mock.return_value = 104.0
+        self.assertEqual(0.1, throttle.wait(get_queue_size))
+        time_mock.return_value = 105.0
+        self.assertEqual(0.2, throttle.wait(get_queue_size))
+
+        self.assertEqual(2, get_queue_size.call_count)
+        self.assertListEqual([0.1, 0.1, 0.2], list(map(lambda x: x[0][0], sleep_mock.call_args_list)))
+
+    @patch('time.sleep')
+    def test_should_delay_collection_operations_but_not_cluster_state_requests(self, sleep_mock):
+        response_mock = MagicMock()
+        response_mock.getcode.return_value = 200
+        response_mock.read.return_value = json.dumps({'overseer_collection_queue_size': 40}).encode('utf-8')
+        urlopen_mock = urllib.request.urlopen = MagicMock(return_value=response_mock)
+        metrics = Metrics()
+        controller = ClusterDeleteController(base_url=BASE_URL, stack_name=STACK_NAME, oauth_token='token',
+                                             senza_wrapper=MagicMock())
+        controller.set_submission_throttle(SubmissionThrottle(target_queue_size=20))
+        controller.set_metrics(metrics)
+
+        controller.get_cluster_state()
+        controller.delete_collection_in_cluster('first')
+
+        self.assertListEqual([
+            API_URL + '?action=CLUSTERSTATUS&wt=json',
+            API_URL + '?action=OVERSEERSTATUS&wt=json',
+            API_URL + '?action=DELETE&name=first'
+        ], list(map(lambda x: x[0][0].get_full_url(), urlopen_mock.call_args_list)))
+        sleep_mock.assert_called_once_with(0.1)
+        self.assertEqual(1, metrics.get_histogram(SUBMISSION_DELAY, {'action': 'DELETE'})['count'])
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import tempfile
+import urllib.error
+import urllib.request
+
+from mock import MagicMock, patch
+from unittest import TestCase
+
+from solrcloud_cli.controllers.cluster_delete_controller import ClusterDeleteController
+from solrcloud_cli.services.tracer import Tracer
+
+BASE_URL = 'http://example.org/solr/'
+STACK_NAME = 'test'
+
+
+class TestTracer(TestCase):
+
+    def test_should_record_spans_as_complete_events_with_attributes(self):
+        tracer = Tracer()
+        with tracer.span('add-new-nodes', 'phase', {'stack': STACK_NAME}) as span:
+            span.set_attribute('replicas', 3)
+
+        spans = list(filter(lambda x: x['ph'] == 'X', tracer.get_events()))
+
+        self.assertEqual(1, len(spans))
+        self.assertEqual('add-new-nodes', spans[0]['name'])
+        self.assertEqual('phase', spans[0]['cat'])
+        self.assertEqual({'stack': STACK_NAME, 'replicas': 3}, spans[0]['args'])
+        self.assertGreaterEqual(spans[0]['dur'], 0)
+
+    def test_should_record_error_of_failed_span(self):
+        tracer = Tracer()
+        with self.assertRaises(Exception):
+            with tracer.span('switch', 'phase'):
+                raise Exception('Traffic weight did not change')
+
+        span = list(filter(lambda x: x['ph'] == 'X', tracer.get_events()))[0]
+
+        self.assertEqual('Traffic weight did not change', span['args']['error'])
+
+    def test_should_nest_requests_in_span_of_phase(self):
+        response_mock = MagicMock()
+        response_mock.getcode.return_value = 200
+        urllib.request.urlopen = MagicMock(side_effect=[
+            response_mock,
+            urllib.error.HTTPError(url=None, code=504, msg=None, hdrs=None, fp=None)
+        ])
+        tracer = Tracer()
+        controller = ClusterDeleteController(base_url=BASE_URL, stack_name=STACK_NAME, oauth_token='token',
+                                             senza_wrapper=MagicMock())
+        controller.set_tracer(tracer)
+
+        with controller._phase('delete-collections'):
+            controller.delete_collection_in_cluster('first')
+            controller.delete_collection_in_cluster('second')
+
+        spans = list(filter(lambda x: x['ph'] == 'X', tracer.get_events()))
+        phase = spans[-1]
+        requests = spans[:-1]
+
+        self.assertEqual('delete-collections', phase['name'])
+        self.assertListEqual([{'action': 'DELETE', 'name': 'first', 'status': '200'},
+                              {'action': 'DELETE', 'name': 'second', 'status': '504',
+                               'error': 'HTTP Error 504: None'}],
+                             list(map(lambda x: x['args'], requests)))
+        for request in requests:
+            self.assertEqual('solr', request['cat'])
+            self.assertGreaterEqual(request['ts'], phase['ts'])
+            self.assertLessEqual(request['ts'] + request['dur'], phase['ts'] + phase['dur'])
+
+    @patch('time.time')
+    def test_should_record_counter_values(self, time_mock):
+        time_mock.return_value = 1.5
+        tracer = Tracer()
+        tracer.counter('concurrency_limit', {'limit': 3, 'in_flight': 2})
+
+        event = tracer.get_events()[0]
+
+        self.assertEqual('C', event['ph'])
+        self.assertEqual(1500000, event['ts'])
+        self.assertEqual({'limit': 3, 'in_flight': 2}, event['args'])
+
+    def test_should_save_trace_event_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            file_name = os.path.join(directory, 'trace.json')
+            tracer = Tracer()
+            with tracer.span('deploy', 'command'):
+                pass
+
+            tracer.save(file_name)
+
+            with open(file_name, 'r') as fd:
+                trace = json.load(fd)
+            self.assertEqual(['thread_name', 'deploy'], list(map(lambda x: x['name'], trace['traceEvents'])))
+            self.assertEqual('M', trace['traceEvents'][0]['ph'])
+        finally:
+            shutil.rmtree(directory)